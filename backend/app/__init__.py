@@ -1,22 +1,35 @@
 import os
 import logging
-from flask import Flask, jsonify, send_from_directory
+import redis
+from flask import Flask, jsonify, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from flask_cors import CORS
+from app.utils.json_provider import FastJSONProvider
+from app.utils.compression import init_compression
+from app.utils.static_manifest import StaticManifest
 
 # --- Flask Extensions ---
 db = SQLAlchemy()
 jwt = JWTManager()
 migrate = Migrate()
 
+# --- Redis (optional: caching is skipped when REDIS_URL is not set) ---
+redis_client = redis.from_url(os.environ['REDIS_URL']) if os.getenv('REDIS_URL') else None
+
 
 def create_app():
     # Resolve frontend folder relative to this file
     frontend_folder = os.path.join(os.path.dirname(__file__), '../frontend')
 
-    app = Flask(__name__, static_folder=frontend_folder, static_url_path='/')
+    # Frontend files are served from the in-memory manifest below
+    app = Flask(__name__, static_folder=None)
+    app.json = FastJSONProvider(app)
+
+    # --- Settings from app/config.py (FLASK_CONFIG picks the class) ---
+    from app.config import config
+    app.config.from_object(config[os.getenv('FLASK_CONFIG', 'default')])
 
     # --- Minimal configurations ---
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///db.sqlite3')
@@ -29,30 +42,39 @@ def create_app():
     migrate.init_app(app, db)
     CORS(app)
 
+    # --- Token revocation (token_version claim) ---
+    from app.utils.security import register_token_checks
+    register_token_checks(jwt)
+
+    # --- Response compression (no nginx in front of gunicorn on Render) ---
+    init_compression(app)
+
+    # --- CLI commands ---
+    from app.commands import register_commands
+    register_commands(app)
+
+    # --- Static manifest (frontend files held in memory) ---
+    manifest = StaticManifest(frontend_folder)
+
     # --- Favicon route ---
     @app.route('/favicon.ico')
     def favicon():
-        return send_from_directory(frontend_folder, 'favicon.ico')
+        asset = manifest.get('favicon.ico')
+        if asset is None:
+            abort(404)
+        return manifest.response(asset)
 
     # --- SPA route ---
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve_frontend(path):
-        # Protect favicon route
-        if path == 'favicon.ico':
-            return favicon()
-
-        requested_file = os.path.join(frontend_folder, path)
-        index_file = os.path.join(frontend_folder, 'index.html')
-
-        # Serve file if it exists, else fallback to index.html
-        if os.path.exists(requested_file) and not os.path.isdir(requested_file):
-            return send_from_directory(frontend_folder, path)
-        elif os.path.exists(index_file):
-            return send_from_directory(frontend_folder, 'index.html')
-        else:
-            # No frontend found, show API running message
-            return jsonify({"message": "Fixmore Mall API is running ✅"}), 200
+        # Serve file if it is in the manifest, else fallback to index.html
+        asset = manifest.get(path) or manifest.get('index.html')
+        if asset is not None:
+            return manifest.response(asset)
+
+        # No frontend found, show API running message
+        return jsonify({"message": "Fixmore Mall API is running ✅"}), 200
 
     # --- Health check ---
     @app.route('/health')
@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+import click
+from app import db
+from app.models import Category, Product
+from app.services.search_service import SearchService
+from app.services.import_service import ProductImportService
+from app.services.recommendation_service import RecommendationService, DEFAULT_TOP_K
+from app.services.cart_store import get_cart_store
+from app.services.inventory_service import InventoryService
+from app.services.flash_sale_service import FlashSaleService
+from app.services.job_queue import JobQueue
+from app.utils.ids import migrate_id_columns
+from app.utils.idempotency import purge_expired_keys
+
+
+def register_commands(app):
+    @app.cli.command('search-index')
+    @click.option('--rebuild', is_flag=True, help='Repopulate the index from the products table.')
+    def search_index(rebuild):
+        """Create (or rebuild) the product full-text search index."""
+        SearchService.build_index(rebuild=rebuild)
+        click.echo('Product search index is ready')
+
+    @app.cli.command('recount-categories')
+    def recount_categories():
+        """Recompute the denormalized category product counters."""
+        Category.refresh_product_counts()
+        db.session.commit()
+        click.echo('Category product counts refreshed')
+
+    @app.cli.command('recount-ratings')
+    def recount_ratings():
+        """Recompute the denormalized product review aggregates."""
+        Product.refresh_rating_summaries()
+        db.session.commit()
+        click.echo('Product rating summaries refreshed')
+
+    @app.cli.command('import-products')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+    @click.option('--chunk-size', default=1000, show_default=True, type=click.IntRange(min=1))
+    def import_products(path, fmt, chunk_size):
+        """Upsert products by SKU from a CSV or JSON lines file."""
+        fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        with open(path, 'rb') as stream:
+            report = ProductImportService.import_rows(
+                ProductImportService.read_rows(stream, fmt), chunk_size=chunk_size
+            )
+        click.echo(json.dumps(report, indent=2))
+
+    @app.cli.command('build-recommendations')
+    @click.option('--full', is_flag=True, help='Recount every paid order instead of only new ones.')
+    @click.option('--top-k', default=DEFAULT_TOP_K, show_default=True)
+    @click.option('--min-count', default=1, show_default=True, help='Minimum co-purchases for a pair.')
+    def build_recommendations(full, top_k, min_count):
+        """Update the "frequently bought together" table from paid orders."""
+        report = RecommendationService.build(full=full, top_k=top_k, min_count=min_count)
+        click.echo(json.dumps(report, indent=2))
+
+    @app.cli.command('flush-carts')
+    def flush_carts():
+        """Write every dirty hot-tier cart back to cart_items."""
+        get_cart_store().flush_all()
+        click.echo('Dirty carts flushed')
+
+    @app.cli.command('release-reservations')
+    @click.option('--batch-size', default=500, show_default=True)
+    def release_reservations(batch_size):
+        """Return the stock of expired checkout holds and cancel their unpaid orders."""
+        released = InventoryService.release_all_expired(batch_size)
+        click.echo(f'Released {released} expired reservations')
+
+    @app.cli.command('reconcile-flash-sales')
+    def reconcile_flash_sales():
+        """Apply flash-sale units sold since the last run to Product.quantity."""
+        sold = FlashSaleService.reconcile()
+        click.echo(f'Reconciled {sum(sold.values())} units across {len(sold)} products')
+
+    @app.cli.command('migrate-ids')
+    def migrate_ids():
+        """Convert id columns stored as 36-character strings to native UUID / 16-byte storage."""
+        converted = migrate_id_columns(db.engine, db.metadata)
+        click.echo(json.dumps(converted, indent=2) if converted else 'Id columns are up to date')
+
+    @app.cli.command('job-stats')
+    def job_stats():
+        """Print per-job counts by status, attempts and run times."""
+        click.echo(json.dumps(JobQueue.stats(), indent=2))
+
+    @app.cli.command('purge-jobs')
+    @click.option('--days', default=7, show_default=True)
+    def purge_jobs(days):
+        """Delete succeeded background jobs older than --days."""
+        click.echo(f'Deleted {JobQueue.purge(timedelta(days=days))} finished jobs')
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys():
+        """Delete stored Idempotency-Key responses past their expiry."""
+        click.echo(f'Deleted {purge_expired_keys()} expired idempotency keys')
@@ -6,6 +6,7 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    TOKEN_VERSION_CACHE_TTL = int(os.environ.get('TOKEN_VERSION_CACHE_TTL', 30))  # without Redis
     
     # Database - Flexible configuration
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///fixmore_mall.db')
@@ -13,6 +14,8 @@ class Config:
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace("postgres://", "postgresql://", 1)
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # New primary keys: 'uuid7' (time-ordered) or 'uuid4' (random)
+    ID_STRATEGY = os.environ.get('ID_STRATEGY', 'uuid7')
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_recycle': 300,
         'pool_pre_ping': True
@@ -27,6 +30,7 @@ class Config:
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')  # default: MAIL_USERNAME
     
     # Payment Gateways
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
@@ -41,6 +45,47 @@ class Config:
     
     # Redis for caching and sessions
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+    FACET_INDEX_TTL = int(os.environ.get('FACET_INDEX_TTL', 300))
+    SUGGEST_INDEX_TTL = int(os.environ.get('SUGGEST_INDEX_TTL', 300))
+    COPURCHASE_MATRIX_PATH = os.environ.get('COPURCHASE_MATRIX_PATH')  # default: instance/copurchase.npz
+    CATALOG_VERSION_CHECK_INTERVAL = int(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 5))
+    CATALOG_CACHE_CONTROL = os.environ.get('CATALOG_CACHE_CONTROL', 'public, max-age=60, stale-while-revalidate=300')
+    
+    # Checkout stock holds, released by the worker every RESERVATION_SWEEP_INTERVAL
+    # seconds once expired (or by `flask release-reservations`)
+    RESERVATION_TTL = int(os.environ.get('RESERVATION_TTL', 15 * 60))
+    RESERVATION_SWEEP_INTERVAL = int(os.environ.get('RESERVATION_SWEEP_INTERVAL', 60))
+    
+    # Flash-sale stock counters: 'redis' or 'memory' (single worker only)
+    FLASH_SALE_STORE = os.environ.get('FLASH_SALE_STORE')  # default: redis when REDIS_URL is set
+    # Seconds between worker runs that apply units sold on the counters to Product.quantity
+    FLASH_SALE_RECONCILE_INTERVAL = int(os.environ.get('FLASH_SALE_RECONCILE_INTERVAL', 30))
+    
+    # Order status streams (GET /orders/<id>/events)
+    SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+    SSE_MAX_DURATION = int(os.environ.get('SSE_MAX_DURATION', 300))
+    SSE_RETRY = int(os.environ.get('SSE_RETRY', 3000))  # ms before EventSource reconnects
+    SSE_TOKEN_TTL = int(os.environ.get('SSE_TOKEN_TTL', 3600))  # ?token= from POST /orders/<id>/events/token
+    
+    # Idempotency-Key responses (orders, payments): kept for IDEMPOTENCY_TTL;
+    # duplicates wait up to IDEMPOTENCY_WAIT seconds for the first request
+    IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+    IDEMPOTENCY_WAIT = int(os.environ.get('IDEMPOTENCY_WAIT', 30))
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 300))
+    
+    # Background jobs (worker.py): retries back off from JOB_RETRY_BASE seconds
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 10))
+    JOB_RETRY_BASE = int(os.environ.get('JOB_RETRY_BASE', 30))
+    JOB_RETRY_MAX = int(os.environ.get('JOB_RETRY_MAX', 3600))
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))  # running jobs older than this are retried
+    
+    # Hot cart tier: 'redis', 'memory' (single worker only) or 'database'
+    CART_STORE = os.environ.get('CART_STORE')  # default: redis when REDIS_URL is set
+    CART_TTL = int(os.environ.get('CART_TTL', 7 * 24 * 3600))
+    CART_FLUSH_INTERVAL = int(os.environ.get('CART_FLUSH_INTERVAL', 2))
+    CART_FLUSH_BATCH = int(os.environ.get('CART_FLUSH_BATCH', 200))
     
     # Application
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
@@ -1,15 +1,16 @@
 from app import db
 from datetime import datetime
-import uuid
+from sqlalchemy import event, func, inspect, select, update
+from app.utils.ids import GUID, generate_id
 import json
 
 def generate_uuid():
-    return str(uuid.uuid4())
+    return generate_id()
 
 class BaseModel(db.Model):
     __abstract__ = True
     
-    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    id = db.Column(GUID, primary_key=True, default=generate_uuid)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -28,6 +29,8 @@ class User(BaseModel):
     is_admin = db.Column(db.Boolean, default=False)
     email_verified = db.Column(db.Boolean, default=False)
     last_login = db.Column(db.DateTime)
+    # Bumped to revoke every token issued before (admin demotion, deactivation)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     carts = db.relationship('Cart', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -37,7 +40,7 @@ class User(BaseModel):
 class Address(BaseModel):
     __tablename__ = 'addresses'
     
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     label = db.Column(db.String(50))  # Home, Work, etc.
     recipient_name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
@@ -57,9 +60,27 @@ class Category(BaseModel):
     image_url = db.Column(db.String(255))
     is_active = db.Column(db.Boolean, default=True)
     sort_order = db.Column(db.Integer, default=0)
+    # Denormalized counters, maintained by the Product mapper events below
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    active_product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     products = db.relationship('Product', backref='category', lazy=True)
+    
+    @classmethod
+    def refresh_product_counts(cls, category_ids=None):
+        """Recompute the product counters from the products table."""
+        total = select(func.count(Product.id)).where(
+            Product.category_id == cls.id
+        ).scalar_subquery()
+        active = select(func.count(Product.id)).where(
+            Product.category_id == cls.id, Product.is_active == True
+        ).scalar_subquery()
+        
+        stmt = update(cls).values(product_count=total, active_product_count=active)
+        if category_ids is not None:
+            stmt = stmt.where(cls.id.in_(category_ids))
+        db.session.execute(stmt, execution_options={'synchronize_session': False})
 
 class Product(BaseModel):
     __tablename__ = 'products'
@@ -74,38 +95,81 @@ class Product(BaseModel):
     barcode = db.Column(db.String(100))
     quantity = db.Column(db.Integer, default=0)
     low_stock_threshold = db.Column(db.Integer, default=5)
-    category_id = db.Column(db.String(36), db.ForeignKey('categories.id'))
+    category_id = db.column_property(
+        db.Column(GUID, db.ForeignKey('categories.id')), active_history=True
+    )
     brand = db.Column(db.String(100))
     is_featured = db.Column(db.Boolean, default=False)
-    is_active = db.Column(db.Boolean, default=True)
+    is_active = db.column_property(db.Column(db.Boolean, default=True), active_history=True)
+    # Checkout admission through atomic stock counters (FlashSaleService)
+    flash_sale = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     tags = db.Column(db.JSON)
     images = db.Column(db.JSON)
     specifications = db.Column(db.JSON)
     weight = db.Column(db.Numeric(8, 2))  # in grams
     dimensions = db.Column(db.JSON)  # {length, width, height}
+    # Approved review aggregates, maintained by the Review mapper events below
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     reviews = db.relationship('Review', backref='product', lazy=True)
+    
+    @property
+    def rating_summary(self):
+        count = self.rating_count or 0
+        return {
+            'average_rating': round((self.rating_sum or 0) / count, 1) if count else 0.0,
+            'total_reviews': count,
+            'rating_distribution': {
+                str(rating): getattr(self, f'rating_{rating}_count') or 0 for rating in range(1, 6)
+            }
+        }
+    
+    @classmethod
+    def refresh_rating_summaries(cls, product_ids=None):
+        """Recompute the review aggregates from the approved reviews."""
+        def aggregate(expression, *criteria):
+            return select(expression).where(
+                Review.product_id == cls.id, Review.is_approved == True, *criteria
+            ).scalar_subquery()
+        
+        values = {
+            'rating_count': aggregate(func.count(Review.id)),
+            'rating_sum': aggregate(func.coalesce(func.sum(Review.rating), 0)),
+        }
+        for rating in range(1, 6):
+            values[f'rating_{rating}_count'] = aggregate(func.count(Review.id), Review.rating == rating)
+        
+        stmt = update(cls).values(**values)
+        if product_ids is not None:
+            stmt = stmt.where(cls.id.in_(product_ids))
+        db.session.execute(stmt, execution_options={'synchronize_session': False})
 
 class Review(BaseModel):
     __tablename__ = 'reviews'
     
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-    rating = db.Column(db.Integer, nullable=False)  # 1-5
+    product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
+    rating = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)  # 1-5
     title = db.Column(db.String(200))
     comment = db.Column(db.Text)
     is_verified = db.Column(db.Boolean, default=False)
-    is_approved = db.Column(db.Boolean, default=True)
+    is_approved = db.column_property(db.Column(db.Boolean, default=True), active_history=True)
     
     user = db.relationship('User', backref='reviews', lazy=True)
 
 class Cart(BaseModel):
     __tablename__ = 'carts'
     
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     session_id = db.Column(db.String(100))
     
     # Relationships
@@ -114,8 +178,8 @@ class Cart(BaseModel):
 class CartItem(BaseModel):
     __tablename__ = 'cart_items'
     
-    cart_id = db.Column(db.String(36), db.ForeignKey('carts.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    cart_id = db.Column(GUID, db.ForeignKey('carts.id'), nullable=False)
+    product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     price = db.Column(db.Numeric(10, 2), nullable=False)
 
@@ -123,7 +187,7 @@ class Order(BaseModel):
     __tablename__ = 'orders'
     
     order_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
     status = db.Column(db.String(50), default='pending')  # pending, confirmed, processing, shipped, delivered, cancelled
     subtotal = db.Column(db.Numeric(10, 2), nullable=False)
     tax_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
@@ -148,8 +212,8 @@ class Order(BaseModel):
 class OrderItem(BaseModel):
     __tablename__ = 'order_items'
     
-    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    order_id = db.Column(GUID, db.ForeignKey('orders.id'), nullable=False)
+    product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
     product_name = db.Column(db.String(255), nullable=False)
     product_price = db.Column(db.Numeric(10, 2), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
@@ -158,7 +222,7 @@ class OrderItem(BaseModel):
 class Payment(BaseModel):
     __tablename__ = 'payments'
     
-    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(GUID, db.ForeignKey('orders.id'), nullable=False)
     payment_method = db.Column(db.String(50), nullable=False)
     amount = db.Column(db.Numeric(10, 2), nullable=False)
     currency = db.Column(db.String(3), default='KES')
@@ -170,10 +234,159 @@ class Payment(BaseModel):
 class Inventory(BaseModel):
     __tablename__ = 'inventory'
     
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
     change_quantity = db.Column(db.Integer, nullable=False)  # Positive for addition, negative for deduction
     new_quantity = db.Column(db.Integer, nullable=False)
     reason = db.Column(db.String(100))  # purchase, return, adjustment, etc.
     reference_id = db.Column(db.String(36))  # order_id, etc.
     
-    product = db.relationship('Product', backref='inventory_changes', lazy=True)
\ No newline at end of file
+    product = db.relationship('Product', backref='inventory_changes', lazy=True)
+
+class StockReservation(BaseModel):
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.UniqueConstraint('order_id', 'product_id'),
+        db.Index('ix_stock_reservations_status_expires', 'status', 'expires_at'),
+    )
+    
+    # Stock held for an unpaid order: taken off Product.quantity at checkout,
+    # committed on payment, or given back by the sweeper once expires_at passes
+    order_id = db.Column(GUID, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='held')  # held, committed, released
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class ProductRelation(BaseModel):
+    __tablename__ = 'product_relations'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'related_product_id'),
+        db.Index('ix_product_relations_product_score', 'product_id', 'score'),
+    )
+    
+    # Precomputed "frequently bought together" neighbours
+    product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
+    related_product_id = db.Column(GUID, db.ForeignKey('products.id'), nullable=False)
+    co_purchase_count = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    
+    related_product = db.relationship('Product', foreign_keys=[related_product_id], lazy=True)
+
+class CatalogVersion(BaseModel):
+    __tablename__ = 'catalog_versions'
+    
+    # Single row (id 'catalog') bumped by admin catalog writes; used as the
+    # validator for cached catalog responses and in-memory catalog indexes
+    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Job(BaseModel):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    # Background work enqueued in the request's transaction and run by worker.py
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    unique_key = db.Column(db.String(200), unique=True)  # at most one job per key
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)  # seconds, last attempt
+    last_error = db.Column(db.Text)
+
+class IdempotencyKey(BaseModel):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key'),
+    )
+    
+    # Outcome of a request sent with an Idempotency-Key header, replayed to
+    # retries of the same request until expires_at
+    user_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    locked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_type = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# --- Category product counters ---
+def _adjust_category_counts(connection, category_id, total, active):
+    if not category_id or not (total or active):
+        return
+    categories = Category.__table__
+    connection.execute(
+        categories.update().where(categories.c.id == category_id).values(
+            product_count=categories.c.product_count + total,
+            active_product_count=categories.c.active_product_count + active
+        )
+    )
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, product):
+    _adjust_category_counts(connection, product.category_id, 1, 1 if product.is_active else 0)
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, product):
+    state = inspect(product)
+    category_history = state.attrs.category_id.history
+    active_history = state.attrs.is_active.history
+    if not category_history.has_changes() and not active_history.has_changes():
+        return
+    
+    old_category_id = category_history.deleted[0] if category_history.deleted else product.category_id
+    was_active = active_history.deleted[0] if active_history.deleted else product.is_active
+    
+    _adjust_category_counts(connection, old_category_id, -1, -1 if was_active else 0)
+    _adjust_category_counts(connection, product.category_id, 1, 1 if product.is_active else 0)
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, product):
+    _adjust_category_counts(connection, product.category_id, -1, -1 if product.is_active else 0)
+
+def _adjust_rating_summary(connection, product_id, rating, delta):
+    if not product_id or rating not in range(1, 6):
+        return
+    products = Product.__table__
+    counter = products.c[f'rating_{rating}_count']
+    connection.execute(
+        products.update().where(products.c.id == product_id).values({
+            products.c.rating_count: products.c.rating_count + delta,
+            products.c.rating_sum: products.c.rating_sum + delta * rating,
+            counter: counter + delta
+        })
+    )
+
+@event.listens_for(Review, 'after_insert')
+def _review_inserted(mapper, connection, review):
+    if review.is_approved:
+        _adjust_rating_summary(connection, review.product_id, review.rating, 1)
+
+@event.listens_for(Review, 'after_update')
+def _review_updated(mapper, connection, review):
+    state = inspect(review)
+    rating_history = state.attrs.rating.history
+    approved_history = state.attrs.is_approved.history
+    if not rating_history.has_changes() and not approved_history.has_changes():
+        return
+    
+    old_rating = rating_history.deleted[0] if rating_history.deleted else review.rating
+    was_approved = approved_history.deleted[0] if approved_history.deleted else review.is_approved
+    
+    if was_approved:
+        _adjust_rating_summary(connection, review.product_id, old_rating, -1)
+    if review.is_approved:
+        _adjust_rating_summary(connection, review.product_id, review.rating, 1)
+
+@event.listens_for(Review, 'after_delete')
+def _review_deleted(mapper, connection, review):
+    if review.is_approved:
+        _adjust_rating_summary(connection, review.product_id, review.rating, -1)
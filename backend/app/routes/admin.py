@@ -2,12 +2,29 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import User, Product, Order, Category, Payment, Review
-from app.utils.security import admin_required
+from app.utils.security import admin_required, revoke_tokens
+from app.utils.pagination import paginate
+from app.services.cache_service import CacheService
+from app.services.catalog_service import CatalogService
+from app.services.import_service import ProductImportService
+from app.services.inventory_service import InventoryService
+from app.services.flash_sale_service import FlashSaleService
+from app.services.job_queue import JobQueue
+from app.utils.serializers import (
+    user_to_dict, admin_product_to_dict, admin_order_to_dict, admin_order_with_user_to_dict,
+    admin_category_to_dict, requested_fields
+)
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 
 admin_bp = Blueprint('admin', __name__)
 
+# Product fields that can change which catalog listings a product appears in
+LISTING_FIELDS = {
+    'name', 'description', 'tags', 'brand', 'category_id', 'is_featured', 'is_active',
+    'price', 'compare_price', 'quantity'
+}
+
 @admin_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 @admin_required
@@ -62,8 +79,8 @@ def dashboard():
                 'revenue': float(row.revenue or 0),
                 'orders': row.orders
             } for row in sales_data],
-            'recent_orders': [order_to_dict(order) for order in recent_orders],
-            'low_stock_products': [product_to_dict(product) for product in low_stock_products],
+            'recent_orders': admin_order_to_dict.many(recent_orders),
+            'low_stock_products': admin_product_to_dict.many(low_stock_products),
             'payment_methods': [{
                 'method': row.payment_method,
                 'count': row.count,
@@ -80,8 +97,6 @@ def dashboard():
 @admin_required
 def get_users():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         search = request.args.get('search')
         
         query = User.query
@@ -94,17 +109,15 @@ def get_users():
                 (User.last_name.ilike(search_term))
             )
         
-        users = query.order_by(User.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        users, meta = paginate(query, User)
         
         return jsonify({
-            'users': [user_to_dict(user) for user in users.items],
-            'total': users.total,
-            'pages': users.pages,
-            'current_page': page
+            'users': user_to_dict.many(users, requested_fields()),
+            **meta
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Get users error: {str(e)}")
         return jsonify({'error': 'Failed to fetch users'}), 500
@@ -128,13 +141,50 @@ def get_user(user_id):
         current_app.logger.error(f"Get user error: {str(e)}")
         return jsonify({'error': 'Failed to fetch user'}), 500
 
+@admin_bp.route('/users/<user_id>', methods=['PUT'])
+@jwt_required()
+@admin_required
+def update_user(user_id):
+    try:
+        user = User.query.get(user_id)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json()
+        
+        if user_id == get_jwt_identity() and data.get('is_admin') is False:
+            return jsonify({'error': 'Admins cannot remove their own admin access'}), 400
+        
+        for field in ('first_name', 'last_name', 'phone', 'email_verified'):
+            if field in data:
+                setattr(user, field, data[field])
+        
+        # Access tokens carry is_admin; a privilege change revokes them
+        revoke = False
+        for field in ('is_admin', 'is_active'):
+            if field in data and bool(data[field]) != bool(getattr(user, field)):
+                setattr(user, field, bool(data[field]))
+                revoke = True
+        
+        db.session.commit()
+        if revoke:
+            revoke_tokens(user)
+        
+        return jsonify({
+            'message': 'User updated successfully',
+            'user': user_to_dict(user)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Update user error: {str(e)}")
+        return jsonify({'error': 'Failed to update user'}), 500
+
 @admin_bp.route('/products', methods=['GET'])
 @jwt_required()
 @admin_required
 def get_products_admin():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         category = request.args.get('category')
         low_stock = request.args.get('low_stock', type=bool)
         
@@ -146,17 +196,15 @@ def get_products_admin():
         if low_stock:
             query = query.filter(Product.quantity <= Product.low_stock_threshold)
         
-        products = query.order_by(Product.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        products, meta = paginate(query, Product)
         
         return jsonify({
-            'products': [product_to_dict(product) for product in products.items],
-            'total': products.total,
-            'pages': products.pages,
-            'current_page': page
+            'products': admin_product_to_dict.many(products, requested_fields()),
+            **meta
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Get products admin error: {str(e)}")
         return jsonify({'error': 'Failed to fetch products'}), 500
@@ -195,6 +243,7 @@ def create_product():
             brand=data.get('brand'),
             is_featured=data.get('is_featured', False),
             is_active=data.get('is_active', True),
+            flash_sale=data.get('flash_sale', False),
             tags=data.get('tags', []),
             images=data.get('images', []),
             specifications=data.get('specifications', {}),
@@ -203,11 +252,14 @@ def create_product():
         )
         
         db.session.add(product)
+        CatalogService.bump()
         db.session.commit()
         
+        invalidate_catalog_cache(category_ids=[product.category_id], listings=True)
+        
         return jsonify({
             'message': 'Product created successfully',
-            'product': product_to_dict(product)
+            'product': admin_product_to_dict(product)
         }), 201
         
     except Exception as e:
@@ -215,6 +267,37 @@ def create_product():
         current_app.logger.error(f"Create product error: {str(e)}")
         return jsonify({'error': 'Failed to create product'}), 500
 
+@admin_bp.route('/products/import', methods=['POST'])
+@jwt_required()
+@admin_required
+def import_products():
+    try:
+        upload = request.files.get('file')
+        if upload:
+            stream = upload.stream
+            default_format = 'jsonl' if upload.filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+        else:
+            stream = request.stream
+            default_format = 'jsonl' if 'json' in (request.mimetype or '') else 'csv'
+        fmt = request.args.get('format', default_format)
+        
+        report = ProductImportService.import_rows(
+            ProductImportService.read_rows(stream, fmt),
+            chunk_size=min(request.args.get('chunk_size', 500, type=int), 5000)
+        )
+        
+        return jsonify({
+            'message': 'Product import finished',
+            'report': report
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Import products error: {str(e)}")
+        return jsonify({'error': 'Failed to import products'}), 500
+
 @admin_bp.route('/products/<product_id>', methods=['PUT'])
 @jwt_required()
 @admin_required
@@ -230,10 +313,17 @@ def update_product(product_id):
         updatable_fields = [
             'name', 'description', 'short_description', 'price', 'compare_price',
             'cost_price', 'quantity', 'low_stock_threshold', 'category_id',
-            'brand', 'is_featured', 'is_active', 'tags', 'images',
+            'brand', 'is_featured', 'is_active', 'flash_sale', 'tags', 'images',
             'specifications', 'weight', 'dimensions'
         ]
         
+        old_category_id = product.category_id
+        old_quantity = product.quantity
+        changed_fields = {
+            field for field in updatable_fields
+            if field in data and getattr(product, field) != data[field]
+        }
+        
         for field in updatable_fields:
             if field in data:
                 setattr(product, field, data[field])
@@ -245,12 +335,32 @@ def update_product(product_id):
                 return jsonify({'error': 'SKU already exists'}), 400
             product.sku = data['sku']
         
+        # A restock during a flash sale also goes to its stock counter
+        if 'quantity' in changed_fields and product.flash_sale:
+            FlashSaleService.restock({product.id: (product.quantity or 0) - (old_quantity or 0)})
+        
+        # Units sold on the counter go into Product.quantity before it is dropped
+        ending_flash_sale = 'flash_sale' in changed_fields and not product.flash_sale
+        if ending_flash_sale:
+            FlashSaleService.settle(product.id)
+        
         product.updated_at = datetime.utcnow()
+        CatalogService.bump()
         db.session.commit()
         
+        if ending_flash_sale:
+            FlashSaleService.end(product.id)
+        
+        counts_changed = bool(changed_fields & {'category_id', 'is_active'})
+        invalidate_catalog_cache(
+            product.id,
+            category_ids=[old_category_id, product.category_id] if counts_changed else [],
+            listings=bool(changed_fields & LISTING_FIELDS)
+        )
+        
         return jsonify({
             'message': 'Product updated successfully',
-            'product': product_to_dict(product)
+            'product': admin_product_to_dict(product)
         })
         
     except Exception as e:
@@ -271,9 +381,13 @@ def delete_product(product_id):
         if product.order_items:
             return jsonify({'error': 'Cannot delete product with existing orders'}), 400
         
+        category_id = product.category_id
         db.session.delete(product)
+        CatalogService.bump()
         db.session.commit()
         
+        invalidate_catalog_cache(product_id, category_ids=[category_id], listings=True)
+        
         return jsonify({'message': 'Product deleted successfully'})
         
     except Exception as e:
@@ -286,29 +400,26 @@ def delete_product(product_id):
 @admin_required
 def get_orders_admin():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
         status = request.args.get('status')
         payment_status = request.args.get('payment_status')
         
-        query = Order.query
+        fields = requested_fields()
+        query = Order.query.options(*admin_order_with_user_to_dict.load_options(Order, fields))
         
         if status:
             query = query.filter_by(status=status)
         if payment_status:
             query = query.filter_by(payment_status=payment_status)
         
-        orders = query.order_by(Order.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        orders, meta = paginate(query, Order)
         
         return jsonify({
-            'orders': [order_to_dict(order, include_user=True) for order in orders.items],
-            'total': orders.total,
-            'pages': orders.pages,
-            'current_page': page
+            'orders': admin_order_with_user_to_dict.many(orders, fields),
+            **meta
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Get orders admin error: {str(e)}")
         return jsonify({'error': 'Failed to fetch orders'}), 500
@@ -328,6 +439,8 @@ def update_order(order_id):
         if 'status' in data:
             valid_statuses = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled']
             if data['status'] in valid_statuses:
+                if data['status'] == 'cancelled' and order.status != 'cancelled':
+                    InventoryService.release_order(order)
                 order.status = data['status']
         
         # Update tracking info
@@ -345,7 +458,7 @@ def update_order(order_id):
         
         return jsonify({
             'message': 'Order updated successfully',
-            'order': order_to_dict(order, include_user=True)
+            'order': admin_order_with_user_to_dict(order)
         })
         
     except Exception as e:
@@ -353,13 +466,24 @@ def update_order(order_id):
         current_app.logger.error(f"Update order error: {str(e)}")
         return jsonify({'error': 'Failed to update order'}), 500
 
+@admin_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_job_stats():
+    try:
+        return jsonify({'jobs': JobQueue.stats()})
+        
+    except Exception as e:
+        current_app.logger.error(f"Get job stats error: {str(e)}")
+        return jsonify({'error': 'Failed to fetch job stats'}), 500
+
 @admin_bp.route('/categories', methods=['GET'])
 @jwt_required()
 @admin_required
 def get_categories_admin():
     try:
         categories = Category.query.order_by(Category.sort_order, Category.name).all()
-        return jsonify([category_to_dict(category) for category in categories])
+        return jsonify(admin_category_to_dict.many(categories))
         
     except Exception as e:
         current_app.logger.error(f"Get categories admin error: {str(e)}")
@@ -389,11 +513,14 @@ def create_category():
         )
         
         db.session.add(category)
+        CatalogService.bump()
         db.session.commit()
         
+        CacheService.invalidate_tags('categories')
+        
         return jsonify({
             'message': 'Category created successfully',
-            'category': category_to_dict(category)
+            'category': admin_category_to_dict(category)
         }), 201
         
     except Exception as e:
@@ -402,90 +529,17 @@ def create_category():
         return jsonify({'error': 'Failed to create category'}), 500
 
 # Helper functions
-def user_to_dict(user):
-    return {
-        'id': user.id,
-        'email': user.email,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'phone': user.phone,
-        'is_active': user.is_active,
-        'is_admin': user.is_admin,
-        'email_verified': user.email_verified,
-        'last_login': user.last_login.isoformat() if user.last_login else None,
-        'created_at': user.created_at.isoformat()
-    }
-
-def product_to_dict(product):
-    return {
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'price': float(product.price),
-        'compare_price': float(product.compare_price) if product.compare_price else None,
-        'cost_price': float(product.cost_price) if product.cost_price else None,
-        'quantity': product.quantity,
-        'low_stock_threshold': product.low_stock_threshold,
-        'category_id': product.category_id,
-        'brand': product.brand,
-        'is_featured': product.is_featured,
-        'is_active': product.is_active,
-        'sku': product.sku,
-        'barcode': product.barcode,
-        'tags': product.tags or [],
-        'images': product.images or [],
-        'specifications': product.specifications or {},
-        'created_at': product.created_at.isoformat(),
-        'updated_at': product.updated_at.isoformat()
-    }
-
-def order_to_dict(order, include_user=False, include_items=False):
-    data = {
-        'id': order.id,
-        'order_number': order.order_number,
-        'status': order.status,
-        'subtotal': float(order.subtotal),
-        'tax_amount': float(order.tax_amount),
-        'shipping_amount': float(order.shipping_amount),
-        'total_amount': float(order.total_amount),
-        'payment_method': order.payment_method,
-        'payment_status': order.payment_status,
-        'shipping_address': order.shipping_address,
-        'tracking_number': order.tracking_number,
-        'shipping_method': order.shipping_method,
-        'estimated_delivery': order.estimated_delivery.isoformat() if order.estimated_delivery else None,
-        'created_at': order.created_at.isoformat()
-    }
-    
-    if include_user:
-        data['user'] = {
-            'id': order.user.id,
-            'email': order.user.email,
-            'first_name': order.user.first_name,
-            'last_name': order.user.last_name,
-            'phone': order.user.phone
-        }
-    
-    if include_items:
-        data['items'] = [{
-            'id': item.id,
-            'product_id': item.product_id,
-            'product_name': item.product_name,
-            'quantity': item.quantity,
-            'price': float(item.product_price),
-            'total': float(item.total_price)
-        } for item in order.items]
-    
-    return data
-
-def category_to_dict(category):
-    return {
-        'id': category.id,
-        'name': category.name,
-        'description': category.description,
-        'image_url': category.image_url,
-        'is_active': category.is_active,
-        'sort_order': category.sort_order,
-        'product_count': len(category.products),
-        'created_at': category.created_at.isoformat()
-    }
\ No newline at end of file
+def invalidate_catalog_cache(product_id=None, category_ids=(), listings=False):
+    """
+    Drop cached catalog responses affected by a product write: the product's
+    own entries, listings when membership may have changed, and category
+    entries when their product counts moved.
+    """
+    tags = {f'category:{category_id}' for category_id in category_ids if category_id}
+    if tags:
+        tags.add('categories')
+    if product_id:
+        tags.add(f'product:{product_id}')
+    if listings:
+        tags.add('products')
+    CacheService.invalidate_tags(*tags)
@@ -1,11 +1,19 @@
 from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import User, Cart
-from app.utils.security import hash_password, verify_password, generate_tokens, validate_email
+from app.utils.security import hash_password, verify_password, generate_tokens, validate_email, token_claims
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
 
 auth_bp = Blueprint('auth', __name__)
 
+def get_or_create_cart_id(user_id):
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    if not cart:
+        cart = Cart(user_id=user_id)
+        db.session.add(cart)
+        db.session.commit()
+    return cart.id
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -43,7 +51,7 @@ def register():
         db.session.commit()
         
         # Generate tokens
-        access_token, refresh_token = generate_tokens(user.id)
+        access_token, refresh_token = generate_tokens(user.id, token_claims(user, cart.id))
         
         return jsonify({
             'message': 'User registered successfully',
@@ -79,7 +87,7 @@ def login():
             return jsonify({'error': 'Account is deactivated'}), 401
         
         # Generate tokens
-        access_token, refresh_token = generate_tokens(user.id)
+        access_token, refresh_token = generate_tokens(user.id, token_claims(user, get_or_create_cart_id(user.id)))
         
         return jsonify({
             'message': 'Login successful',
@@ -129,7 +137,15 @@ def get_current_user():
 def refresh_token():
     try:
         user_id = get_jwt_identity()
-        access_token = create_access_token(identity=user_id)
+        
+        # Claims are re-read here, so privilege changes apply on refresh
+        user = User.query.get(user_id)
+        if not user or not user.is_active:
+            return jsonify({'error': 'Account is deactivated'}), 401
+        
+        access_token = create_access_token(
+            identity=user_id, additional_claims=token_claims(user, get_or_create_cart_id(user_id))
+        )
         
         return jsonify({
             'access_token': access_token
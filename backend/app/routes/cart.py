@@ -1,31 +1,49 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
-from app.models import Cart, CartItem, Product
+from sqlalchemy.orm import load_only
+from app.models import Product
+from app.services.cart_store import get_cart_store
+from app.utils.serializers import cart_item_to_dict
 
 cart_bp = Blueprint('cart', __name__)
 
+MAX_CART_OPERATIONS = 100
+CART_OPERATIONS = ('add', 'set', 'remove')
+
+def attach_products(lines, products=None):
+    """Set line.product for every cart line, loading unknown products in one query."""
+    by_id = dict(products or {})
+    missing = [line.product_id for line in lines if line.product_id not in by_id]
+    if missing:
+        by_id.update(
+            (product.id, product) for product in
+            Product.query.options(load_only(Product.name, Product.images)).filter(Product.id.in_(missing))
+        )
+    for line in lines:
+        line.product = by_id.get(line.product_id)
+
+def cart_response(cart_id, lines, products=None):
+    attach_products(list(lines.values()), products)
+
+    # Lines whose product has since been deleted are not shown
+    cart_items = [line for line in lines.values() if line.product is not None]
+
+    return {
+        'cart_id': cart_id,
+        'items': cart_item_to_dict.many(cart_items),
+        'total_items': len(cart_items),
+        'subtotal': sum(float(item.price) * item.quantity for item in cart_items)
+    }
+
 @cart_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_cart():
     try:
         user_id = get_jwt_identity()
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        
-        if not cart:
-            cart = Cart(user_id=user_id)
-            db.session.add(cart)
-            db.session.commit()
-        
-        cart_items = CartItem.query.filter_by(cart_id=cart.id).all()
-        
-        return jsonify({
-            'cart_id': cart.id,
-            'items': [cart_item_to_dict(item) for item in cart_items],
-            'total_items': len(cart_items),
-            'subtotal': sum(float(item.price) * item.quantity for item in cart_items)
-        })
-        
+        cart_id, lines = get_cart_store().get(user_id, create=True)
+
+        return jsonify(cart_response(cart_id, lines))
+
     except Exception as e:
         current_app.logger.error(f"Get cart error: {str(e)}")
         return jsonify({'error': 'Failed to get cart'}), 500
@@ -36,46 +54,27 @@ def add_to_cart():
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
-        
+
         if not data.get('product_id') or not data.get('quantity'):
             return jsonify({'error': 'Product ID and quantity are required'}), 400
-        
-        # Get or create cart
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        if not cart:
-            cart = Cart(user_id=user_id)
-            db.session.add(cart)
-            db.session.commit()
-        
+
         # Check product exists and has stock
         product = Product.query.filter_by(id=data['product_id'], is_active=True).first()
         if not product:
             return jsonify({'error': 'Product not found'}), 404
-        
+
         if product.quantity < data['quantity']:
             return jsonify({'error': 'Insufficient stock'}), 400
-        
-        # Check if item already in cart
-        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=data['product_id']).first()
-        
-        if cart_item:
-            cart_item.quantity += data['quantity']
-        else:
-            cart_item = CartItem(
-                cart_id=cart.id,
-                product_id=data['product_id'],
-                quantity=data['quantity'],
-                price=product.price
-            )
-            db.session.add(cart_item)
-        
-        db.session.commit()
-        
+
+        # Adds to the quantity if the product is already in the cart
+        cart_item = get_cart_store().add(user_id, product.id, data['quantity'], product.price)
+        cart_item.product = product
+
         return jsonify({
             'message': 'Product added to cart',
             'cart_item': cart_item_to_dict(cart_item)
         })
-        
+
     except Exception as e:
         current_app.logger.error(f"Add to cart error: {str(e)}")
         return jsonify({'error': 'Failed to add product to cart'}), 500
@@ -85,21 +84,17 @@ def add_to_cart():
 def remove_from_cart(product_id):
     try:
         user_id = get_jwt_identity()
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        
-        if not cart:
+        store = get_cart_store()
+        cart_id, _ = store.get(user_id)
+
+        if not cart_id:
             return jsonify({'error': 'Cart not found'}), 404
-        
-        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
-        
-        if not cart_item:
+
+        if not store.remove(user_id, product_id):
             return jsonify({'error': 'Item not found in cart'}), 404
-        
-        db.session.delete(cart_item)
-        db.session.commit()
-        
+
         return jsonify({'message': 'Item removed from cart'})
-        
+
     except Exception as e:
         current_app.logger.error(f"Remove from cart error: {str(e)}")
         return jsonify({'error': 'Failed to remove item from cart'}), 500
@@ -110,42 +105,117 @@ def update_cart_item(product_id):
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
-        
+
         if not data.get('quantity'):
             return jsonify({'error': 'Quantity is required'}), 400
-        
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        if not cart:
+
+        store = get_cart_store()
+        cart_id, lines = store.get(user_id)
+        if not cart_id:
             return jsonify({'error': 'Cart not found'}), 404
-        
-        cart_item = CartItem.query.filter_by(cart_id=cart.id, product_id=product_id).first()
-        if not cart_item:
+
+        if product_id not in lines:
             return jsonify({'error': 'Item not found in cart'}), 404
-        
+
         # Check stock
         product = Product.query.get(product_id)
         if product.quantity < data['quantity']:
             return jsonify({'error': 'Insufficient stock'}), 400
-        
-        cart_item.quantity = data['quantity']
-        db.session.commit()
-        
+
+        cart_item = store.set_quantity(user_id, product_id, data['quantity'])
+        if not cart_item:
+            return jsonify({'error': 'Item not found in cart'}), 404
+        cart_item.product = product
+
         return jsonify({
             'message': 'Cart item updated',
             'cart_item': cart_item_to_dict(cart_item)
         })
-        
+
     except Exception as e:
         current_app.logger.error(f"Update cart item error: {str(e)}")
         return jsonify({'error': 'Failed to update cart item'}), 500
 
-def cart_item_to_dict(cart_item):
-    return {
-        'id': cart_item.id,
-        'product_id': cart_item.product_id,
-        'product_name': cart_item.product.name,
-        'product_image': cart_item.product.images[0] if cart_item.product.images else None,
-        'price': float(cart_item.price),
-        'quantity': cart_item.quantity,
-        'total': float(cart_item.price) * cart_item.quantity
-    }
\ No newline at end of file
+@cart_bp.route('/', methods=['PATCH'])
+@jwt_required()
+def apply_cart_operations():
+    """
+    Apply a list of {op: add|set|remove, product_id, quantity} operations
+    in order, all or nothing. Products are resolved in one query and stock
+    is checked once against the resulting quantities.
+    """
+    try:
+        user_id = get_jwt_identity()
+        operations = (request.get_json() or {}).get('operations')
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list'}), 400
+        if len(operations) > MAX_CART_OPERATIONS:
+            return jsonify({'error': f'At most {MAX_CART_OPERATIONS} operations per request'}), 400
+        if not all(isinstance(operation, dict) for operation in operations):
+            return jsonify({'error': 'Each operation must be an object'}), 400
+
+        store = get_cart_store()
+        _, lines = store.get(user_id, create=True)
+        quantities = {product_id: line.quantity for product_id, line in lines.items()}
+
+        product_ids = {str(operation.get('product_id')) for operation in operations}
+        products = {
+            product.id: product for product in Product.query.options(load_only(
+                Product.name, Product.images, Product.price, Product.quantity, Product.is_active
+            )).filter(Product.id.in_(product_ids))
+        }
+
+        # Replay the operations on the current quantities
+        errors = []
+        touched = set()
+        for index, operation in enumerate(operations):
+            op = operation.get('op')
+            product_id = str(operation.get('product_id'))
+            quantity = operation.get('quantity')
+            error = None
+
+            if op not in CART_OPERATIONS:
+                error = f"op must be one of: {', '.join(CART_OPERATIONS)}"
+            elif op != 'add' and product_id not in quantities:
+                error = 'Item not found in cart'
+            elif op == 'remove':
+                del quantities[product_id]
+            elif not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+                error = 'quantity must be a positive integer'
+            elif product_id not in products or (op == 'add' and not products[product_id].is_active):
+                error = 'Product not found'
+            elif op == 'add':
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            else:
+                quantities[product_id] = quantity
+
+            if error:
+                errors.append({'index': index, 'product_id': operation.get('product_id'), 'error': error})
+            else:
+                touched.add(product_id)
+
+        # Check stock
+        for product_id in touched:
+            if product_id in quantities and products[product_id].quantity < quantities[product_id]:
+                errors.append({
+                    'product_id': product_id,
+                    'error': f'Insufficient stock for {products[product_id].name}'
+                })
+
+        if errors:
+            return jsonify({'error': 'Invalid cart operations', 'errors': errors}), 400
+
+        cart_id, lines = store.apply(user_id, {
+            product_id: (quantities[product_id], products[product_id].price) if product_id in quantities else None
+            for product_id in touched
+        })
+
+        return jsonify({
+            'message': 'Cart updated',
+            **cart_response(cart_id, lines, products)
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Apply cart operations error: {str(e)}")
+        return jsonify({'error': 'Failed to update cart'}), 500
@@ -1,9 +1,23 @@
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
-from app.models import Order, OrderItem, Cart, CartItem, Product, User, Payment
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from app import db, redis_client
+from app.models import Order, OrderItem, CartItem, User, Payment
 from app.services.payment_service import PaymentService
+from app.services.cart_store import get_cart_store
+from app.services.inventory_service import InventoryService
+from app.services.flash_sale_service import FlashSaleService
+from app.services.job_queue import JobQueue
+from app.services.order_events import order_event_broker, order_event, FINAL_STATUSES
+from app.utils.idempotency import idempotent
+from app.utils.pagination import paginate
+from app.utils.security import stream_token, load_stream_token, DEFAULT_STREAM_TOKEN_TTL
+from app.utils.serializers import order_to_dict, order_detail_to_dict, requested_fields
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
 from datetime import datetime
+import json
+import queue
+import time
 import uuid
 
 orders_bp = Blueprint('orders', __name__)
@@ -13,8 +27,6 @@ orders_bp = Blueprint('orders', __name__)
 def get_orders():
     try:
         user_id = get_jwt_identity()
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
         status = request.args.get('status')
         
         query = Order.query.filter_by(user_id=user_id)
@@ -22,35 +34,49 @@ def get_orders():
         if status:
             query = query.filter_by(status=status)
         
-        orders = query.order_by(Order.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        orders, meta = paginate(query, Order, default_per_page=10)
         
         return jsonify({
-            'orders': [order_to_dict(order) for order in orders.items],
-            'total': orders.total,
-            'pages': orders.pages,
-            'current_page': page
+            'orders': order_to_dict.many(orders, requested_fields()),
+            **meta
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Get orders error: {str(e)}")
         return jsonify({'error': 'Failed to fetch orders'}), 500
 
 @orders_bp.route('/', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_order():
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
         
-        # Get user's cart
-        cart = Cart.query.filter_by(user_id=user_id).first()
-        if not cart or not cart.items:
+        # Get user's cart (the hot tier is authoritative; it may be ahead of cart_items)
+        cart_store = get_cart_store()
+        cart_id, lines = cart_store.get(user_id)
+        cart_items = list(lines.values())
+        if not cart_items:
             return jsonify({'error': 'Cart is empty'}), 400
         
+        # Flash-sale lines are admitted on their stock counters before any row is locked
+        quantities = {item.product_id: item.quantity for item in cart_items}
+        admitted, sold_out = FlashSaleService.admit(quantities)
+        if sold_out:
+            return jsonify({
+                'error': 'Sold out',
+                'status': 'sold_out',
+                'shortages': [
+                    {'product_id': product_id, 'requested': quantities[product_id], 'available': available}
+                    for product_id, available in sold_out.items()
+                ]
+            }), 409
+        
         # Calculate totals
-        subtotal = sum(float(item.price) * item.quantity for item in cart.items)
+        subtotal = sum(float(item.price) * item.quantity for item in cart_items)
         tax_amount = subtotal * 0.16  # 16% VAT for Kenya
         shipping_amount = 0 if subtotal > 5000 else 300  # Free shipping over 5000 KES
         total_amount = subtotal + tax_amount + shipping_amount
@@ -74,33 +100,36 @@ def create_order():
         )
         
         db.session.add(order)
+        db.session.flush()
         
-        # Create order items and update product quantities
-        for cart_item in cart.items:
-            product = Product.query.get(cart_item.product_id)
-            if not product:
-                return jsonify({'error': f'Product {cart_item.product_id} not found'}), 404
-            
-            if product.quantity < cart_item.quantity:
-                return jsonify({'error': f'Insufficient stock for {product.name}'}), 400
-            
-            # Reduce product quantity
-            product.quantity -= cart_item.quantity
-            
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                product_name=product.name,
-                product_price=cart_item.price,
-                quantity=cart_item.quantity,
-                total_price=float(cart_item.price) * cart_item.quantity
-            )
-            db.session.add(order_item)
+        # Hold stock for every line at once until the order is paid or the hold expires
+        products, shortages = InventoryService.reserve(order.id, quantities, admitted)
+        missing = [product_id for product_id in quantities if product_id not in products]
+        if missing:
+            db.session.rollback()
+            return jsonify({'error': f'Product {missing[0]} not found'}), 404
+        if shortages:
+            db.session.rollback()
+            return jsonify({'error': 'Insufficient stock', 'shortages': shortages}), 400
+        
+        db.session.execute(insert(OrderItem), [
+            {
+                'order_id': order.id,
+                'product_id': cart_item.product_id,
+                'product_name': products[cart_item.product_id].name,
+                'product_price': cart_item.price,
+                'quantity': cart_item.quantity,
+                'total_price': float(cart_item.price) * cart_item.quantity
+            }
+            for cart_item in cart_items
+        ])
         
         # Clear cart
-        CartItem.query.filter_by(cart_id=cart.id).delete()
+        CartItem.query.filter_by(cart_id=cart_id).delete()
         
+        JobQueue.enqueue('send_order_confirmation', {'order_id': order.id})
         db.session.commit()
+        cart_store.clear(user_id)
         
         return jsonify({
             'message': 'Order created successfully',
@@ -117,23 +146,125 @@ def create_order():
 def get_order(order_id):
     try:
         user_id = get_jwt_identity()
-        order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+        order = Order.query.options(*order_detail_to_dict.load_options(Order)).filter_by(
+            id=order_id, user_id=user_id
+        ).first()
         
         if not order:
             return jsonify({'error': 'Order not found'}), 404
         
-        return jsonify(order_to_dict(order, include_items=True))
+        return jsonify(order_detail_to_dict(order))
         
     except Exception as e:
         current_app.logger.error(f"Get order error: {str(e)}")
         return jsonify({'error': 'Failed to fetch order'}), 500
 
+def sse_message(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def current_order_event(app, order_id):
+    """The order's state, read in a short-lived context so no connection is held."""
+    with app.app_context():
+        order = db.session.get(Order, order_id)
+        return order_event(order) if order else None
+
+@orders_bp.route('/<order_id>/events/token', methods=['POST'])
+@jwt_required()
+def order_events_token(order_id):
+    """A token for `GET /orders/<id>/events?token=`, which EventSource needs since it cannot set headers."""
+    try:
+        user_id = get_jwt_identity()
+        if not db.session.query(Order.id).filter_by(id=order_id, user_id=user_id).first():
+            return jsonify({'error': 'Order not found'}), 404
+        
+        return jsonify({
+            'token': stream_token(user_id, order_id, get_jwt().get('tv', 0)),
+            'expires_in': current_app.config.get('SSE_TOKEN_TTL', DEFAULT_STREAM_TOKEN_TTL)
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Order events token error: {str(e)}")
+        return jsonify({'error': 'Failed to issue stream token'}), 500
+
+@orders_bp.route('/<order_id>/events', methods=['GET'])
+@jwt_required(optional=True)
+def order_events(order_id):
+    """
+    Server-Sent Events stream of the order's status and payment updates.
+    Sends the current state first, then every change as it commits; the
+    stream ends with an `end` event once the order is delivered or
+    cancelled, or after SSE_MAX_DURATION (EventSource reconnects).
+    Authenticates with the Authorization header, or with ?token= from
+    POST /orders/<id>/events/token. Without Redis, changes committed by
+    other workers are found by re-reading the order at each heartbeat.
+    """
+    try:
+        user_id = get_jwt_identity()
+        if user_id is None:
+            user_id = load_stream_token(request.args.get('token', ''), order_id)
+            if user_id is None:
+                return jsonify({'error': 'Authentication required'}), 401
+        
+        # Subscribe before reading the state so no change falls in between
+        events = order_event_broker.subscribe(order_id)
+        try:
+            order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+            current = order_event(order) if order else None
+        except Exception:
+            order_event_broker.unsubscribe(order_id, events)
+            raise
+        finally:
+            # The stream holds no database connection while it waits
+            db.session.close()
+        
+        if current is None:
+            order_event_broker.unsubscribe(order_id, events)
+            return jsonify({'error': 'Order not found'}), 404
+        
+        heartbeat = current_app.config.get('SSE_HEARTBEAT_INTERVAL', 15)
+        deadline = time.monotonic() + current_app.config.get('SSE_MAX_DURATION', 300)
+        retry = current_app.config.get('SSE_RETRY', 3000)
+        app = current_app._get_current_object()
+        
+        def stream():
+            try:
+                kind, data = current
+                last_order = data
+                yield f"retry: {retry}\n" + sse_message(kind, data)
+                while kind != 'order' or data['status'] not in FINAL_STATUSES:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    try:
+                        kind, data = events.get(timeout=min(heartbeat, remaining))
+                    except queue.Empty:
+                        polled = current_order_event(app, order_id) if redis_client is None else None
+                        if polled is None or polled[1] == last_order:
+                            yield ": keep-alive\n\n"
+                            continue
+                        kind, data = polled
+                    if kind == 'order':
+                        last_order = data
+                    yield sse_message(kind, data)
+                yield sse_message('end', {'order_id': order_id})
+            finally:
+                order_event_broker.unsubscribe(order_id, events)
+        
+        return Response(stream(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Order events error: {str(e)}")
+        return jsonify({'error': 'Failed to stream order events'}), 500
+
 @orders_bp.route('/<order_id>/cancel', methods=['POST'])
 @jwt_required()
 def cancel_order(order_id):
     try:
         user_id = get_jwt_identity()
-        order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+        order = Order.query.options(selectinload(Order.items)).filter_by(id=order_id, user_id=user_id).first()
         
         if not order:
             return jsonify({'error': 'Order not found'}), 404
@@ -142,10 +273,7 @@ def cancel_order(order_id):
             return jsonify({'error': 'Order cannot be cancelled at this stage'}), 400
         
         # Restore product quantities
-        for item in order.items:
-            product = Product.query.get(item.product_id)
-            if product:
-                product.quantity += item.quantity
+        InventoryService.release_order(order)
         
         order.status = 'cancelled'
         db.session.commit()
@@ -212,46 +340,3 @@ def track_order(order_id):
     except Exception as e:
         current_app.logger.error(f"Track order error: {str(e)}")
         return jsonify({'error': 'Failed to track order'}), 500
-
-def order_to_dict(order, include_items=False):
-    data = {
-        'id': order.id,
-        'order_number': order.order_number,
-        'status': order.status,
-        'subtotal': float(order.subtotal),
-        'tax_amount': float(order.tax_amount),
-        'shipping_amount': float(order.shipping_amount),
-        'total_amount': float(order.total_amount),
-        'currency': order.currency,
-        'payment_method': order.payment_method,
-        'payment_status': order.payment_status,
-        'shipping_address': order.shipping_address,
-        'created_at': order.created_at.isoformat(),
-        'updated_at': order.updated_at.isoformat()
-    }
-    
-    if include_items:
-        data['items'] = [order_item_to_dict(item) for item in order.items]
-        data['payments'] = [payment_to_dict(payment) for payment in order.payments]
-    
-    return data
-
-def order_item_to_dict(item):
-    return {
-        'id': item.id,
-        'product_id': item.product_id,
-        'product_name': item.product_name,
-        'product_price': float(item.product_price),
-        'quantity': item.quantity,
-        'total_price': float(item.total_price)
-    }
-
-def payment_to_dict(payment):
-    return {
-        'id': payment.id,
-        'payment_method': payment.payment_method,
-        'amount': float(payment.amount),
-        'status': payment.status,
-        'gateway_transaction_id': payment.gateway_transaction_id,
-        'created_at': payment.created_at.isoformat()
-    }
\ No newline at end of file
@@ -3,12 +3,65 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models import Payment, Order, User
 from app.services.payment_service import PaymentService
+from app.services.inventory_service import InventoryService
+from app.services.job_queue import JobQueue
+from app.utils.idempotency import idempotent
+from app.utils.http_cache import make_etag, add_cache_headers, not_modified_response
 import stripe
 
 payments_bp = Blueprint('payments', __name__)
 
+PAYMENT_METHODS = [
+    {
+        'id': 'mpesa',
+        'name': 'M-Pesa',
+        'description': 'Pay via M-Pesa mobile money',
+        'icon': 'fas fa-mobile-alt',
+        'supported_countries': ['Kenya'],
+        'processing_fee': 0
+    },
+    {
+        'id': 'card',
+        'name': 'Credit/Debit Card',
+        'description': 'Pay with Visa, Mastercard, or American Express',
+        'icon': 'fas fa-credit-card',
+        'supported_countries': ['All'],
+        'processing_fee': 0.035  # 3.5%
+    }
+]
+
+PAYMENT_METHODS_ETAG = make_etag('payment_methods', PAYMENT_METHODS)
+
+def settle_paid_order(payment):
+    """
+    Payment succeeded: turn the order's stock holds into sales and confirm
+    it. An order paid after its holds expired and the stock was sold
+    elsewhere is not confirmed: it is cancelled with payment_status 'paid'
+    and a note, for an admin to refund.
+    """
+    shortages = InventoryService.commit_reservations(payment.order_id)
+    order = payment.order
+    payment.status = 'paid'
+    order.payment_status = 'paid'
+    if shortages:
+        InventoryService.release_order(order, 'payment_too_late')
+        order.status = 'cancelled'
+        order.notes = '\n'.join(filter(None, [
+            order.notes,
+            f"Paid after its stock hold expired; out of stock: {', '.join(s['product_id'] for s in shortages)}. Refund due."
+        ]))
+        current_app.logger.error(f"Order {order.order_number} paid without stock, refund due: {shortages}")
+        return
+    order.status = 'confirmed'
+    enqueue_payment_receipt(payment.order_id)
+
+def enqueue_payment_receipt(order_id):
+    """Receipt email, once per order even if the gateway repeats its notification."""
+    JobQueue.enqueue('send_payment_receipt', {'order_id': order_id}, unique_key=f'payment_receipt:{order_id}')
+
 @payments_bp.route('/mpesa', methods=['POST'])
 @jwt_required()
+@idempotent
 def initiate_mpesa_payment():
     try:
         user_id = get_jwt_identity()
@@ -24,6 +77,9 @@ def initiate_mpesa_payment():
         if order.payment_status == 'paid':
             return jsonify({'error': 'Order is already paid'}), 400
 
+        if order.status == 'cancelled':
+            return jsonify({'error': 'Order has been cancelled'}), 400
+
         # Format phone number (ensure it starts with 254)
         phone = data['phone']
         if phone.startswith('0'):
@@ -53,6 +109,7 @@ def initiate_mpesa_payment():
 
             db.session.add(payment)
             order.payment_status = 'pending'
+            InventoryService.extend_holds(order.id)
             db.session.commit()
 
             return jsonify({
@@ -71,6 +128,7 @@ def initiate_mpesa_payment():
 
 @payments_bp.route('/stripe/create-payment-intent', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_stripe_payment_intent():
     try:
         user_id = get_jwt_identity()
@@ -86,6 +144,9 @@ def create_stripe_payment_intent():
         if order.payment_status == 'paid':
             return jsonify({'error': 'Order is already paid'}), 400
 
+        if order.status == 'cancelled':
+            return jsonify({'error': 'Order has been cancelled'}), 400
+
         # Create Stripe payment intent
         payment_intent = PaymentService.create_stripe_payment_intent(order)
 
@@ -101,6 +162,7 @@ def create_stripe_payment_intent():
 
         db.session.add(payment)
         order.payment_status = 'pending'
+        InventoryService.extend_holds(order.id)
         db.session.commit()
 
         return jsonify({
@@ -133,9 +195,7 @@ def stripe_webhook():
             ).first()
 
             if payment:
-                payment.status = 'paid'
-                payment.order.payment_status = 'paid'
-                payment.order.status = 'confirmed'
+                settle_paid_order(payment)
                 db.session.commit()
 
                 current_app.logger.info(f"Payment succeeded for order {payment.order.order_number}")
@@ -177,9 +237,7 @@ def mpesa_callback():
 
         if result_code == 0:
             # Payment successful
-            payment.status = 'paid'
-            payment.order.payment_status = 'paid'
-            payment.order.status = 'confirmed'
+            settle_paid_order(payment)
 
             # Extract transaction details
             callback_metadata = callback_data.get('CallbackMetadata', {}).get('Item', [])
@@ -204,26 +262,15 @@ def mpesa_callback():
 @payments_bp.route('/methods', methods=['GET'])
 def get_payment_methods():
     try:
-        methods = [
-            {
-                'id': 'mpesa',
-                'name': 'M-Pesa',
-                'description': 'Pay via M-Pesa mobile money',
-                'icon': 'fas fa-mobile-alt',
-                'supported_countries': ['Kenya'],
-                'processing_fee': 0
-            },
-            {
-                'id': 'card',
-                'name': 'Credit/Debit Card',
-                'description': 'Pay with Visa, Mastercard, or American Express',
-                'icon': 'fas fa-credit-card',
-                'supported_countries': ['All'],
-                'processing_fee': 0.035  # 3.5%
-            }
-        ]
-
-        return jsonify({'payment_methods': methods})
+        surrogate_keys = ['payment-methods']
+        not_modified = not_modified_response(PAYMENT_METHODS_ETAG, surrogate_keys=surrogate_keys)
+        if not_modified:
+            return not_modified
+
+        return add_cache_headers(
+            jsonify({'payment_methods': PAYMENT_METHODS}), PAYMENT_METHODS_ETAG,
+            surrogate_keys=surrogate_keys
+        )
 
     except Exception as e:
         current_app.logger.error(f"Get payment methods error: {str(e)}")
@@ -1,18 +1,68 @@
 from flask import Blueprint, request, jsonify, current_app
 from app import db
-from app.models import Product, Category
-from sqlalchemy import or_
+from app.models import Product, Category, ProductRelation
+from app.services.search_service import SearchService
+from app.services.cache_service import cache_response
+from app.services.facet_service import facet_index, any_tag
+from app.services.suggest_service import suggest_index
+from app.services.catalog_service import CatalogService
+from app.utils.pagination import paginate
+from app.utils.serializers import product_to_dict, category_to_dict, requested_fields
+from app.utils.http_cache import make_etag, latest, add_cache_headers, not_modified_response
+from sqlalchemy.orm import load_only, joinedload
 
 products_bp = Blueprint('products', __name__)
 
+MAX_BATCH_IDS = 500
+# Compact fields for POST /batch: name -> (columns to load, value)
+BATCH_FIELDS = {
+    'name': (['name'], lambda p: p.name),
+    'sku': (['sku'], lambda p: p.sku),
+    'price': (['price'], lambda p: float(p.price)),
+    'compare_price': (['compare_price'], lambda p: float(p.compare_price) if p.compare_price else None),
+    'quantity': (['quantity'], lambda p: p.quantity),
+    'in_stock': (['quantity'], lambda p: (p.quantity or 0) > 0),
+    'available': (['is_active', 'quantity'], lambda p: bool(p.is_active) and (p.quantity or 0) > 0),
+    'image': (['images'], lambda p: (p.images or [None])[0]),
+    'updated_at': (['updated_at'], lambda p: p.updated_at.isoformat() if p.updated_at else None),
+}
+DEFAULT_BATCH_FIELDS = ['name', 'price', 'compare_price', 'quantity', 'available']
+
+# A ?fields= payload may leave out `category`; it then embeds nothing that a
+# category change could make stale, so no category tag is needed
+def product_list_tags(view_args, payload):
+    tags = {'catalog', 'products'}
+    for product in payload['products']:
+        tags.add(f"product:{product['id']}")
+        if product.get('category'):
+            tags.add(f"category:{product['category']['id']}")
+    return tags
+
+def product_detail_tags(view_args, payload):
+    tags = {'catalog', f"product:{payload['id']}"}
+    if payload.get('category'):
+        tags.add(f"category:{payload['category']['id']}")
+    return tags
+
+def related_product_tags(view_args, payload):
+    return {'catalog', 'related', f"product:{view_args['product_id']}"}
+
+def category_list_tags(view_args, payload):
+    return {'catalog', 'categories'}
+
 @products_bp.route('/', methods=['GET'])
+@cache_response(key_prefix='catalog', tags=product_list_tags)
 def get_products():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 12, type=int)
         category = request.args.get('category')
         search = request.args.get('search')
         featured = request.args.get('featured', type=bool)
+        brands = request.args.getlist('brand')
+        tags = request.args.getlist('tag')
+        min_price = request.args.get('min_price', type=float)
+        max_price = request.args.get('max_price', type=float)
+        in_stock = request.args.get('in_stock', '').lower() in ('1', 'true', 'yes')
+        include_facets = request.args.get('facets', '').lower() in ('1', 'true', 'yes')
         
         query = Product.query.filter_by(is_active=True)
         
@@ -20,78 +70,229 @@ def get_products():
             query = query.filter(Product.category.has(name=category))
         
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Product.name.ilike(search_term),
-                    Product.description.ilike(search_term),
-                    Product.tags.contains([search])
-                )
-            )
+            query = SearchService.search(query, search)
         
         if featured:
             query = query.filter_by(is_featured=True)
         
-        products = query.paginate(
-            page=page, per_page=per_page, error_out=False
+        # Facet filters
+        base_query = query
+        if brands:
+            query = query.filter(Product.brand.in_(brands))
+        if min_price is not None:
+            query = query.filter(Product.price >= min_price)
+        if max_price is not None:
+            query = query.filter(Product.price <= max_price)
+        if in_stock:
+            query = query.filter(Product.quantity > 0)
+        if include_facets:
+            facet_index.ensure_fresh()
+        if tags:
+            tagged = any_tag(tags)
+            if tagged is None:
+                facet_index.ensure_fresh()
+                tagged = Product.id.in_(facet_index.ids_for(facet_index.restrict('tag', tags)))
+            query = query.filter(tagged)
+        
+        # Page through ids and timestamps only; full rows are loaded
+        # once we know the client's copy is stale.
+        page, meta = paginate(
+            query.options(load_only(Product.id, Product.created_at, Product.updated_at)), Product,
+            default_per_page=12, ranked=bool(SearchService.tokenize(search))
+        )
+        
+        facets = None
+        if include_facets:
+            facets = facet_index.facet_counts(
+                base=facet_base(base_query, category, search, featured),
+                brands=brands, tags=tags, min_price=min_price, max_price=max_price,
+                in_stock=in_stock
+            )
+        
+        version, version_updated_at = CatalogService.version()
+        etag = make_etag(
+            'products', version, sorted(request.args.items(multi=True)),
+            [(p.id, p.updated_at) for p in page], meta, facets
         )
+        # Catalog-wide: the page's own timestamps miss products that left or
+        # joined it with an older updated_at
+        last_modified = version_updated_at
+        surrogate_keys = ['catalog', 'products'] + [f'product-{p.id}' for p in page]
+        
+        not_modified = not_modified_response(etag, last_modified, surrogate_keys)
+        if not_modified:
+            return not_modified
+        
+        fields = requested_fields()
+        loaded = {
+            p.id: p for p in Product.query.options(*product_to_dict.load_options(Product, fields)).filter(
+                Product.id.in_([p.id for p in page])
+            ).populate_existing()
+        }
+        response = {
+            'products': product_to_dict.many([loaded[p.id] for p in page if p.id in loaded], fields),
+            **meta
+        }
+        if facets is not None:
+            response['facets'] = facets
+        
+        return add_cache_headers(jsonify(response), etag, last_modified, surrogate_keys)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error fetching products: {str(e)}")
+        return jsonify({'error': 'Failed to fetch products'}), 500
+
+@products_bp.route('/suggest', methods=['GET'])
+def suggest_products():
+    try:
+        term = request.args.get('q', '')
+        limit = request.args.get('limit', 8, type=int)
+        
+        suggest_index.ensure_fresh()
+        response = jsonify({
+            'query': term,
+            'suggestions': suggest_index.suggest(term, limit)
+        })
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching suggestions: {str(e)}")
+        return jsonify({'error': 'Failed to fetch suggestions'}), 500
+
+@products_bp.route('/batch', methods=['POST'])
+def get_products_batch():
+    try:
+        data = request.get_json() or {}
+        product_ids = data.get('ids')
+        fields = data.get('fields') or DEFAULT_BATCH_FIELDS
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        
+        if not isinstance(product_ids, list) or not product_ids:
+            return jsonify({'error': 'ids must be a non-empty list'}), 400
+        if len(product_ids) > MAX_BATCH_IDS:
+            return jsonify({'error': f'At most {MAX_BATCH_IDS} ids per request'}), 400
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            return jsonify({'error': 'fields must be a list of strings or a comma-separated string'}), 400
+        requested = list(dict.fromkeys(map(str, product_ids)))
+        fields = list(dict.fromkeys(fields))
+        unknown = [field for field in fields if field not in BATCH_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        # One IN query loading only the columns the requested fields need
+        columns = {'id'}
+        for field in fields:
+            columns.update(BATCH_FIELDS[field][0])
+        products = {
+            product.id: product
+            for product in Product.query.options(
+                load_only(*[getattr(Product, column) for column in columns])
+            ).filter(Product.id.in_(requested))
+        }
         
         return jsonify({
-            'products': [product_to_dict(p) for p in products.items],
-            'total': products.total,
-            'pages': products.pages,
-            'current_page': page
+            'products': [
+                {'id': product_id, **{field: BATCH_FIELDS[field][1](products[product_id]) for field in fields}}
+                for product_id in requested if product_id in products
+            ],
+            'missing': [product_id for product_id in requested if product_id not in products]
         })
         
     except Exception as e:
-        current_app.logger.error(f"Error fetching products: {str(e)}")
+        current_app.logger.error(f"Error fetching product batch: {str(e)}")
         return jsonify({'error': 'Failed to fetch products'}), 500
 
 @products_bp.route('/<product_id>', methods=['GET'])
+@cache_response(key_prefix='catalog', tags=product_detail_tags)
 def get_product(product_id):
     try:
-        product = Product.query.filter_by(id=product_id, is_active=True).first()
+        fields = requested_fields()
+        product = Product.query.options(*product_to_dict.load_options(Product, fields)).filter_by(
+            id=product_id, is_active=True
+        ).first()
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        return jsonify(product_to_dict(product))
+        version, version_updated_at = CatalogService.version()
+        etag = make_etag('product', product.id, product.updated_at, version, fields)
+        last_modified = latest(product.updated_at, version_updated_at)
+        surrogate_keys = ['catalog', f'product-{product.id}']
+        if product.category_id:
+            surrogate_keys.append(f'category-{product.category_id}')
+        
+        not_modified = not_modified_response(etag, last_modified, surrogate_keys)
+        if not_modified:
+            return not_modified
+        
+        return add_cache_headers(jsonify(product_to_dict(product, fields)), etag, last_modified, surrogate_keys)
         
     except Exception as e:
         current_app.logger.error(f"Error fetching product: {str(e)}")
         return jsonify({'error': 'Failed to fetch product'}), 500
 
+@products_bp.route('/<product_id>/related', methods=['GET'])
+@cache_response(key_prefix='catalog', tags=related_product_tags)
+def get_related_products(product_id):
+    try:
+        limit = min(request.args.get('limit', 8, type=int), 20)
+        
+        # Neighbours are precomputed by `flask build-recommendations`
+        related = db.session.query(Product, ProductRelation.co_purchase_count).join(
+            ProductRelation, ProductRelation.related_product_id == Product.id
+        ).options(joinedload(Product.category)).filter(
+            ProductRelation.product_id == product_id,
+            Product.is_active == True
+        ).order_by(ProductRelation.score.desc()).limit(limit).all()
+        
+        return jsonify({
+            'product_id': product_id,
+            'products': [
+                {**product_to_dict(product), 'bought_together_count': count}
+                for product, count in related
+            ]
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error fetching related products: {str(e)}")
+        return jsonify({'error': 'Failed to fetch related products'}), 500
+
 @products_bp.route('/categories', methods=['GET'])
+@cache_response(key_prefix='catalog', tags=category_list_tags)
 def get_categories():
     try:
+        version, version_updated_at = CatalogService.version()
+        etag = make_etag('categories', version)
+        surrogate_keys = ['catalog', 'categories']
+        
+        not_modified = not_modified_response(etag, version_updated_at, surrogate_keys)
+        if not_modified:
+            return not_modified
+        
         categories = Category.query.filter_by(is_active=True).all()
-        return jsonify([category_to_dict(c) for c in categories])
+        return add_cache_headers(
+            jsonify(category_to_dict.many(categories)), etag, version_updated_at, surrogate_keys
+        )
         
     except Exception as e:
         current_app.logger.error(f"Error fetching categories: {str(e)}")
         return jsonify({'error': 'Failed to fetch categories'}), 500
 
-def product_to_dict(product):
-    return {
-        'id': product.id,
-        'name': product.name,
-        'description': product.description,
-        'price': float(product.price),
-        'compare_price': float(product.compare_price) if product.compare_price else None,
-        'images': product.images or [],
-        'category': category_to_dict(product.category) if product.category else None,
-        'quantity': product.quantity,
-        'sku': product.sku,
-        'is_featured': product.is_featured,
-        'tags': product.tags or [],
-        'specifications': product.specifications or {},
-        'created_at': product.created_at.isoformat()
-    }
-
-def category_to_dict(category):
-    return {
-        'id': category.id,
-        'name': category.name,
-        'description': category.description,
-        'image_url': category.image_url,
-        'product_count': len(category.products) if category.products else 0
-    }
\ No newline at end of file
+def facet_base(query, category, search, featured):
+    """Bitmap of the products matched by the non-facet filters, or None for all."""
+    if search:
+        return facet_index.bitmap_for_ids(
+            product_id for (product_id,) in query.with_entities(Product.id).order_by(None)
+        )
+    
+    base = None
+    if category:
+        category_id = db.session.query(Category.id).filter_by(name=category).scalar()
+        base = facet_index.restrict('category', [category_id])
+    if featured:
+        featured_bitmap = facet_index.restrict('featured', [True])
+        base = featured_bitmap if base is None else base & featured_bitmap
+    return base
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models import Review, Product, Order, OrderItem
+from app.models import Review, Product, Order, OrderItem, User
 from app.utils.security import admin_required
+from app.services.cache_service import CacheService
+from app.utils.pagination import paginate
+from app.utils.http_cache import make_etag, add_cache_headers, not_modified_response
+from app.utils.serializers import review_to_dict, review_with_user_to_dict, requested_fields
+from sqlalchemy.orm import load_only
 
 reviews_bp = Blueprint('reviews', __name__)
 
@@ -16,6 +21,13 @@ def create_review():
         if not data.get('product_id') or not data.get('rating'):
             return jsonify({'error': 'Product ID and rating are required'}), 400
         
+        try:
+            rating = int(data['rating'])
+        except (TypeError, ValueError):
+            rating = None
+        if rating not in range(1, 6):
+            return jsonify({'error': 'Rating must be between 1 and 5'}), 400
+        
         # Check if user has purchased the product
         has_purchased = Order.query.join(OrderItem).filter(
             Order.user_id == user_id,
@@ -38,7 +50,7 @@ def create_review():
         review = Review(
             product_id=data['product_id'],
             user_id=user_id,
-            rating=data['rating'],
+            rating=rating,
             title=data.get('title'),
             comment=data.get('comment'),
             is_verified=True  # Since they purchased it
@@ -46,6 +58,7 @@ def create_review():
         
         db.session.add(review)
         db.session.commit()
+        invalidate_rating_cache(review.product_id)
         
         return jsonify({
             'message': 'Review submitted successfully',
@@ -60,41 +73,39 @@ def create_review():
 @reviews_bp.route('/product/<product_id>', methods=['GET'])
 def get_product_reviews(product_id):
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        
-        reviews = Review.query.filter_by(
-            product_id=product_id,
-            is_approved=True
-        ).order_by(Review.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+        # Aggregates are maintained on the product row as reviews change
+        product = db.session.query(Product).options(
+            load_only(
+                Product.updated_at, Product.rating_count, Product.rating_sum,
+                *[getattr(Product, f'rating_{rating}_count') for rating in range(1, 6)]
+            )
+        ).filter_by(id=product_id).first()
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        
+        summary = product.rating_summary
+        last_modified = product.updated_at
+        etag = make_etag(
+            'reviews', product_id, summary, last_modified, sorted(request.args.items(multi=True))
+        )
+        surrogate_keys = [f'reviews-{product_id}']
+        not_modified = not_modified_response(etag, last_modified, surrogate_keys)
+        if not_modified:
+            return not_modified
+        
+        reviews, meta = paginate(
+            Review.query.filter_by(product_id=product_id, is_approved=True),
+            Review, default_per_page=10
         )
         
-        # Calculate average rating
-        avg_rating = db.session.query(
-            db.func.avg(Review.rating)
-        ).filter_by(
-            product_id=product_id,
-            is_approved=True
-        ).scalar() or 0
-        
-        rating_distribution = db.session.query(
-            Review.rating,
-            db.func.count(Review.id)
-        ).filter_by(
-            product_id=product_id,
-            is_approved=True
-        ).group_by(Review.rating).all()
-        
-        return jsonify({
-            'reviews': [review_to_dict(review) for review in reviews.items],
-            'average_rating': round(float(avg_rating), 1),
-            'total_reviews': reviews.total,
-            'rating_distribution': {str(rating): count for rating, count in rating_distribution},
-            'pages': reviews.pages,
-            'current_page': page
-        })
+        return add_cache_headers(jsonify({
+            'reviews': review_to_dict.many(reviews, requested_fields()),
+            **summary,
+            **meta
+        }), etag, last_modified, surrogate_keys)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Get product reviews error: {str(e)}")
         return jsonify({'error': 'Failed to fetch reviews'}), 500
@@ -114,8 +125,10 @@ def delete_review(review_id):
         if review.user_id != user_id and not user.is_admin:
             return jsonify({'error': 'Unauthorized'}), 403
         
+        product_id = review.product_id
         db.session.delete(review)
         db.session.commit()
+        invalidate_rating_cache(product_id)
         
         return jsonify({'message': 'Review deleted successfully'})
         
@@ -129,20 +142,18 @@ def delete_review(review_id):
 @admin_required
 def get_pending_reviews():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 20, type=int)
-        
-        reviews = Review.query.filter_by(is_approved=False).order_by(
-            Review.created_at.desc()
-        ).paginate(page=page, per_page=per_page, error_out=False)
+        reviews, meta = paginate(
+            Review.query.options(*review_with_user_to_dict.load_options(Review)).filter_by(is_approved=False),
+            Review
+        )
         
         return jsonify({
-            'reviews': [review_to_dict(review, include_user=True) for review in reviews.items],
-            'total': reviews.total,
-            'pages': reviews.pages,
-            'current_page': page
+            'reviews': review_with_user_to_dict.many(reviews),
+            **meta
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Get pending reviews error: {str(e)}")
         return jsonify({'error': 'Failed to fetch pending reviews'}), 500
@@ -158,6 +169,7 @@ def approve_review(review_id):
         
         review.is_approved = True
         db.session.commit()
+        invalidate_rating_cache(review.product_id)
         
         return jsonify({'message': 'Review approved successfully'})
         
@@ -166,22 +178,7 @@ def approve_review(review_id):
         current_app.logger.error(f"Approve review error: {str(e)}")
         return jsonify({'error': 'Failed to approve review'}), 500
 
-def review_to_dict(review, include_user=False):
-    data = {
-        'id': review.id,
-        'product_id': review.product_id,
-        'rating': review.rating,
-        'title': review.title,
-        'comment': review.comment,
-        'is_verified': review.is_verified,
-        'created_at': review.created_at.isoformat()
-    }
-    
-    if include_user:
-        data['user'] = {
-            'id': review.user.id,
-            'first_name': review.user.first_name,
-            'last_name': review.user.last_name
-        }
-    
-    return data
\ No newline at end of file
+def invalidate_rating_cache(product_id):
+    # Product detail responses embed the rating summary; listings pick the
+    # new summary up when their cache entries expire.
+    CacheService.invalidate_tags(f'product:{product_id}')
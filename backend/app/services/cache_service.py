@@ -1,11 +1,59 @@
 from app import redis_client
+import hashlib
 import json
 import pickle
 from functools import wraps
+from flask import request, current_app, make_response
+from werkzeug.http import parse_date
+from app.utils.http_cache import is_not_modified
+
+GENERATION_KEY = "cache:generation"
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'Surrogate-Key')
+
+# Store an entry and index it under its tags, unless an invalidation ran
+# since the caller read the generation (its data may predate that write).
+SET_WITH_TAGS_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SETEX', KEYS[2], ARGV[2], ARGV[3])
+for i = 3, #KEYS do
+    redis.call('SADD', KEYS[i], KEYS[2])
+    if redis.call('TTL', KEYS[i]) < tonumber(ARGV[2]) then
+        redis.call('EXPIRE', KEYS[i], ARGV[2])
+    end
+end
+return 1
+"""
+
+# Delete every entry indexed under the given tags, then the tag sets.
+INVALIDATE_TAGS_SCRIPT = """
+redis.call('INCR', ARGV[1])
+local keys = redis.call('SUNION', unpack(KEYS))
+for i = 1, #keys, 1000 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+end
+redis.call('DEL', unpack(KEYS))
+return #keys
+"""
 
 class CacheService:
+    _scripts = {}
+
+    @staticmethod
+    def enabled():
+        return redis_client is not None
+
+    @staticmethod
+    def _script(source):
+        if source not in CacheService._scripts:
+            CacheService._scripts[source] = redis_client.register_script(source)
+        return CacheService._scripts[source]
+
     @staticmethod
     def get(key):
+        if redis_client is None:
+            return None
         try:
             value = redis_client.get(key)
             if value:
@@ -17,6 +65,8 @@ class CacheService:
 
     @staticmethod
     def set(key, value, expire=3600):
+        if redis_client is None:
+            return False
         try:
             redis_client.setex(key, expire, pickle.dumps(value))
             return True
@@ -26,6 +76,8 @@ class CacheService:
 
     @staticmethod
     def delete(key):
+        if redis_client is None:
+            return False
         try:
             redis_client.delete(key)
             return True
@@ -35,6 +87,8 @@ class CacheService:
 
     @staticmethod
     def delete_pattern(pattern):
+        if redis_client is None:
+            return False
         try:
             keys = redis_client.keys(pattern)
             if keys:
@@ -44,22 +98,106 @@ class CacheService:
             print(f"Cache delete pattern error: {e}")
             return False
 
-def cache_response(expire=300, key_prefix="cache"):
+    @staticmethod
+    def generation():
+        """Current invalidation generation, read before computing a value to cache."""
+        if redis_client is None:
+            return None
+        try:
+            return (redis_client.get(GENERATION_KEY) or b'0').decode()
+        except Exception as e:
+            print(f"Cache generation error: {e}")
+            return None
+
+    @staticmethod
+    def set_with_tags(key, value, tags, expire=3600, generation=None):
+        if redis_client is None or generation is None:
+            return False
+        try:
+            tag_keys = [f"cache:tag:{tag}" for tag in set(tags)]
+            stored = CacheService._script(SET_WITH_TAGS_SCRIPT)(
+                keys=[GENERATION_KEY, key] + tag_keys,
+                args=[generation, expire, pickle.dumps(value)]
+            )
+            return bool(stored)
+        except Exception as e:
+            print(f"Cache set with tags error: {e}")
+            return False
+
+    @staticmethod
+    def invalidate_tags(*tags):
+        if redis_client is None or not tags:
+            return False
+        try:
+            CacheService._script(INVALIDATE_TAGS_SCRIPT)(
+                keys=[f"cache:tag:{tag}" for tag in set(tags)],
+                args=[GENERATION_KEY]
+            )
+            return True
+        except Exception as e:
+            print(f"Cache invalidate tags error: {e}")
+            return False
+
+def make_cache_key(prefix, view_args=None):
+    """
+    Cache key from the view arguments and the query string. Names keep
+    their case and empty values are kept, as the views read them: `?PAGE=`
+    is not `?page=`, and `?cursor=` (cursor mode) is not a missing cursor.
+    """
+    params = sorted(
+        (key, value)
+        for key, values in request.args.lists()
+        for value in values
+    )
+    raw = json.dumps([sorted((view_args or {}).items()), params], separators=(',', ':'))
+    return f"{prefix}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+def cache_response(expire=None, key_prefix="cache", tags=None):
+    """
+    Read-through cache for JSON views. Only 200 responses are stored, for
+    `expire` seconds (default: CATALOG_CACHE_TTL). `tags(view_args, payload)`
+    returns the tags under which the entry is invalidated.
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            if not CacheService.enabled():
+                return f(*args, **kwargs)
+
             # Generate cache key
-            cache_key = f"{key_prefix}:{f.__name__}:{str(args)}:{str(kwargs)}"
-            
+            cache_key = make_cache_key(f"{key_prefix}:{f.__name__}", kwargs)
+
             # Try to get from cache
             cached_result = CacheService.get(cache_key)
             if cached_result is not None:
-                return cached_result
-            
-            # Execute function and cache result
-            result = f(*args, **kwargs)
-            CacheService.set(cache_key, result, expire)
-            
-            return result
+                body, status, headers = cached_result
+                etag = headers.get('ETag', '').strip('"')
+                last_modified = parse_date(headers.get('Last-Modified'))
+                if last_modified is not None:
+                    last_modified = last_modified.replace(tzinfo=None)
+                if etag and is_not_modified(etag, last_modified):
+                    response = current_app.response_class(status=304, headers=headers)
+                else:
+                    response = current_app.response_class(
+                        body, status=status, mimetype='application/json', headers=headers
+                    )
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            # Execute view and cache the response body
+            generation = CacheService.generation()
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and response.is_json:
+                entry_tags = tags(kwargs, response.get_json()) if tags else []
+                ttl = expire or current_app.config.get('CATALOG_CACHE_TTL', 300)
+                headers = {
+                    name: response.headers[name] for name in CACHED_HEADERS if name in response.headers
+                }
+                CacheService.set_with_tags(
+                    cache_key, (response.get_data(), response.status_code, headers),
+                    entry_tags, ttl, generation
+                )
+            response.headers['X-Cache'] = 'MISS'
+            return response
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
@@ -0,0 +1,492 @@
+import threading
+import time
+from decimal import Decimal
+from flask import current_app
+from sqlalchemy import insert, update, delete
+from app import db, redis_client
+from app.models import Cart, CartItem, generate_uuid
+from app.utils.security import claimed_cart_id
+
+DIRTY_KEY = "cart:dirty"
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_FLUSH_INTERVAL = 2
+DEFAULT_FLUSH_BATCH = 200
+
+# Populate a cart hash from the database unless another request already did
+POPULATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Change the quantity of a line only if it is still in the cart
+SET_QUANTITY_SCRIPT = """
+local item_id = redis.call('HGET', KEYS[1], 'i:' .. ARGV[1])
+if not item_id then
+    return nil
+end
+redis.call('HSET', KEYS[1], 'q:' .. ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+return {item_id, redis.call('HGET', KEYS[1], 'p:' .. ARGV[1])}
+"""
+
+class CartLine:
+    """One cart line, shaped like CartItem for the cart serializer."""
+    __slots__ = ('id', 'product_id', 'quantity', 'price', 'product')
+
+    def __init__(self, id, product_id, quantity, price, product=None):
+        self.id = id
+        self.product_id = product_id
+        self.quantity = quantity
+        self.price = price
+        self.product = product
+
+def lines_from_fields(fields):
+    """Parse the compact hash layout: _id, then i:/q:/p:<product_id> per line."""
+    lines = {}
+    for field, value in fields.items():
+        if field.startswith('i:'):
+            product_id = field[2:]
+            lines[product_id] = CartLine(
+                value, product_id, int(fields[f'q:{product_id}']), Decimal(fields[f'p:{product_id}'])
+            )
+    return fields.get('_id'), lines
+
+def fields_from_lines(cart_id, lines):
+    fields = {'_id': cart_id}
+    for line in lines:
+        fields[f'i:{line.product_id}'] = line.id
+        fields[f'q:{line.product_id}'] = str(line.quantity)
+        fields[f'p:{line.product_id}'] = str(line.price)
+    return fields
+
+def load_cart(user_id, create=False):
+    """
+    (cart id, CartItem rows) from the database, optionally creating the
+    cart. The cart lookup is skipped when the access token carries cart_id.
+    """
+    cart_id = claimed_cart_id(user_id)
+    if cart_id:
+        return cart_id, CartItem.query.filter_by(cart_id=cart_id).all()
+    cart = Cart.query.filter_by(user_id=user_id).first()
+    if not cart:
+        if not create:
+            return None, []
+        cart = Cart(user_id=user_id)
+        db.session.add(cart)
+        db.session.commit()
+    return cart.id, CartItem.query.filter_by(cart_id=cart.id).all()
+
+class DatabaseCartStore:
+    """Carts read and written directly in carts/cart_items (no hot tier)."""
+    hot = False
+
+    def get(self, user_id, create=False):
+        cart_id, items = load_cart(user_id, create)
+        return cart_id, {
+            item.product_id: CartLine(item.id, item.product_id, item.quantity, item.price)
+            for item in items
+        }
+
+    def add(self, user_id, product_id, quantity, price):
+        cart_id, _ = load_cart(user_id, create=True)
+        cart_item = CartItem.query.filter_by(cart_id=cart_id, product_id=product_id).first()
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            cart_item = CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity, price=price)
+            db.session.add(cart_item)
+        db.session.commit()
+        return CartLine(cart_item.id, product_id, cart_item.quantity, cart_item.price)
+
+    def set_quantity(self, user_id, product_id, quantity):
+        cart_item = CartItem.query.join(Cart).filter(
+            Cart.user_id == user_id, CartItem.product_id == product_id
+        ).first()
+        if not cart_item:
+            return None
+        cart_item.quantity = quantity
+        db.session.commit()
+        return CartLine(cart_item.id, product_id, cart_item.quantity, cart_item.price)
+
+    def remove(self, user_id, product_id):
+        cart_item = CartItem.query.join(Cart).filter(
+            Cart.user_id == user_id, CartItem.product_id == product_id
+        ).first()
+        if not cart_item:
+            return False
+        db.session.delete(cart_item)
+        db.session.commit()
+        return True
+
+    def apply(self, user_id, changes):
+        """Write {product_id: (quantity, unit price) or None to remove} at once."""
+        cart_id, items = load_cart(user_id, create=True)
+        by_product = {item.product_id: item for item in items}
+        for product_id, change in changes.items():
+            cart_item = by_product.get(product_id)
+            if change is None:
+                if cart_item:
+                    db.session.delete(cart_item)
+            elif cart_item:
+                cart_item.quantity = change[0]
+            else:
+                db.session.add(CartItem(cart_id=cart_id, product_id=product_id, quantity=change[0], price=change[1]))
+        db.session.commit()
+        return self.get(user_id)
+
+    def clear(self, user_id):
+        cart = Cart.query.filter_by(user_id=user_id).first()
+        if cart:
+            CartItem.query.filter_by(cart_id=cart.id).delete()
+            db.session.commit()
+
+    def flush(self, limit=None):
+        return 0
+
+    def flush_all(self):
+        pass
+
+class HotCartStore:
+    """
+    Write-behind cart tier. Carts live in a hash per user (`_id` plus
+    `i:`/`q:`/`p:` fields per product: line id, quantity, unit price)
+    loaded from the database on first use. Mutations only touch the hash
+    and mark the cart dirty; a background thread per worker writes dirty
+    carts back to carts/cart_items in batches. Line ids are assigned in
+    the hot tier, so they stay stable once persisted.
+    """
+    hot = True
+
+    def __init__(self):
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    @staticmethod
+    def ttl():
+        return current_app.config.get('CART_TTL', DEFAULT_TTL)
+
+    # --- Storage primitives, implemented per backend ---
+    def _read(self, user_id):
+        raise NotImplementedError
+
+    def _populate(self, user_id, fields):
+        raise NotImplementedError
+
+    def _add(self, user_id, product_id, quantity, price):
+        raise NotImplementedError
+
+    def _set_quantity(self, user_id, product_id, quantity):
+        raise NotImplementedError
+
+    def _remove(self, user_id, product_id):
+        raise NotImplementedError
+
+    def _apply(self, user_id, changes):
+        raise NotImplementedError
+
+    def _clear(self, user_id, cart_id):
+        raise NotImplementedError
+
+    def _pop_dirty(self, limit):
+        raise NotImplementedError
+
+    def _mark_dirty(self, user_ids):
+        raise NotImplementedError
+
+    # --- Cart operations ---
+    def _load(self, user_id, create=False):
+        fields = self._read(user_id)
+        if not fields:
+            cart_id, items = load_cart(user_id, create)
+            if cart_id is None:
+                return {}
+            self._populate(user_id, fields_from_lines(cart_id, items))
+            fields = self._read(user_id)
+        return fields
+
+    def get(self, user_id, create=False):
+        return lines_from_fields(self._load(user_id, create))
+
+    def add(self, user_id, product_id, quantity, price):
+        self._load(user_id, create=True)
+        line = self._add(user_id, product_id, quantity, price)
+        self.start_flusher()
+        return line
+
+    def set_quantity(self, user_id, product_id, quantity):
+        if not self._load(user_id):
+            return None
+        line = self._set_quantity(user_id, product_id, quantity)
+        self.start_flusher()
+        return line
+
+    def remove(self, user_id, product_id):
+        if not self._load(user_id):
+            return False
+        removed = self._remove(user_id, product_id)
+        self.start_flusher()
+        return removed
+
+    def apply(self, user_id, changes):
+        self._load(user_id, create=True)
+        self._apply(user_id, changes)
+        self.start_flusher()
+        return self.get(user_id)
+
+    def clear(self, user_id):
+        fields = self._load(user_id)
+        if fields:
+            self._clear(user_id, fields['_id'])
+            self.start_flusher()
+
+    # --- Write-behind ---
+    def flush(self, limit=None):
+        """Write dirty carts to the database; returns the number of carts written."""
+        user_ids = self._pop_dirty(limit or current_app.config.get('CART_FLUSH_BATCH', DEFAULT_FLUSH_BATCH))
+        if not user_ids:
+            return 0
+        try:
+            carts = {}
+            for user_id in user_ids:
+                cart_id, lines = lines_from_fields(self._read(user_id))
+                if cart_id:
+                    carts[cart_id] = lines
+            if carts:
+                self._write(carts)
+            return len(user_ids)
+        except Exception as e:
+            db.session.rollback()
+            self._mark_dirty(user_ids)
+            current_app.logger.error(f"Cart flush error: {str(e)}")
+            return 0
+
+    @staticmethod
+    def _write(carts):
+        existing = {}
+        for item in db.session.query(
+            CartItem.id, CartItem.cart_id, CartItem.product_id, CartItem.quantity
+        ).filter(CartItem.cart_id.in_(list(carts))):
+            existing[(item.cart_id, item.product_id)] = item
+
+        inserts, updates, deletes = [], [], []
+        for cart_id, lines in carts.items():
+            for product_id, line in lines.items():
+                row = existing.pop((cart_id, product_id), None)
+                if row is None:
+                    inserts.append({
+                        'id': line.id, 'cart_id': cart_id, 'product_id': product_id,
+                        'quantity': line.quantity, 'price': line.price
+                    })
+                elif row.quantity != line.quantity:
+                    updates.append({'id': row.id, 'quantity': line.quantity})
+        deletes = [row.id for row in existing.values()]
+
+        if deletes:
+            db.session.execute(delete(CartItem).where(CartItem.id.in_(deletes)))
+        if updates:
+            db.session.execute(update(CartItem), updates)
+        if inserts:
+            db.session.execute(insert(CartItem), inserts)
+        db.session.commit()
+
+    def flush_all(self):
+        while self.flush():
+            pass
+
+    def start_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._flusher_lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            app = current_app._get_current_object()
+            self._flusher = threading.Thread(
+                target=self._run_flusher, args=(app,), name='cart-flusher', daemon=True
+            )
+            self._flusher.start()
+
+    def _run_flusher(self, app):
+        interval = app.config.get('CART_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    self.flush_all()
+                finally:
+                    db.session.remove()
+
+class RedisCartStore(HotCartStore):
+    """Hot carts in Redis, shared by every worker."""
+
+    def __init__(self):
+        super().__init__()
+        self._populate_script = redis_client.register_script(POPULATE_SCRIPT)
+        self._set_quantity_script = redis_client.register_script(SET_QUANTITY_SCRIPT)
+
+    @staticmethod
+    def key(user_id):
+        return f"cart:{user_id}"
+
+    def _read(self, user_id):
+        return {
+            field.decode(): value.decode()
+            for field, value in redis_client.hgetall(self.key(user_id)).items()
+        }
+
+    def _populate(self, user_id, fields):
+        args = [self.ttl()]
+        for field, value in fields.items():
+            args.extend([field, value])
+        self._populate_script(keys=[self.key(user_id)], args=args)
+
+    def _add(self, user_id, product_id, quantity, price):
+        key = self.key(user_id)
+        pipe = redis_client.pipeline()
+        pipe.hsetnx(key, f'i:{product_id}', generate_uuid())
+        pipe.hsetnx(key, f'p:{product_id}', str(price))
+        pipe.hincrby(key, f'q:{product_id}', quantity)
+        pipe.hget(key, f'i:{product_id}')
+        pipe.hget(key, f'p:{product_id}')
+        pipe.expire(key, self.ttl())
+        pipe.sadd(DIRTY_KEY, user_id)
+        _, _, total, item_id, unit_price, _, _ = pipe.execute()
+        return CartLine(item_id.decode(), product_id, total, Decimal(unit_price.decode()))
+
+    def _set_quantity(self, user_id, product_id, quantity):
+        result = self._set_quantity_script(
+            keys=[self.key(user_id), DIRTY_KEY], args=[product_id, quantity, self.ttl(), user_id]
+        )
+        if not result:
+            return None
+        item_id, unit_price = result
+        return CartLine(item_id.decode(), product_id, quantity, Decimal(unit_price.decode()))
+
+    def _remove(self, user_id, product_id):
+        pipe = redis_client.pipeline()
+        pipe.hdel(self.key(user_id), f'i:{product_id}', f'q:{product_id}', f'p:{product_id}')
+        pipe.sadd(DIRTY_KEY, user_id)
+        removed, _ = pipe.execute()
+        return removed > 0
+
+    def _apply(self, user_id, changes):
+        key = self.key(user_id)
+        pipe = redis_client.pipeline()
+        for product_id, change in changes.items():
+            if change is None:
+                pipe.hdel(key, f'i:{product_id}', f'q:{product_id}', f'p:{product_id}')
+            else:
+                pipe.hsetnx(key, f'i:{product_id}', generate_uuid())
+                pipe.hsetnx(key, f'p:{product_id}', str(change[1]))
+                pipe.hset(key, f'q:{product_id}', change[0])
+        pipe.expire(key, self.ttl())
+        pipe.sadd(DIRTY_KEY, user_id)
+        pipe.execute()
+
+    def _clear(self, user_id, cart_id):
+        key = self.key(user_id)
+        pipe = redis_client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, '_id', cart_id)
+        pipe.expire(key, self.ttl())
+        pipe.sadd(DIRTY_KEY, user_id)
+        pipe.execute()
+
+    def _pop_dirty(self, limit):
+        return [user_id.decode() for user_id in redis_client.spop(DIRTY_KEY, limit) or []]
+
+    def _mark_dirty(self, user_ids):
+        redis_client.sadd(DIRTY_KEY, *user_ids)
+
+class MemoryCartStore(HotCartStore):
+    """
+    In-process stand-in for RedisCartStore (tests, single-worker setups).
+    Carts are not shared between workers, so do not use it with several.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.carts = {}
+        self.dirty = set()
+
+    def _read(self, user_id):
+        with self.lock:
+            return dict(self.carts.get(user_id, {}))
+
+    def _populate(self, user_id, fields):
+        with self.lock:
+            self.carts.setdefault(user_id, fields)
+
+    def _add(self, user_id, product_id, quantity, price):
+        with self.lock:
+            fields = self.carts[user_id]
+            item_id = fields.setdefault(f'i:{product_id}', generate_uuid())
+            unit_price = fields.setdefault(f'p:{product_id}', str(price))
+            total = int(fields.get(f'q:{product_id}', 0)) + quantity
+            fields[f'q:{product_id}'] = str(total)
+            self.dirty.add(user_id)
+        return CartLine(item_id, product_id, total, Decimal(unit_price))
+
+    def _set_quantity(self, user_id, product_id, quantity):
+        with self.lock:
+            fields = self.carts.get(user_id, {})
+            if f'i:{product_id}' not in fields:
+                return None
+            fields[f'q:{product_id}'] = str(quantity)
+            self.dirty.add(user_id)
+            return CartLine(fields[f'i:{product_id}'], product_id, quantity, Decimal(fields[f'p:{product_id}']))
+
+    def _remove(self, user_id, product_id):
+        with self.lock:
+            fields = self.carts.get(user_id, {})
+            removed = fields.pop(f'i:{product_id}', None) is not None
+            fields.pop(f'q:{product_id}', None)
+            fields.pop(f'p:{product_id}', None)
+            self.dirty.add(user_id)
+            return removed
+
+    def _apply(self, user_id, changes):
+        with self.lock:
+            fields = self.carts[user_id]
+            for product_id, change in changes.items():
+                if change is None:
+                    for prefix in ('i', 'q', 'p'):
+                        fields.pop(f'{prefix}:{product_id}', None)
+                else:
+                    fields.setdefault(f'i:{product_id}', generate_uuid())
+                    fields.setdefault(f'p:{product_id}', str(change[1]))
+                    fields[f'q:{product_id}'] = str(change[0])
+            self.dirty.add(user_id)
+
+    def _clear(self, user_id, cart_id):
+        with self.lock:
+            self.carts[user_id] = {'_id': cart_id}
+            self.dirty.add(user_id)
+
+    def _pop_dirty(self, limit):
+        with self.lock:
+            return [self.dirty.pop() for _ in range(min(limit, len(self.dirty)))]
+
+    def _mark_dirty(self, user_ids):
+        with self.lock:
+            self.dirty.update(user_ids)
+
+_stores = {}
+
+def get_cart_store():
+    """
+    The configured cart store: CART_STORE is 'redis', 'memory' or
+    'database'; by default Redis when REDIS_URL is set, else the database.
+    """
+    kind = current_app.config.get('CART_STORE') or ('redis' if redis_client is not None else 'database')
+    if kind not in _stores:
+        stores = {'redis': RedisCartStore, 'memory': MemoryCartStore, 'database': DatabaseCartStore}
+        if kind not in stores:
+            raise ValueError(f'Unknown cart store: {kind}')
+        _stores[kind] = stores[kind]()
+    return _stores[kind]
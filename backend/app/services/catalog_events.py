@@ -0,0 +1,63 @@
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import Product
+
+SNAPSHOT_FIELDS = (
+    'id', 'name', 'brand', 'tags', 'price', 'quantity',
+    'category_id', 'is_active', 'is_featured', 'flash_sale'
+)
+
+_subscribers = []
+
+def subscribe(callback):
+    """
+    Register `callback(changes, version)` to run after every commit that
+    wrote products through the ORM. `changes` maps product id to a
+    snapshot dict of SNAPSHOT_FIELDS, or to None when the product was
+    deleted; `version` is the catalog version the commit bumped to (see
+    CatalogService.bump), else None.
+
+    Bulk Core statements bypass this feed unless they `record` the rows
+    they wrote; in-memory indexes fed by it also rebuild periodically to
+    pick those up.
+    """
+    _subscribers.append(callback)
+
+def snapshot(product):
+    return {field: getattr(product, field) for field in SNAPSHOT_FIELDS}
+
+def record(session, products):
+    """Queue snapshots of products written by a bulk statement (published on commit)."""
+    changes = session.info.setdefault('product_changes', {})
+    for product in products:
+        changes[product.id] = snapshot(product)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    changes = session.info.setdefault('product_changes', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Product):
+            changes[obj.id] = snapshot(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes[obj.id] = None
+
+@event.listens_for(Session, 'after_commit')
+def _publish_product_changes(session):
+    changes = session.info.pop('product_changes', None)
+    version = session.info.pop('catalog_version', None)
+    if not changes:
+        return
+    for callback in _subscribers:
+        # The commit already succeeded; a failing subscriber must not
+        # surface as an error for the request that made the write.
+        try:
+            callback(changes, version)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Product change subscriber failed: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop('product_changes', None)
+    session.info.pop('catalog_version', None)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from sqlalchemy import update
+from app import db
+from app.models import CatalogVersion
+
+CATALOG_VERSION_ID = 'catalog'
+
+class CatalogService:
+    @staticmethod
+    def version():
+        """Current (version, updated_at) of the catalog."""
+        row = db.session.query(
+            CatalogVersion.version, CatalogVersion.updated_at
+        ).filter_by(id=CATALOG_VERSION_ID).first()
+        return (row.version, row.updated_at) if row else (0, None)
+
+    @staticmethod
+    def bump():
+        """
+        Advance the catalog version as part of the current transaction. The
+        new version goes out with the commit's product changes, so indexes
+        that apply those need not rebuild for it.
+        """
+        result = db.session.execute(
+            update(CatalogVersion).where(CatalogVersion.id == CATALOG_VERSION_ID).values(
+                version=CatalogVersion.version + 1,
+                updated_at=datetime.utcnow()
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        if not result.rowcount:
+            db.session.add(CatalogVersion(id=CATALOG_VERSION_ID, version=1))
+            db.session.info['catalog_version'] = 1
+        else:
+            # Our UPDATE holds the row, so this reads our own version
+            db.session.info['catalog_version'] = CatalogService.version()[0]
@@ -0,0 +1,282 @@
+import logging
+import threading
+import time
+from bisect import bisect_right
+from flask import current_app
+from sqlalchemy import cast, exists, select, func
+from sqlalchemy.dialects import postgresql
+from app import db
+from app.models import Product
+from app.services import catalog_events
+from app.services.catalog_service import CatalogService
+
+# Upper bounds of the price buckets (KES); the last bucket is open-ended
+PRICE_BUCKETS = [500, 1000, 2500, 5000, 10000, 25000, 50000]
+FACETS = ('brand', 'price', 'tag', 'in_stock')
+
+def price_bucket(price):
+    index = bisect_right(PRICE_BUCKETS, price)
+    if index == len(PRICE_BUCKETS):
+        return f"{PRICE_BUCKETS[-1]}+"
+    low = PRICE_BUCKETS[index - 1] if index else 0
+    return f"{low}-{PRICE_BUCKETS[index]}"
+
+def any_tag(tags):
+    """
+    SQL condition for products tagged with any of `tags` (a JSON array
+    column), so a popular tag does not turn into a huge IN list of ids.
+    None on databases without JSON array operators.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return cast(Product.tags, postgresql.JSONB).op('?|')(postgresql.array(list(tags)))
+    if dialect == 'sqlite':
+        values = func.json_each(Product.tags).table_valued('value')
+        return exists(select(1).select_from(values).where(values.c.value.in_(list(tags))))
+    return None
+
+def iter_bits(bitmap):
+    while bitmap:
+        low = bitmap & -bitmap
+        yield low.bit_length() - 1
+        bitmap ^= low
+
+class FacetIndex:
+    """
+    In-memory posting lists for active products, one bitmap (a Python int)
+    per facet value. Filters are bitmap intersections and facet counts are
+    popcounts, so browse pages get counts without a GROUP BY per facet.
+
+    The index is built on first use and updated incrementally from the
+    product change feed. A background thread rebuilds it when the catalog
+    version moves without this worker seeing the change (admin writes made
+    by other workers) and every FACET_INDEX_TTL seconds (stock changes,
+    which do not bump the version); queries use the current index
+    meanwhile.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.refresher = None
+        self.pending = None       # changes that arrive while a rebuild reads the table
+        self.built_at = None
+        self.checked_at = 0
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self.slots = {}           # product id -> bit position
+        self.ids = []             # bit position -> product id
+        self.free_slots = []
+        self.docs = {}            # product id -> indexed values
+        self.prices = {}          # bit position -> price
+        self.active = 0
+        self.postings = {facet: {} for facet in FACETS + ('category', 'featured')}
+
+    # --- Maintenance ---
+    def ensure_fresh(self):
+        """Build on first use; after that, start a background refresh when one is due."""
+        if self.built_at is None:
+            with self.build_lock:
+                if self.built_at is None:
+                    self.rebuild(CatalogService.version()[0])
+            return
+        interval = current_app.config.get('CATALOG_VERSION_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked_at < interval or self.refresher is not None:
+                return
+            self.checked_at = now
+            self.refresher = threading.Thread(
+                target=self._refresh, args=(current_app._get_current_object(),), daemon=True
+            )
+            self.refresher.start()
+
+    def _refresh(self, app):
+        """Background thread: rebuild if the catalog version moved or the TTL passed."""
+        try:
+            with app.app_context():
+                ttl = app.config.get('FACET_INDEX_TTL', 300)
+                version = CatalogService.version()[0]
+                if version != self.version or time.monotonic() - self.built_at > ttl:
+                    with self.build_lock:
+                        self.rebuild(version)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Facet index refresh failed: {str(e)}")
+        finally:
+            with self.lock:
+                self.refresher = None
+
+    def rebuild(self, version=None):
+        """Build a new index from the table and swap it in; queries are not blocked meanwhile."""
+        with self.lock:
+            self.pending = {}
+        try:
+            rows = db.session.query(
+                Product.id, Product.brand, Product.tags, Product.price,
+                Product.quantity, Product.category_id, Product.is_featured
+            ).filter(Product.is_active == True).yield_per(1000)
+            fresh = FacetIndex()
+            for row in rows:
+                fresh._add(row.id, self._values(row._asdict()), float(row.price or 0))
+        except Exception:
+            with self.lock:
+                self.pending = None
+            raise
+
+        with self.lock:
+            # Writes committed while the table was read may be missing from it
+            fresh._apply(self.pending)
+            self.pending = None
+            self.slots, self.ids, self.free_slots = fresh.slots, fresh.ids, fresh.free_slots
+            self.docs, self.prices, self.active = fresh.docs, fresh.prices, fresh.active
+            self.postings = fresh.postings
+            self.built_at = time.monotonic()
+            self.version = version
+
+    def apply_changes(self, changes, version=None):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.update(changes)
+            if self.built_at is None:
+                return
+            if version is not None and self.version == version - 1:
+                # This worker's own write: applied here, no rebuild needed
+                self.version = version
+            self._apply(changes)
+
+    def _apply(self, changes):
+        for product_id, product in changes.items():
+            self._remove(product_id)
+            if product and product['is_active'] is not False:
+                self._add(product_id, self._values(product), float(product['price'] or 0))
+
+    @staticmethod
+    def _values(product):
+        return {
+            'brand': {product['brand']} if product['brand'] else set(),
+            'tag': set(product['tags'] or []),
+            'price': {price_bucket(float(product['price'] or 0))},
+            'in_stock': {(product['quantity'] or 0) > 0},
+            'category': {product['category_id']},
+            'featured': {bool(product['is_featured'])},
+        }
+
+    def _add(self, product_id, values, price):
+        if self.free_slots:
+            position = self.free_slots.pop()
+            self.ids[position] = product_id
+        else:
+            position = len(self.ids)
+            self.ids.append(product_id)
+        bit = 1 << position
+        self.slots[product_id] = position
+        self.docs[product_id] = values
+        self.prices[position] = price
+        self.active |= bit
+        for facet, facet_values in values.items():
+            postings = self.postings[facet]
+            for value in facet_values:
+                postings[value] = postings.get(value, 0) | bit
+
+    def _remove(self, product_id):
+        position = self.slots.pop(product_id, None)
+        if position is None:
+            return
+        mask = ~(1 << position)
+        for facet, facet_values in self.docs.pop(product_id).items():
+            postings = self.postings[facet]
+            for value in facet_values:
+                bitmap = postings[value] & mask
+                if bitmap:
+                    postings[value] = bitmap
+                else:
+                    del postings[value]
+        del self.prices[position]
+        self.active &= mask
+        self.ids[position] = None
+        self.free_slots.append(position)
+
+    # --- Queries ---
+    def bitmap_for_ids(self, product_ids):
+        bitmap = 0
+        for product_id in product_ids:
+            position = self.slots.get(product_id)
+            if position is not None:
+                bitmap |= 1 << position
+        return bitmap
+
+    def ids_for(self, bitmap):
+        return [self.ids[position] for position in iter_bits(bitmap)]
+
+    def _any_of(self, facet, values):
+        bitmap = 0
+        for value in values:
+            bitmap |= self.postings[facet].get(value, 0)
+        return bitmap
+
+    def _price_range(self, min_price, max_price):
+        low = min_price if min_price is not None else float('-inf')
+        high = max_price if max_price is not None else float('inf')
+        bitmap = 0
+        for bucket, bucket_bitmap in self.postings['price'].items():
+            bucket_low, _, bucket_high = bucket.rstrip('+').partition('-')
+            bucket_low = float(bucket_low)
+            bucket_high = float(bucket_high) if bucket_high else float('inf')
+            if bucket_low >= low and bucket_high <= high:
+                bitmap |= bucket_bitmap
+            elif bucket_high >= low and bucket_low <= high:
+                for position in iter_bits(bucket_bitmap):
+                    if low <= self.prices[position] <= high:
+                        bitmap |= 1 << position
+        return bitmap
+
+    def facet_counts(self, base=None, brands=(), tags=(), min_price=None, max_price=None,
+                     in_stock=False, limit=20):
+        """
+        Facet counts for the products in `base` (default: all active)
+        narrowed by the facet filters. Each facet is counted with every
+        filter except its own applied, so selecting a brand still shows
+        the counts of the other brands.
+        """
+        with self.lock:
+            base = self.active if base is None else base & self.active
+            filters = {}
+            if brands:
+                filters['brand'] = self._any_of('brand', brands)
+            if tags:
+                filters['tag'] = self._any_of('tag', tags)
+            if min_price is not None or max_price is not None:
+                filters['price'] = self._price_range(min_price, max_price)
+            if in_stock:
+                filters['in_stock'] = self.postings['in_stock'].get(True, 0)
+
+            counts = {}
+            for facet in FACETS:
+                scope = base
+                for other, bitmap in filters.items():
+                    if other != facet:
+                        scope &= bitmap
+                values = {
+                    str(value).lower() if facet == 'in_stock' else value: (scope & bitmap).bit_count()
+                    for value, bitmap in self.postings[facet].items()
+                }
+                values = {value: count for value, count in values.items() if count}
+                if facet in ('brand', 'tag'):
+                    values = dict(sorted(values.items(), key=lambda item: -item[1])[:limit])
+                counts[facet] = values
+
+            matched = base
+            for bitmap in filters.values():
+                matched &= bitmap
+            counts['total'] = matched.bit_count()
+            return counts
+
+    def restrict(self, facet, values):
+        """Bitmap of active products having any of `values` for `facet`."""
+        with self.lock:
+            return self._any_of(facet, values) & self.active
+
+facet_index = FacetIndex()
+catalog_events.subscribe(facet_index.apply_changes)
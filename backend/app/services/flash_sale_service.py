@@ -0,0 +1,367 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db, redis_client
+from app.models import Product
+from app.services import catalog_events
+from app.services.catalog_service import CatalogService
+from app.services.inventory_service import InventoryService
+from app.services.job_queue import JobQueue
+
+STOCK_KEY = "flash:stock:{}"
+SOLD_KEY = "flash:sold:{}"
+PENDING_KEY = "flash:pending"
+DEFAULT_RECONCILE_INTERVAL = 30
+
+# All-or-nothing admission: [0, missing] when a counter is not initialised
+# yet, [1, short, available] when a line cannot be covered, else [2]
+ADMIT_SCRIPT = """
+local missing, short, available = {}, {}, {}
+for i, key in ipairs(KEYS) do
+    local stock = redis.call('GET', key)
+    if not stock then
+        table.insert(missing, i)
+    elseif tonumber(stock) < tonumber(ARGV[i]) then
+        table.insert(short, i)
+        table.insert(available, tonumber(stock))
+    end
+end
+if #missing > 0 then
+    return {0, missing}
+end
+if #short > 0 then
+    return {1, short, available}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('DECRBY', key, ARGV[i])
+end
+return {2}
+"""
+
+# Seed a counter from Product.quantity, less units sold but not reconciled yet
+INIT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SET', KEYS[1], tonumber(ARGV[1]) - tonumber(redis.call('GET', KEYS[2]) or '0'))
+return 1
+"""
+
+# Give units back to counters that still exist (sale not ended)
+RESTOCK_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('INCRBY', key, ARGV[i])
+    end
+end
+return 1
+"""
+
+class RedisFlashCounters:
+    """Flash-sale stock counters in Redis, shared by every worker."""
+
+    def __init__(self):
+        self._init = redis_client.register_script(INIT_SCRIPT)
+        self._admit = redis_client.register_script(ADMIT_SCRIPT)
+        self._restock = redis_client.register_script(RESTOCK_SCRIPT)
+
+    def init(self, product_id, quantity):
+        self._init(keys=[STOCK_KEY.format(product_id), SOLD_KEY.format(product_id)], args=[quantity])
+
+    def admit(self, quantities):
+        """Returns (missing product ids, {short product id: available})."""
+        product_ids = list(quantities)
+        result = self._admit(
+            keys=[STOCK_KEY.format(product_id) for product_id in product_ids],
+            args=[quantities[product_id] for product_id in product_ids]
+        )
+        if result[0] == 0:
+            return [product_ids[i - 1] for i in result[1]], {}
+        if result[0] == 1:
+            return [], {product_ids[i - 1]: available for i, available in zip(result[1], result[2])}
+        return [], {}
+
+    def restock(self, quantities):
+        product_ids = list(quantities)
+        self._restock(
+            keys=[STOCK_KEY.format(product_id) for product_id in product_ids],
+            args=[quantities[product_id] for product_id in product_ids]
+        )
+
+    def add_sold(self, quantities):
+        pipe = redis_client.pipeline()
+        for product_id, units in quantities.items():
+            pipe.incrby(SOLD_KEY.format(product_id), units)
+            pipe.sadd(PENDING_KEY, product_id)
+        pipe.execute()
+
+    def take_sold(self, product_ids=None):
+        """{product_id: units} sold since the last reconcile (of `product_ids`, else all), reset to zero."""
+        sold = {}
+        if product_ids is None:
+            product_ids = [product_id.decode() for product_id in redis_client.smembers(PENDING_KEY)]
+        for product_id in product_ids:
+            pipe = redis_client.pipeline()
+            pipe.srem(PENDING_KEY, product_id)
+            pipe.getset(SOLD_KEY.format(product_id), 0)
+            _, units = pipe.execute()
+            if units and int(units):
+                sold[product_id] = int(units)
+        return sold
+
+    def remove(self, product_id):
+        redis_client.delete(STOCK_KEY.format(product_id))
+
+class MemoryFlashCounters:
+    """
+    In-process stand-in for RedisFlashCounters (tests, single-worker
+    setups). Counters are per worker, so do not use it with several.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stock = {}
+        self.sold = {}
+
+    def init(self, product_id, quantity):
+        with self.lock:
+            self.stock.setdefault(product_id, quantity - self.sold.get(product_id, 0))
+
+    def admit(self, quantities):
+        with self.lock:
+            missing = [product_id for product_id in quantities if product_id not in self.stock]
+            if missing:
+                return missing, {}
+            short = {
+                product_id: self.stock[product_id]
+                for product_id, units in quantities.items() if self.stock[product_id] < units
+            }
+            if not short:
+                for product_id, units in quantities.items():
+                    self.stock[product_id] -= units
+            return [], short
+
+    def restock(self, quantities):
+        with self.lock:
+            for product_id, units in quantities.items():
+                if product_id in self.stock:
+                    self.stock[product_id] += units
+
+    def add_sold(self, quantities):
+        with self.lock:
+            for product_id, units in quantities.items():
+                self.sold[product_id] = self.sold.get(product_id, 0) + units
+
+    def take_sold(self, product_ids=None):
+        with self.lock:
+            if product_ids is None:
+                sold, self.sold = self.sold, {}
+                return sold
+            return {
+                product_id: self.sold.pop(product_id)
+                for product_id in product_ids if product_id in self.sold
+            }
+
+    def remove(self, product_id):
+        with self.lock:
+            self.stock.pop(product_id, None)
+
+class FlashSaleService:
+    """
+    Admission control for products flagged `flash_sale`.
+
+    Their sellable stock lives in an atomic counter (Redis, or the
+    in-process stand-in) seeded from Product.quantity. Checkout decrements
+    the counters for all flash lines at once before any row is locked, so
+    excess buyers are turned away without touching the products table.
+    Checkouts that commit add their units to a "sold" tally that a worker
+    job subtracts from Product.quantity in one UPDATE every
+    FLASH_SALE_RECONCILE_INTERVAL seconds (or `flask
+    reconcile-flash-sales`); a rolled back checkout gives its units back to the counters.
+    So Product.quantity - sold tally == counter at all times.
+
+    FLASH_SALE_STORE selects 'redis' or 'memory'; by default Redis when
+    REDIS_URL is set, otherwise flash-sale mode is off and flagged
+    products check out like any other.
+    """
+    lock = threading.Lock()
+    flagged = None
+    checked_at = 0
+    version = None
+    _counters = {}
+
+    @classmethod
+    def counters(cls):
+        kind = current_app.config.get('FLASH_SALE_STORE') or ('redis' if redis_client is not None else None)
+        if kind is None:
+            return None
+        if kind not in cls._counters:
+            stores = {'redis': RedisFlashCounters, 'memory': MemoryFlashCounters}
+            if kind not in stores:
+                raise ValueError(f'Unknown flash sale store: {kind}')
+            cls._counters[kind] = stores[kind]()
+        return cls._counters[kind]
+
+    @classmethod
+    def flagged_ids(cls):
+        """Flagged product ids, re-read when the catalog version moves."""
+        interval = current_app.config.get('CATALOG_VERSION_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        with cls.lock:
+            if cls.flagged is not None and now - cls.checked_at < interval:
+                return cls.flagged
+            cls.checked_at = now
+            version = CatalogService.version()[0]
+            if cls.flagged is None or version != cls.version:
+                cls.flagged = {
+                    row.id for row in db.session.query(Product.id).filter(Product.flash_sale == True)
+                }
+                cls.version = version
+            return cls.flagged
+
+    @classmethod
+    def apply_changes(cls, changes, version=None):
+        with cls.lock:
+            if cls.flagged is None:
+                return
+            for product_id, product in changes.items():
+                if product and product['flash_sale']:
+                    cls.flagged.add(product_id)
+                else:
+                    cls.flagged.discard(product_id)
+            if version is not None and cls.version == version - 1:
+                cls.version = version
+
+    @classmethod
+    def admit(cls, quantities):
+        """
+        Take the flash-sale lines of a checkout ({product_id: units}) off
+        their counters. Returns (admitted, short) where `short` maps each
+        product that cannot be covered to the units left; nothing is taken
+        then. Admitted units are settled when the session commits or rolls
+        back.
+        """
+        counters = cls.counters()
+        if counters is None:
+            return {}, {}
+        flagged = cls.flagged_ids()
+        admitted = {product_id: units for product_id, units in quantities.items() if product_id in flagged}
+        if not admitted:
+            return {}, {}
+
+        missing, short = counters.admit(admitted)
+        if missing:
+            # First sale of these products: seed their counters
+            for product_id, quantity in db.session.query(Product.id, Product.quantity).filter(Product.id.in_(missing)):
+                counters.init(product_id, quantity or 0)
+            missing, short = counters.admit(admitted)
+            if missing:
+                return {}, {product_id: 0 for product_id in missing}
+        if short:
+            return {}, short
+
+        pending = db.session.info.setdefault('flash_admitted', {})
+        for product_id, units in admitted.items():
+            pending[product_id] = pending.get(product_id, 0) + units
+        return admitted, {}
+
+    @classmethod
+    def cancel(cls, admitted):
+        """Give back units admitted in this session that will not be sold after all."""
+        pending = db.session.info.get('flash_admitted') or {}
+        returned = {}
+        for product_id, units in admitted.items():
+            units = min(units, pending.get(product_id, 0))
+            if units:
+                pending[product_id] -= units
+                returned[product_id] = units
+        if returned:
+            cls.counters().restock(returned)
+
+    @classmethod
+    def restock(cls, quantities):
+        """
+        Stock of {product_id: units} went back into Product.quantity
+        (released holds, admin restock); flagged products get the units on
+        their counters once the session commits.
+        """
+        if cls.counters() is None or not quantities:
+            return
+        returned = db.session.info.setdefault('flash_returned', {})
+        for product_id, units in quantities.items():
+            returned[product_id] = returned.get(product_id, 0) + units
+
+    @classmethod
+    def reconcile(cls):
+        """Subtract the sold tallies from Product.quantity; returns {product_id: units}."""
+        counters = cls.counters()
+        if counters is None:
+            return {}
+        sold = counters.take_sold()
+        if not sold:
+            return {}
+        try:
+            applied = InventoryService.move_stock(
+                [(product_id, -units, None) for product_id, units in sold.items()], 'flash_sale'
+            )
+            db.session.commit()
+            return {product_id: -units for product_id, units in applied.items()}
+        except Exception:
+            db.session.rollback()
+            counters.add_sold(sold)
+            raise
+
+    @classmethod
+    def settle(cls, product_id):
+        """
+        Subtract one product's sold tally from Product.quantity in the
+        current transaction, so its sale can end without losing units still
+        on the tally. The tally is put back if the transaction rolls back.
+        Returns the units settled.
+        """
+        counters = cls.counters()
+        if counters is None:
+            return 0
+        sold = counters.take_sold([product_id])
+        if not sold:
+            return 0
+        taken = db.session.info.setdefault('flash_taken', {})
+        for sold_id, units in sold.items():
+            taken[sold_id] = taken.get(sold_id, 0) + units
+        InventoryService.move_stock(
+            [(sold_id, -units, None) for sold_id, units in sold.items()], 'flash_sale'
+        )
+        return sold.get(product_id, 0)
+
+    @classmethod
+    def end(cls, product_id):
+        """Drop a product's counter (after unflagging and settling it)."""
+        counters = cls.counters()
+        if counters is not None:
+            counters.remove(product_id)
+
+@event.listens_for(Session, 'after_commit')
+def _settle_flash_stock(session):
+    admitted = session.info.pop('flash_admitted', None)
+    returned = session.info.pop('flash_returned', None)
+    session.info.pop('flash_taken', None)
+    if admitted:
+        FlashSaleService.counters().add_sold(admitted)
+    if returned:
+        FlashSaleService.counters().restock(returned)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_flash_stock(session):
+    admitted = session.info.pop('flash_admitted', None)
+    session.info.pop('flash_returned', None)
+    taken = session.info.pop('flash_taken', None)
+    if admitted:
+        FlashSaleService.counters().restock(admitted)
+    if taken:
+        FlashSaleService.counters().add_sold(taken)
+
+catalog_events.subscribe(FlashSaleService.apply_changes)
+JobQueue.register('reconcile_flash_sales', FlashSaleService.reconcile)
+JobQueue.every('reconcile_flash_sales', 'FLASH_SALE_RECONCILE_INTERVAL', DEFAULT_RECONCILE_INTERVAL)
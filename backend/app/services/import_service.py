@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, update
+from flask import current_app
+from app import db
+from app.models import Product, Category
+from app.services.cache_service import CacheService
+from app.services.catalog_service import CatalogService
+
+TEXT_FIELDS = ['name', 'description', 'short_description', 'sku', 'barcode', 'brand']
+DECIMAL_FIELDS = ['price', 'compare_price', 'cost_price', 'weight']
+INTEGER_FIELDS = ['quantity', 'low_stock_threshold']
+BOOLEAN_FIELDS = ['is_featured', 'is_active']
+LIST_FIELDS = ['tags', 'images']
+JSON_FIELDS = ['specifications', 'dimensions']
+
+INSERT_DEFAULTS = {'tags': [], 'images': [], 'specifications': {}}
+
+class ProductImportService:
+    """
+    Streaming product upsert for supplier catalogs (CSV or JSON lines).
+
+    Rows are validated one at a time and written in chunks: one SKU lookup,
+    one multi-row INSERT and one bulk UPDATE per chunk, committed per
+    chunk. Rows with an existing SKU update that product. Only a bounded
+    number of row errors is kept in the report, so memory stays flat
+    regardless of file size. Catalog caches are invalidated once at the end.
+    """
+
+    @staticmethod
+    def read_rows(stream, fmt):
+        """Yield (line number, raw row) from a binary stream."""
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == 'jsonl':
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, ValueError('Invalid JSON')
+        else:
+            raise ValueError(f'Unsupported import format: {fmt}')
+
+    @staticmethod
+    def import_rows(rows, chunk_size=500, max_errors=100):
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        report = {'processed': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+        categories = dict(db.session.query(Category.name, Category.id))
+        category_ids = set(categories.values())
+
+        def record_error(line_number, sku, message):
+            report['failed'] += 1
+            if len(report['errors']) < max_errors:
+                report['errors'].append({'line': line_number, 'sku': sku, 'error': message})
+
+        chunk = []
+        for line_number, raw in rows:
+            report['processed'] += 1
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                chunk.append((line_number, ProductImportService.parse_row(raw, categories, category_ids)))
+            except ValueError as e:
+                record_error(line_number, raw.get('sku') if isinstance(raw, dict) else None, str(e))
+            if len(chunk) >= chunk_size:
+                ProductImportService._write_chunk(chunk, report, record_error)
+                chunk = []
+        if chunk:
+            ProductImportService._write_chunk(chunk, report, record_error)
+
+        if report['created'] or report['updated']:
+            CatalogService.bump()
+            db.session.commit()
+            CacheService.invalidate_tags('catalog')
+
+        report['errors_truncated'] = report['failed'] > len(report['errors'])
+        return report
+
+    @staticmethod
+    def parse_row(raw, categories, category_ids):
+        if not isinstance(raw, dict):
+            raise ValueError('Row must be an object')
+        # Empty cells mean "not provided" so updates leave those columns alone
+        raw = {key.strip(): value for key, value in raw.items()
+               if key and value is not None and value != ''}
+        row = {}
+
+        for field in TEXT_FIELDS:
+            if field in raw:
+                row[field] = str(raw[field]).strip()
+        for field in DECIMAL_FIELDS:
+            if field in raw:
+                try:
+                    row[field] = Decimal(str(raw[field]))
+                except InvalidOperation:
+                    raise ValueError(f'{field} must be a number')
+                # NaN and Infinity parse but cannot be compared or stored
+                if not row[field].is_finite():
+                    raise ValueError(f'{field} must be a number')
+                if row[field] < 0:
+                    raise ValueError(f'{field} cannot be negative')
+        for field in INTEGER_FIELDS:
+            if field in raw:
+                # int() would truncate 2.5 (and accept True), so parse exactly
+                try:
+                    value = Decimal(str(raw[field]).strip())
+                except InvalidOperation:
+                    raise ValueError(f'{field} must be an integer')
+                if isinstance(raw[field], bool) or not value.is_finite() or value != value.to_integral_value():
+                    raise ValueError(f'{field} must be an integer')
+                if value < 0:
+                    raise ValueError(f'{field} cannot be negative')
+                row[field] = int(value)
+        for field in BOOLEAN_FIELDS:
+            if field in raw:
+                value = raw[field]
+                row[field] = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+        for field in LIST_FIELDS:
+            if field in raw:
+                value = raw[field]
+                row[field] = value if isinstance(value, list) else [
+                    item.strip() for item in str(value).split('|') if item.strip()
+                ]
+        for field in JSON_FIELDS:
+            if field in raw:
+                value = raw[field]
+                if isinstance(value, str):
+                    try:
+                        value = json.loads(value)
+                    except ValueError:
+                        raise ValueError(f'{field} must be JSON')
+                row[field] = value
+
+        if 'category_id' in raw:
+            if raw['category_id'] not in category_ids:
+                raise ValueError('Unknown category_id')
+            row['category_id'] = raw['category_id']
+        elif 'category' in raw:
+            if raw['category'] not in categories:
+                raise ValueError(f"Unknown category: {raw['category']}")
+            row['category_id'] = categories[raw['category']]
+
+        return row
+
+    @staticmethod
+    def _write_chunk(chunk, report, record_error):
+        # Later rows win when a SKU repeats within a chunk
+        by_sku = {}
+        without_sku = []
+        for line_number, row in chunk:
+            if row.get('sku'):
+                if row['sku'] in by_sku:
+                    record_error(by_sku[row['sku']][0], row['sku'], 'Duplicate SKU in import, superseded')
+                by_sku[row['sku']] = (line_number, row)
+            else:
+                without_sku.append((line_number, row))
+
+        existing = {
+            sku: (product_id, category_id)
+            for sku, product_id, category_id in db.session.query(
+                Product.sku, Product.id, Product.category_id
+            ).filter(Product.sku.in_(list(by_sku)))
+        } if by_sku else {}
+
+        inserts, updates, written, touched_categories = [], [], [], set()
+        now = datetime.utcnow()
+        for line_number, row in without_sku + list(by_sku.values()):
+            if row.get('sku') in existing:
+                product_id, old_category_id = existing[row['sku']]
+                touched_categories.update([old_category_id, row.get('category_id')])
+                updates.append({**row, 'id': product_id, 'updated_at': now})
+                written.append((line_number, row['sku']))
+            else:
+                missing = [field for field in ('name', 'price', 'category_id') if field not in row]
+                if missing:
+                    record_error(line_number, row.get('sku'), f"{', '.join(missing)} required for new products")
+                    continue
+                touched_categories.add(row['category_id'])
+                inserts.append({**INSERT_DEFAULTS, **row})
+                written.append((line_number, row.get('sku')))
+
+        try:
+            if inserts:
+                db.session.execute(insert(Product), inserts)
+            if updates:
+                db.session.execute(update(Product), updates)
+            # Bulk statements bypass the Product mapper events
+            touched_categories.discard(None)
+            if touched_categories:
+                Category.refresh_product_counts(touched_categories)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Product import chunk failed: {str(e)}")
+            for line_number, sku in written:
+                record_error(line_number, sku, 'Chunk could not be written')
+            return
+
+        report['created'] += len(inserts)
+        report['updated'] += len(updates)
@@ -0,0 +1,294 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, insert, case
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.models import Product, Inventory, Order, StockReservation
+from app.services import catalog_events, order_events
+from app.services.job_queue import JobQueue
+
+DEFAULT_RESERVATION_TTL = 15 * 60
+DEFAULT_RESERVATION_SWEEP_INTERVAL = 60
+
+class InventoryService:
+    """
+    Stock movements on Product.quantity (the sellable stock). Every
+    movement is written to the Inventory ledger with the quantity it left.
+
+    Checkout places holds: the units are taken off sellable stock at once
+    and a StockReservation with an expiry is recorded per line. Payment
+    commits the holds; cancellation or the expiry sweeper (a worker job
+    every RESERVATION_SWEEP_INTERVAL seconds, or `flask
+    release-reservations`) puts the units back.
+    """
+
+    @staticmethod
+    def lock_products(product_ids):
+        """
+        Load products with SELECT ... FOR UPDATE, in id order so concurrent
+        checkouts always lock rows in the same order and cannot deadlock.
+        """
+        return {
+            product.id: product for product in Product.query.filter(
+                Product.id.in_(product_ids)
+            ).order_by(Product.id).with_for_update()
+        }
+
+    @staticmethod
+    def shortages(quantities, products):
+        """Lines of {product_id: units} that `products` cannot cover."""
+        return [
+            {
+                'product_id': product_id,
+                'sku': products[product_id].sku,
+                'name': products[product_id].name,
+                'requested': requested,
+                'available': products[product_id].quantity
+            }
+            for product_id, requested in quantities.items()
+            if product_id in products and products[product_id].quantity < requested
+        ]
+
+    @staticmethod
+    def _write_ledger(products, movements, reason):
+        """Ledger rows for (product_id, change, reference_id) movements, before `products` change."""
+        running = {product_id: product.quantity for product_id, product in products.items()}
+        rows = []
+        for product_id, change, reference_id in movements:
+            running[product_id] += change
+            rows.append({
+                'product_id': product_id,
+                'change_quantity': change,
+                'new_quantity': running[product_id],
+                'reason': reason,
+                'reference_id': reference_id
+            })
+        if rows:
+            db.session.execute(insert(Inventory), rows)
+
+    @staticmethod
+    def _apply(products, quantities):
+        """Reflect a bulk quantity change in the loaded products and the change feed."""
+        for product_id, change in quantities.items():
+            product = products[product_id]
+            set_committed_value(product, 'quantity', product.quantity + change)
+        catalog_events.record(db.session, [products[product_id] for product_id in quantities])
+
+    @staticmethod
+    def _per_product(quantities):
+        """CASE expression giving each product's units; ids compare through Product.id's type."""
+        return case(*[(Product.id == product_id, units) for product_id, units in quantities.items()])
+
+    @staticmethod
+    def take_stock(quantities, reason, reference_id=None):
+        """
+        Take {product_id: units} out of stock with one conditional UPDATE
+        (quantity >= units for every row), after locking the rows.
+
+        Returns (products, shortages). With shortages, or products missing
+        from `products`, nothing is written; the caller rolls back to
+        release the locks. Where the database has no row locks (SQLite)
+        the condition still prevents overselling: if a concurrent checkout
+        got there first, this transaction is rolled back and the shortages
+        are re-read.
+        """
+        products = InventoryService.lock_products(list(quantities))
+        shortages = InventoryService.shortages(quantities, products)
+        if shortages or len(products) != len(quantities):
+            return products, shortages
+
+        units = InventoryService._per_product(quantities)
+        result = db.session.execute(
+            update(Product).where(
+                Product.id.in_(list(quantities)), Product.quantity >= units
+            ).values(quantity=Product.quantity - units),
+            execution_options={'synchronize_session': False}
+        )
+        if result.rowcount != len(quantities):
+            db.session.rollback()
+            products = {
+                product.id: product for product in
+                Product.query.filter(Product.id.in_(list(quantities))).populate_existing()
+            }
+            return products, InventoryService.shortages(quantities, products)
+
+        InventoryService._write_ledger(
+            products, [(product_id, -taken, reference_id) for product_id, taken in quantities.items()], reason
+        )
+        InventoryService._apply(products, {product_id: -taken for product_id, taken in quantities.items()})
+        return products, []
+
+    @staticmethod
+    def move_stock(movements, reason):
+        """
+        Add signed (product_id, units, reference_id) movements to stock with
+        one UPDATE, without a stock check. Products deleted since are
+        skipped. Returns {product_id: net change} of what was applied.
+        """
+        quantities = defaultdict(int)
+        for product_id, units, _ in movements:
+            quantities[product_id] += units
+        products = InventoryService.lock_products(list(quantities))
+        quantities = {product_id: units for product_id, units in quantities.items() if product_id in products}
+        if not quantities:
+            return {}
+
+        units = InventoryService._per_product(quantities)
+        db.session.execute(
+            update(Product).where(Product.id.in_(list(quantities))).values(quantity=Product.quantity + units),
+            execution_options={'synchronize_session': False}
+        )
+        InventoryService._write_ledger(
+            products, [movement for movement in movements if movement[0] in products], reason
+        )
+        InventoryService._apply(products, quantities)
+        return quantities
+
+    @staticmethod
+    def return_stock(movements, reason):
+        """Put (product_id, units, reference_id) movements back into stock."""
+        from app.services.flash_sale_service import FlashSaleService
+        FlashSaleService.restock(InventoryService.move_stock(movements, reason))
+
+    # --- Reservations ---
+    @staticmethod
+    def reservation_expiry():
+        ttl = current_app.config.get('RESERVATION_TTL', DEFAULT_RESERVATION_TTL)
+        return datetime.utcnow() + timedelta(seconds=ttl)
+
+    @staticmethod
+    def reserve(order_id, quantities, admitted=None):
+        """
+        Hold {product_id: units} for an unpaid order; same return as
+        take_stock. Lines in `admitted` were already taken off flash-sale
+        counters (FlashSaleService.admit) and leave Product.quantity to the
+        flash-sale reconcile, so their rows are not locked here.
+        """
+        admitted = admitted or {}
+        regular = {product_id: units for product_id, units in quantities.items() if product_id not in admitted}
+        products, shortages = InventoryService.take_stock(regular, 'reservation', order_id) if regular else ({}, [])
+        if shortages or len(products) != len(regular):
+            return products, shortages
+        if admitted:
+            products.update(
+                (product.id, product) for product in Product.query.filter(Product.id.in_(list(admitted)))
+            )
+            if len(products) != len(quantities):
+                return products, []
+
+        expires_at = InventoryService.reservation_expiry()
+        db.session.execute(insert(StockReservation), [
+            {'order_id': order_id, 'product_id': product_id, 'quantity': units, 'expires_at': expires_at}
+            for product_id, units in quantities.items()
+        ])
+        return products, []
+
+    @staticmethod
+    def extend_holds(order_id):
+        """Restart the expiry of an order's holds (a payment attempt is under way)."""
+        return db.session.execute(
+            update(StockReservation).where(
+                StockReservation.order_id == order_id, StockReservation.status == 'held'
+            ).values(expires_at=InventoryService.reservation_expiry()),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+
+    @staticmethod
+    def commit_reservations(order_id):
+        """
+        Payment succeeded: the order's holds become sales. Holds released
+        in the meantime (payment after expiry) are taken again if stock
+        allows. Returns the shortages of lines that could not be; call
+        before changing anything else in the session, as a lost race on
+        SQLite rolls the session back.
+        """
+        from app.services.flash_sale_service import FlashSaleService
+        reservations = StockReservation.query.filter_by(order_id=order_id).with_for_update().all()
+        released = {r.product_id: r.quantity for r in reservations if r.status == 'released'}
+        shortages = []
+        if released:
+            admitted, short = FlashSaleService.admit(released)
+            regular = {product_id: units for product_id, units in released.items() if product_id not in admitted}
+            if short:
+                shortages = [
+                    {'product_id': product_id, 'requested': released[product_id], 'available': available}
+                    for product_id, available in short.items()
+                ]
+            elif regular:
+                _, shortages = InventoryService.take_stock(regular, 'reservation', order_id)
+            if shortages:
+                FlashSaleService.cancel(admitted)
+                released = {}
+        for reservation in reservations:
+            if reservation.status == 'held' or reservation.product_id in released:
+                reservation.status = 'committed'
+        return shortages
+
+    @staticmethod
+    def release_order(order, reason='cancellation'):
+        """Give back the stock held or sold to `order` (cancellation)."""
+        reservations = StockReservation.query.filter_by(order_id=order.id).with_for_update().all()
+        if not reservations:
+            # Orders placed before reservations existed
+            InventoryService.return_stock(
+                [(item.product_id, item.quantity, order.id) for item in order.items], reason
+            )
+            return
+        active = [r for r in reservations if r.status != 'released']
+        InventoryService.return_stock([(r.product_id, r.quantity, order.id) for r in active], reason)
+        for reservation in active:
+            reservation.status = 'released'
+
+    @staticmethod
+    def release_expired(limit=500):
+        """
+        Release up to `limit` expired holds in bulk and cancel their unpaid
+        orders. Returns the number of holds released.
+        """
+        reservations = StockReservation.query.filter(
+            StockReservation.status == 'held', StockReservation.expires_at <= datetime.utcnow()
+        ).order_by(StockReservation.expires_at).limit(limit).with_for_update(skip_locked=True).all()
+        if not reservations:
+            return 0
+
+        InventoryService.return_stock(
+            [(r.product_id, r.quantity, r.order_id) for r in reservations], 'reservation_expired'
+        )
+        db.session.execute(
+            update(StockReservation).where(
+                StockReservation.id.in_([r.id for r in reservations])
+            ).values(status='released'),
+            execution_options={'synchronize_session': False}
+        )
+        cancelled = db.session.query(Order.id, Order.payment_status).filter(
+            Order.id.in_({r.order_id for r in reservations}),
+            Order.status == 'pending',
+            Order.payment_status != 'paid'
+        ).all()
+        if cancelled:
+            db.session.execute(
+                update(Order).where(Order.id.in_([row.id for row in cancelled])).values(
+                    status='cancelled', updated_at=datetime.utcnow()
+                ),
+                execution_options={'synchronize_session': False}
+            )
+            order_events.record(db.session, [
+                ('order', {'order_id': row.id, 'status': 'cancelled', 'payment_status': row.payment_status})
+                for row in cancelled
+            ])
+        db.session.commit()
+        return len(reservations)
+
+    @staticmethod
+    def release_all_expired(batch_size=500):
+        """Release expired holds batch by batch until none are left; returns the count."""
+        released = 0
+        while True:
+            count = InventoryService.release_expired(limit=batch_size)
+            if not count:
+                return released
+            released += count
+
+JobQueue.register('release_expired_reservations', InventoryService.release_all_expired)
+JobQueue.every('release_expired_reservations', 'RESERVATION_SWEEP_INTERVAL', DEFAULT_RESERVATION_SWEEP_INTERVAL)
@@ -0,0 +1,241 @@
+import importlib
+import random
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, func
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Job
+
+# Modules that register job handlers, imported before enqueueing or running jobs
+HANDLER_MODULES = [
+    'app.services.notification_service', 'app.services.inventory_service', 'app.services.flash_sale_service'
+]
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE = 30
+DEFAULT_RETRY_MAX = 3600
+DEFAULT_JOB_TIMEOUT = 600
+
+_handlers = {}
+_schedules = {}
+_scheduled_slots = {}
+
+class JobQueue:
+    """
+    Durable background jobs in the `jobs` table.
+
+    Request handlers `enqueue` a job in their own transaction, so it is
+    stored if and only if the request's writes commit. `python worker.py`
+    claims due jobs (FOR UPDATE SKIP LOCKED where supported, then a
+    conditional UPDATE so two workers never run the same job) and runs
+    them; a failed job is retried with exponential backoff and jitter
+    until max_attempts, then left as 'failed'. Jobs run at least once:
+    handlers must tolerate a repeat after a worker dies mid-job.
+
+    Jobs registered with `every` are enqueued by the workers once per
+    interval; the interval slot is the job's unique_key, so several
+    workers still enqueue a single run.
+    """
+
+    @staticmethod
+    def register(name, handler, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Run `handler(**payload)` for jobs called `name`."""
+        _handlers[name] = (handler, max_attempts)
+
+    @staticmethod
+    def every(name, interval_setting, default_interval):
+        """Run job `name` every `interval_setting` seconds (config key; 0 turns it off)."""
+        _schedules[name] = (interval_setting, default_interval)
+
+    @staticmethod
+    def enqueue_scheduled():
+        """Enqueue the runs of scheduled jobs whose interval slot has started."""
+        now = time.time()
+        for name, (interval_setting, default_interval) in _schedules.items():
+            interval = current_app.config.get(interval_setting, default_interval)
+            if not interval:
+                continue
+            slot = int(now // interval)
+            if _scheduled_slots.get(name) == slot:
+                continue
+            try:
+                JobQueue.enqueue(name, unique_key=f'schedule:{name}:{slot}')
+                db.session.commit()
+            except IntegrityError:
+                # Another worker enqueued this slot first
+                db.session.rollback()
+            _scheduled_slots[name] = slot
+
+    @staticmethod
+    def load_handlers():
+        for module in HANDLER_MODULES:
+            importlib.import_module(module)
+
+    @staticmethod
+    def enqueue(name, payload=None, delay=0, unique_key=None):
+        """
+        Add a job to the current transaction. With `unique_key`, a job
+        already stored under that key is returned instead of a new one.
+        """
+        JobQueue.load_handlers()
+        if name not in _handlers:
+            raise ValueError(f'Unknown job: {name}')
+        if unique_key:
+            existing = Job.query.filter_by(unique_key=unique_key).first()
+            if existing:
+                return existing
+
+        job = Job(
+            name=name,
+            payload=payload or {},
+            unique_key=unique_key,
+            max_attempts=_handlers[name][1],
+            run_at=datetime.utcnow() + timedelta(seconds=delay)
+        )
+        db.session.add(job)
+        return job
+
+    @staticmethod
+    def retry_delay(attempts):
+        """Seconds before retry number `attempts`: doubling from JOB_RETRY_BASE, half of it jittered."""
+        base = current_app.config.get('JOB_RETRY_BASE', DEFAULT_RETRY_BASE)
+        cap = current_app.config.get('JOB_RETRY_MAX', DEFAULT_RETRY_MAX)
+        delay = min(cap, base * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def claim(worker_id, limit):
+        """Mark up to `limit` due jobs as running for `worker_id`; returns their ids."""
+        now = datetime.utcnow()
+        ids = [
+            row.id for row in db.session.query(Job.id).filter(
+                Job.status == 'queued', Job.run_at <= now
+            ).order_by(Job.run_at).limit(limit).with_for_update(skip_locked=True)
+        ]
+        if ids:
+            db.session.execute(
+                update(Job).where(Job.id.in_(ids), Job.status == 'queued').values(
+                    status='running', locked_by=worker_id, started_at=now, attempts=Job.attempts + 1
+                ),
+                execution_options={'synchronize_session': False}
+            )
+        db.session.commit()
+        if not ids:
+            return []
+        return [
+            row.id for row in db.session.query(Job.id).filter(
+                Job.id.in_(ids), Job.status == 'running', Job.locked_by == worker_id
+            ).order_by(Job.run_at)
+        ]
+
+    @staticmethod
+    def run(job_id):
+        """Run a claimed job and record the outcome; returns True on success."""
+        job = db.session.get(Job, job_id)
+        name, payload = job.name, job.payload or {}
+        handler = _handlers.get(name, (None,))[0]
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise LookupError(f'No handler registered for job {name}')
+            handler(**payload)
+            job = db.session.get(Job, job_id)
+            job.status = 'succeeded'
+            job.last_error = None
+            succeeded = True
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.last_error = f'{type(e).__name__}: {str(e)}'
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                current_app.logger.error(f"Job {name} {job_id} failed after {job.attempts} attempts: {str(e)}")
+            else:
+                job.status = 'queued'
+                job.run_at = datetime.utcnow() + timedelta(seconds=JobQueue.retry_delay(job.attempts))
+                current_app.logger.warning(f"Job {name} {job_id} attempt {job.attempts} failed, retrying: {str(e)}")
+            succeeded = False
+
+        job.duration = time.perf_counter() - started
+        job.locked_by = None
+        if job.status != 'queued':
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return succeeded
+
+    @staticmethod
+    def requeue_stale():
+        """Put back jobs left running by a worker that died (older than JOB_TIMEOUT)."""
+        timeout = current_app.config.get('JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)
+        stale = [Job.status == 'running', Job.started_at < datetime.utcnow() - timedelta(seconds=timeout)]
+        error = 'TimeoutError: worker lost or job ran longer than JOB_TIMEOUT'
+        db.session.execute(
+            update(Job).where(*stale, Job.attempts >= Job.max_attempts).values(
+                status='failed', locked_by=None, finished_at=datetime.utcnow(), last_error=error
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        requeued = db.session.execute(
+            update(Job).where(*stale).values(
+                status='queued', locked_by=None, run_at=datetime.utcnow(), last_error=error
+            ),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        db.session.commit()
+        return requeued
+
+    @staticmethod
+    def work(worker_id, stop, batch_size=None, poll_interval=None):
+        """Claim and run jobs until the `stop` event is set."""
+        JobQueue.load_handlers()
+        batch_size = batch_size or current_app.config.get('JOB_BATCH_SIZE', 10)
+        poll_interval = poll_interval or current_app.config.get('JOB_POLL_INTERVAL', 1)
+        current_app.logger.info(f"Job worker {worker_id} started")
+        while not stop.is_set():
+            try:
+                JobQueue.requeue_stale()
+                JobQueue.enqueue_scheduled()
+                job_ids = JobQueue.claim(worker_id, batch_size)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Job worker poll error: {str(e)}")
+                job_ids = []
+            for job_id in job_ids:
+                JobQueue.run(job_id)
+            if not job_ids:
+                stop.wait(poll_interval)
+        current_app.logger.info(f"Job worker {worker_id} stopped")
+
+    @staticmethod
+    def stats():
+        """Per job name: jobs by status, attempts, run time of successful jobs and queue lag."""
+        stats = {}
+        rows = db.session.query(
+            Job.name, Job.status, func.count(Job.id), func.sum(Job.attempts),
+            func.avg(Job.duration), func.max(Job.duration), func.min(Job.run_at)
+        ).group_by(Job.name, Job.status)
+        now = datetime.utcnow()
+        for name, status, count, attempts, avg_duration, max_duration, oldest in rows:
+            entry = stats.setdefault(name, {
+                'queued': 0, 'running': 0, 'succeeded': 0, 'failed': 0, 'attempts': 0,
+                'avg_duration': None, 'max_duration': None, 'oldest_queued_seconds': None
+            })
+            entry[status] = count
+            entry['attempts'] += attempts or 0
+            if status == 'succeeded':
+                entry['avg_duration'] = round(avg_duration, 4) if avg_duration is not None else None
+                entry['max_duration'] = round(max_duration, 4) if max_duration is not None else None
+            elif status == 'queued':
+                entry['oldest_queued_seconds'] = max(0, round((now - oldest).total_seconds(), 1))
+        return stats
+
+    @staticmethod
+    def purge(older_than):
+        """Delete succeeded jobs finished more than `older_than` ago; returns the count."""
+        deleted = Job.query.filter(
+            Job.status == 'succeeded', Job.finished_at < datetime.utcnow() - older_than
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
@@ -0,0 +1,72 @@
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from app.models import Order
+from app.services.job_queue import JobQueue
+
+class NotificationService:
+    """Customer emails, sent from background jobs through the MAIL_* settings."""
+
+    @staticmethod
+    def send_email(to, subject, body):
+        """Send a plain-text email; returns False (and logs) when mail is not configured."""
+        if not current_app.config.get('MAIL_USERNAME'):
+            current_app.logger.info(f"Mail not configured, skipped '{subject}' to {to}")
+            return False
+
+        from flask_mail import Mail, Message
+        mail = current_app.extensions.get('mail') or Mail().init_app(current_app)
+        mail.send(Message(
+            subject=subject,
+            recipients=[to],
+            body=body,
+            sender=current_app.config.get('MAIL_DEFAULT_SENDER') or current_app.config['MAIL_USERNAME']
+        ))
+        return True
+
+    @staticmethod
+    def order_summary(order):
+        lines = [
+            f"  {item.product_name} x {item.quantity}: KES {float(item.total_price):,.2f}"
+            for item in order.items
+        ]
+        return '\n'.join(lines + [
+            '',
+            f"Subtotal: KES {float(order.subtotal):,.2f}",
+            f"Tax: KES {float(order.tax_amount or 0):,.2f}",
+            f"Shipping: KES {float(order.shipping_amount or 0):,.2f}",
+            f"Total: KES {float(order.total_amount):,.2f}"
+        ])
+
+    @staticmethod
+    def load_order(order_id):
+        return Order.query.options(selectinload(Order.items), selectinload(Order.user)).filter_by(id=order_id).first()
+
+    @staticmethod
+    def order_confirmation(order_id):
+        """Job: tell the customer their order was placed."""
+        order = NotificationService.load_order(order_id)
+        if not order:
+            return
+        NotificationService.send_email(
+            order.user.email,
+            f"Fixmore Mall order {order.order_number} received",
+            f"Hi {order.user.first_name},\n\nWe have received your order {order.order_number}:\n\n"
+            f"{NotificationService.order_summary(order)}\n\n"
+            "Your items are held for you until payment completes."
+        )
+
+    @staticmethod
+    def payment_receipt(order_id):
+        """Job: confirm a successful payment to the customer."""
+        order = NotificationService.load_order(order_id)
+        if not order or order.payment_status != 'paid':
+            return
+        NotificationService.send_email(
+            order.user.email,
+            f"Payment received for order {order.order_number}",
+            f"Hi {order.user.first_name},\n\nThank you, your payment for order {order.order_number} "
+            f"was received and the order is confirmed:\n\n{NotificationService.order_summary(order)}"
+        )
+
+JobQueue.register('send_order_confirmation', NotificationService.order_confirmation)
+JobQueue.register('send_payment_receipt', NotificationService.payment_receipt)
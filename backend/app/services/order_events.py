@@ -0,0 +1,132 @@
+import json
+import logging
+import queue
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import redis_client
+from app.models import Order, Payment
+
+CHANNEL_PREFIX = 'order-events:'
+# Orders whose stream is closed once this status is sent
+FINAL_STATUSES = ('delivered', 'cancelled')
+MAX_PENDING_EVENTS = 100
+
+def order_event(order):
+    return 'order', {
+        'order_id': order.id,
+        'status': order.status,
+        'payment_status': order.payment_status,
+        'tracking_number': order.tracking_number,
+        'estimated_delivery': order.estimated_delivery.isoformat() if order.estimated_delivery else None
+    }
+
+def payment_event(payment):
+    return 'payment', {
+        'order_id': payment.order_id,
+        'payment_id': payment.id,
+        'payment_method': payment.payment_method,
+        'status': payment.status,
+        'failure_reason': payment.failure_reason
+    }
+
+class OrderEventBroker:
+    """
+    Fan-out of order and payment status events to open SSE streams.
+
+    Each worker holds one subscription (a Redis pattern subscription on
+    `order-events:*`, read by one background thread) and hands events to
+    the queues of its local streams, so a waiting customer costs a queue,
+    not a Redis connection or a DB poll. Without Redis, events only reach
+    streams in the publishing process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.listener = None
+
+    def subscribe(self, order_id):
+        events = queue.Queue(MAX_PENDING_EVENTS)
+        with self.lock:
+            self.streams.setdefault(order_id, set()).add(events)
+            if redis_client is not None and self.listener is None:
+                self.listener = threading.Thread(target=self._listen, daemon=True)
+                self.listener.start()
+        return events
+
+    def unsubscribe(self, order_id, events):
+        with self.lock:
+            streams = self.streams.get(order_id)
+            if streams:
+                streams.discard(events)
+                if not streams:
+                    del self.streams[order_id]
+
+    def dispatch(self, order_id, kind, data):
+        with self.lock:
+            streams = list(self.streams.get(order_id, ()))
+        for events in streams:
+            try:
+                events.put_nowait((kind, data))
+            except queue.Full:
+                # A stream that stopped reading; it will end at its deadline
+                pass
+
+    def publish(self, events):
+        """Send [(kind, data)] to the streams of their orders, in every worker."""
+        if redis_client is None:
+            for kind, data in events:
+                self.dispatch(data['order_id'], kind, data)
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        for kind, data in events:
+            pipe.publish(CHANNEL_PREFIX + data['order_id'], json.dumps([kind, data], default=str))
+        pipe.execute()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                for message in pubsub.listen():
+                    kind, data = json.loads(message['data'])
+                    self.dispatch(data['order_id'], kind, data)
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Order event listener error: {str(e)}")
+                time.sleep(1)
+
+order_event_broker = OrderEventBroker()
+
+def record(session, events):
+    """Queue (kind, data) events for a bulk statement's rows (published on commit)."""
+    session.info.setdefault('order_events', {}).update(
+        ((kind, data['order_id'], data.get('payment_id')), (kind, data)) for kind, data in events
+    )
+
+@event.listens_for(Session, 'after_flush')
+def _collect_order_events(session, flush_context):
+    events = []
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Order) and session.is_modified(obj):
+            events.append(order_event(obj))
+        elif isinstance(obj, Payment) and session.is_modified(obj):
+            events.append(payment_event(obj))
+    if events:
+        record(session, events)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_order_events(session):
+    events = session.info.pop('order_events', None)
+    if not events:
+        return
+    # The commit already succeeded; a failed publish must not fail the request
+    try:
+        order_event_broker.publish(list(events.values()))
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Order event publish failed: {str(e)}")
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_order_events(session):
+    session.info.pop('order_events', None)
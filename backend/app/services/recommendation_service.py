@@ -0,0 +1,203 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+from scipy import sparse
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from app import db
+from app.models import Order, OrderItem, ProductRelation
+from app.services.cache_service import CacheService
+
+DEFAULT_TOP_K = 20
+FETCH_BATCH_SIZE = 50000
+WRITE_BATCH_SIZE = 5000
+# Orders updated shortly before the last watermark are read again (and
+# skipped if already counted) so late-committing transactions are not lost.
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+def order_key(order_id):
+    """64-bit key for an order id, used to skip orders already counted."""
+    order_uuid = uuid.UUID(str(order_id))
+    # The high half of a time-ordered id is mostly timestamp; use the random half
+    if order_uuid.version == 7:
+        return order_uuid.int & 0xFFFFFFFFFFFFFFFF
+    return order_uuid.int >> 64
+
+class RecommendationService:
+    """
+    "Frequently bought together" from paid orders.
+
+    Paid orders form a sparse order-by-product incidence matrix B; B.T @ B
+    is the product-by-product co-purchase matrix, whose diagonal is the
+    number of orders containing each product. Neighbours are scored by
+    cosine similarity (co-purchases over the geometric mean of the two
+    order counts) and the top K per product are stored in
+    ProductRelation for the read path.
+
+    The co-purchase matrix, product index and counted orders are persisted
+    to COPURCHASE_MATRIX_PATH, so an incremental build only reads orders
+    updated since the last watermark and rewrites the rows of the
+    products they contain. Refunds are not subtracted; run a full build
+    to drop them.
+    """
+
+    @staticmethod
+    def matrix_path():
+        return current_app.config.get('COPURCHASE_MATRIX_PATH') or os.path.join(
+            current_app.instance_path, 'copurchase.npz'
+        )
+
+    @staticmethod
+    def load_state(path):
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            size = len(data['product_ids'])
+            return {
+                'counts': sparse.csr_matrix(
+                    (data['data'], data['indices'], data['indptr']), shape=(size, size)
+                ),
+                'product_ids': data['product_ids'].tolist(),
+                'order_keys': data['order_keys'],
+                'watermark': datetime.fromisoformat(str(data['watermark'])),
+            }
+
+    @staticmethod
+    def save_state(path, counts, product_ids, order_keys, watermark):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temporary = f"{path}.tmp.npz"
+        np.savez(
+            temporary, data=counts.data, indices=counts.indices, indptr=counts.indptr,
+            product_ids=np.array(product_ids, dtype=str), order_keys=order_keys,
+            watermark=np.array(watermark.isoformat())
+        )
+        return temporary
+
+    @staticmethod
+    def fetch_items(product_index, product_ids, since=None):
+        """
+        Stream (order, product) pairs of paid orders into arrays. New
+        products are appended to `product_ids`/`product_index`.
+        """
+        stmt = select(
+            OrderItem.order_id, OrderItem.product_id, Order.updated_at
+        ).join(Order, Order.id == OrderItem.order_id).where(Order.payment_status == 'paid')
+        if since is not None:
+            stmt = stmt.where(Order.updated_at >= since)
+
+        order_chunks, product_chunks = [], []
+        watermark = since
+        result = db.session.execute(stmt.execution_options(yield_per=FETCH_BATCH_SIZE))
+        for batch in result.partitions():
+            orders = np.fromiter((order_key(row[0]) for row in batch), dtype=np.uint64, count=len(batch))
+            products = np.empty(len(batch), dtype=np.int64)
+            for position, (_, product_id, updated_at) in enumerate(batch):
+                index = product_index.get(product_id)
+                if index is None:
+                    index = product_index[product_id] = len(product_ids)
+                    product_ids.append(product_id)
+                products[position] = index
+                if updated_at is not None and (watermark is None or updated_at > watermark):
+                    watermark = updated_at
+            order_chunks.append(orders)
+            product_chunks.append(products)
+
+        if not order_chunks:
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64), watermark
+        return np.concatenate(order_chunks), np.concatenate(product_chunks), watermark
+
+    @staticmethod
+    def top_neighbours(counts, rows, top_k, min_count=1):
+        """Top-K (row, column, co-purchases, score) per row of `counts`, fully vectorized."""
+        occurrences = counts.diagonal().astype(np.float64)
+        block = counts[rows].tocoo()
+        sources = rows[block.row]
+        keep = (block.col != sources) & (block.data >= min_count)
+        sources, targets, together = sources[keep], block.col[keep], block.data[keep]
+        scores = together / np.sqrt(occurrences[sources] * occurrences[targets])
+
+        # Sort by source, best score first, then keep each source's first K
+        order = np.lexsort((-scores, sources))
+        sources, targets, together, scores = sources[order], targets[order], together[order], scores[order]
+        rank = np.arange(len(sources)) - np.searchsorted(sources, sources, side='left')
+        keep = rank < top_k
+        return sources[keep], targets[keep], together[keep], scores[keep]
+
+    @staticmethod
+    def build(full=False, top_k=DEFAULT_TOP_K, min_count=1):
+        path = RecommendationService.matrix_path()
+        state = None if full else RecommendationService.load_state(path)
+        product_ids = state['product_ids'] if state else []
+        product_index = {product_id: index for index, product_id in enumerate(product_ids)}
+        since = state['watermark'] - WATERMARK_OVERLAP if state else None
+
+        orders, products, watermark = RecommendationService.fetch_items(product_index, product_ids, since)
+        if state is not None:
+            fresh = ~np.isin(orders, state['order_keys'])
+            orders, products = orders[fresh], products[fresh]
+
+        report = {
+            'full': state is None, 'orders': 0, 'order_items': int(len(orders)),
+            'products': 0, 'relations': 0
+        }
+        if state is not None and not len(orders):
+            return report
+
+        # Incidence matrix: one row per order, 1 where the order has the product
+        new_orders, order_rows = np.unique(orders, return_inverse=True)
+        size = len(product_ids)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(products), dtype=np.int32), (order_rows, products)),
+            shape=(len(new_orders), size)
+        )
+        incidence.data[:] = 1
+        counts = (incidence.T @ incidence).tocsr()
+        if state is not None:
+            previous = state['counts']
+            previous.resize((size, size))
+            counts = (previous + counts).tocsr()
+            order_keys = np.union1d(state['order_keys'], new_orders)
+        else:
+            order_keys = new_orders
+
+        rows = np.unique(products)
+        sources, targets, together, scores = RecommendationService.top_neighbours(
+            counts, rows, top_k, min_count
+        )
+
+        temporary = RecommendationService.save_state(
+            path, counts, product_ids, order_keys, watermark or datetime.utcnow()
+        )
+        try:
+            if state is None:
+                db.session.execute(delete(ProductRelation))
+            else:
+                touched = [product_ids[row] for row in rows]
+                for start in range(0, len(touched), 500):
+                    db.session.execute(
+                        delete(ProductRelation).where(ProductRelation.product_id.in_(touched[start:start + 500]))
+                    )
+            for start in range(0, len(sources), WRITE_BATCH_SIZE):
+                end = start + WRITE_BATCH_SIZE
+                db.session.execute(insert(ProductRelation), [
+                    {
+                        'product_id': product_ids[source],
+                        'related_product_id': product_ids[target],
+                        'co_purchase_count': int(count),
+                        'score': float(score),
+                    }
+                    for source, target, count, score in zip(
+                        sources[start:end], targets[start:end], together[start:end], scores[start:end]
+                    )
+                ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            os.remove(temporary)
+            raise
+        os.replace(temporary, path)
+
+        CacheService.invalidate_tags('related')
+        report.update(orders=int(len(new_orders)), products=int(len(rows)), relations=int(len(sources)))
+        return report
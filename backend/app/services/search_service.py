@@ -0,0 +1,130 @@
+import re
+from sqlalchemy import select, text, literal_column, func, or_
+from sqlalchemy.exc import OperationalError
+from flask import current_app
+from app import db
+from app.models import Product
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+MAX_SEARCH_TOKENS = 8
+
+# Postgres: weighted document shared by the GIN expression index and the
+# search query, so the planner can match the two expressions.
+PG_SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce({p}name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({p}brand, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({p}tags::text, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce({p}description, '')), 'C')"
+)
+PG_INDEX_NAME = 'ix_products_search_vector'
+
+# SQLite: external-content FTS5 table kept current by triggers on products.
+SQLITE_INDEX_TABLE = 'product_search'
+SQLITE_COLUMNS = 'name, brand, tags, description'
+SQLITE_RANK = f"bm25({SQLITE_INDEX_TABLE}, 10.0, 8.0, 4.0, 1.0)"
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_INDEX_TABLE} USING fts5("
+    f"{SQLITE_COLUMNS}, content='products', content_rowid='rowid', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS products_search_ai AFTER INSERT ON products BEGIN "
+    f"INSERT INTO {SQLITE_INDEX_TABLE}(rowid, {SQLITE_COLUMNS}) "
+    f"VALUES (new.rowid, new.name, new.brand, new.tags, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS products_search_ad AFTER DELETE ON products BEGIN "
+    f"INSERT INTO {SQLITE_INDEX_TABLE}({SQLITE_INDEX_TABLE}, rowid, {SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.rowid, old.name, old.brand, old.tags, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS products_search_au AFTER UPDATE ON products BEGIN "
+    f"INSERT INTO {SQLITE_INDEX_TABLE}({SQLITE_INDEX_TABLE}, rowid, {SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.rowid, old.name, old.brand, old.tags, old.description); "
+    f"INSERT INTO {SQLITE_INDEX_TABLE}(rowid, {SQLITE_COLUMNS}) "
+    f"VALUES (new.rowid, new.name, new.brand, new.tags, new.description); END",
+]
+
+class SearchService:
+    """
+    Full-text product search over name, brand, tags and description.
+
+    Postgres uses a GIN index on a weighted tsvector expression, SQLite an
+    FTS5 table maintained by triggers, so both stay current on every product
+    write without application code. Other databases fall back to ILIKE.
+    """
+
+    _ready = {}
+
+    @staticmethod
+    def tokenize(term):
+        return [t.lower() for t in TOKEN_PATTERN.findall(term or '')][:MAX_SEARCH_TOKENS]
+
+    @staticmethod
+    def search(query, term):
+        """Restrict a Product query to matches for `term`, best matches first."""
+        tokens = SearchService.tokenize(term)
+        if not tokens:
+            return query
+
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            vector = literal_column(f"({PG_SEARCH_VECTOR.format(p='products.')})")
+            tsquery = func.to_tsquery('simple', ' & '.join(f'{t}:*' for t in tokens))
+            return query.filter(vector.op('@@')(tsquery)).order_by(
+                func.ts_rank(vector, tsquery).desc()
+            )
+
+        if dialect == 'sqlite' and SearchService.ensure_index():
+            match = ' '.join(f'"{t}"*' for t in tokens)
+            matches = select(
+                literal_column('rowid').label('rowid'),
+                literal_column(SQLITE_RANK).label('rank')
+            ).select_from(text(SQLITE_INDEX_TABLE)).where(
+                text(f"{SQLITE_INDEX_TABLE} MATCH :search_match").bindparams(search_match=match)
+            ).subquery()
+            return query.join(
+                matches, literal_column('products.rowid') == matches.c.rowid
+            ).order_by(matches.c.rank)
+
+        search_term = f"%{term}%"
+        return query.filter(
+            or_(
+                Product.name.ilike(search_term),
+                Product.description.ilike(search_term),
+                Product.tags.contains([term])
+            )
+        )
+
+    @staticmethod
+    def ensure_index():
+        """Create the SQLite FTS5 index on first use; returns False if unavailable."""
+        url = str(db.engine.url)
+        if url not in SearchService._ready:
+            try:
+                SearchService.build_index()
+                SearchService._ready[url] = True
+            except OperationalError as e:
+                current_app.logger.warning(f"Full-text search unavailable, using ILIKE: {str(e)}")
+                SearchService._ready[url] = False
+        return SearchService._ready[url]
+
+    @staticmethod
+    def build_index(rebuild=False):
+        """Create the search index if missing, repopulating it when new or `rebuild` is set."""
+        dialect = db.engine.dialect.name
+        with db.engine.begin() as conn:
+            if dialect == 'postgresql':
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {PG_INDEX_NAME} ON products "
+                    f"USING GIN (({PG_SEARCH_VECTOR.format(p='')}))"
+                ))
+                if rebuild:
+                    conn.execute(text(f"REINDEX INDEX {PG_INDEX_NAME}"))
+            elif dialect == 'sqlite':
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                    {'name': SQLITE_INDEX_TABLE}
+                ).first()
+                for statement in SQLITE_SCHEMA:
+                    conn.execute(text(statement))
+                # Rowids of products are not stable across VACUUM, so a
+                # rebuild is also the repair path for a drifted index.
+                if rebuild or not exists:
+                    conn.execute(text(
+                        f"INSERT INTO {SQLITE_INDEX_TABLE}({SQLITE_INDEX_TABLE}) VALUES ('rebuild')"
+                    ))
@@ -0,0 +1,254 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app
+from app import db
+from app.models import Product, Category, Order, OrderItem
+from app.services import catalog_events
+from app.services.catalog_service import CatalogService
+
+# Prefixes matching more keys than this answer from precomputed top lists;
+# any other prefix scans its (short) range of the sorted key array.
+SCAN_LIMIT = 256
+MAX_SUGGESTIONS = 10
+FEATURED_BOOST = 2.0
+INDEXED_FIELDS = ('id', 'name', 'brand', 'tags', 'category_id', 'is_featured')
+
+def normalize(text):
+    return ' '.join(re.findall(r'\w+', (text or '').lower()))
+
+class SuggestIndex:
+    """
+    Typeahead over product names, brands, tags and category names.
+
+    Every suggestion is indexed under its normalized text and, for product
+    names, under each word start ("galaxy s23" for "Samsung Galaxy S23").
+    Keys live in one sorted array, so a prefix is a bisect range; the
+    heaviest suggestions for broad prefixes are precomputed. Weights come
+    from units sold on paid orders plus a boost for featured products.
+
+    Queries never touch the database once the index is built. Product
+    writes that change an indexed field arrive through the change feed and
+    are compiled into new arrays on a background thread, then swapped in;
+    queries keep using the previous arrays meanwhile. Writes made by other
+    workers are picked up by a background version check every
+    CATALOG_VERSION_CHECK_INTERVAL seconds, which rebuilds when the
+    version moved without this worker seeing the change, and every
+    SUGGEST_INDEX_TTL seconds (sales weights).
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.refresher = None
+        self.built_at = None
+        self.checked_at = 0
+        self.version = None
+        self.products = {}        # product id -> indexed fields
+        self.categories = {}      # category id -> name
+        self.sales = {}           # product id -> units sold
+        self.dirty = False
+        self.epoch = 0            # bumped by rebuilds; stale background compiles are dropped
+        self.compiler = None
+        self.suggestions = []
+        self.keys = []
+        self.refs = []
+        self.top = {}
+
+    # --- Maintenance ---
+    def ensure_fresh(self):
+        """Build on first use; after that, start a background refresh when one is due."""
+        if self.built_at is None:
+            with self.build_lock:
+                if self.built_at is None:
+                    self.rebuild(CatalogService.version()[0])
+            return
+        interval = current_app.config.get('CATALOG_VERSION_CHECK_INTERVAL', 5)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.checked_at < interval or self.refresher is not None:
+                return
+            self.checked_at = now
+            self.refresher = threading.Thread(
+                target=self._refresh, args=(current_app._get_current_object(),), daemon=True
+            )
+            self.refresher.start()
+
+    def _refresh(self, app):
+        """Background thread: rebuild if the catalog version moved or the TTL passed."""
+        try:
+            with app.app_context():
+                ttl = app.config.get('SUGGEST_INDEX_TTL', 300)
+                version = CatalogService.version()[0]
+                if version != self.version or time.monotonic() - self.built_at > ttl:
+                    with self.build_lock:
+                        self.rebuild(version)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Suggest index refresh failed: {str(e)}")
+        finally:
+            with self.lock:
+                self.refresher = None
+
+    def rebuild(self, version=None):
+        rows = db.session.query(
+            Product.id, Product.name, Product.brand, Product.tags,
+            Product.category_id, Product.is_featured
+        ).filter(Product.is_active == True).yield_per(1000)
+        products = {row.id: row._asdict() for row in rows}
+        categories = dict(
+            db.session.query(Category.id, Category.name).filter(Category.is_active == True)
+        )
+        sales = dict(
+            db.session.query(OrderItem.product_id, db.func.sum(OrderItem.quantity))
+            .join(Order, Order.id == OrderItem.order_id)
+            .filter(Order.payment_status == 'paid')
+            .group_by(OrderItem.product_id)
+        )
+
+        compiled = self._compile(products, categories, sales)
+        with self.lock:
+            self.products = products
+            self.categories = categories
+            self.sales = sales
+            self.suggestions, self.keys, self.refs, self.top = compiled
+            self.dirty = False
+            self.epoch += 1
+            self.built_at = time.monotonic()
+            self.version = version
+
+    def apply_changes(self, changes, version=None):
+        with self.lock:
+            if self.built_at is None:
+                return
+            if version is not None and self.version == version - 1:
+                # This worker's own write: applied here, no rebuild needed
+                self.version = version
+            changed = False
+            for product_id, product in changes.items():
+                if product and product['is_active'] is not False:
+                    indexed = {field: product[field] for field in INDEXED_FIELDS}
+                    # Stock and price moves (every checkout) leave the index as it is
+                    if self.products.get(product_id) != indexed:
+                        self.products[product_id] = indexed
+                        changed = True
+                elif self.products.pop(product_id, None) is not None:
+                    changed = True
+            if changed:
+                self.dirty = True
+                if self.compiler is None:
+                    self.compiler = threading.Thread(target=self._compile_pending, daemon=True)
+                    self.compiler.start()
+
+    def _compile_pending(self):
+        """Background thread: compile the changed products and swap the arrays in, until none are left."""
+        while True:
+            with self.lock:
+                if not self.dirty:
+                    self.compiler = None
+                    return
+                self.dirty = False
+                epoch = self.epoch
+                products, categories, sales = dict(self.products), self.categories, self.sales
+            try:
+                compiled = self._compile(products, categories, sales)
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Suggest index compile failed: {str(e)}")
+                with self.lock:
+                    self.compiler = None
+                return
+            with self.lock:
+                if self.epoch == epoch:
+                    self.suggestions, self.keys, self.refs, self.top = compiled
+
+    @staticmethod
+    def _weight(product, sales):
+        weight = math.log1p(float(sales.get(product['id']) or 0)) + 1
+        return weight + FEATURED_BOOST if product['is_featured'] else weight
+
+    @staticmethod
+    def _compile(products, categories, sales):
+        """(suggestions, keys, refs, top) arrays for the given products."""
+        suggestions = []
+        pairs = []
+        groups = {'brand': {}, 'tag': {}, 'category': {}}
+
+        for product in products.values():
+            weight = SuggestIndex._weight(product, sales)
+            name = normalize(product['name'])
+            if name:
+                index = len(suggestions)
+                suggestions.append((weight, {'type': 'product', 'id': product['id'], 'text': product['name']}))
+                words = name.split(' ')
+                for position in range(len(words)):
+                    pairs.append((' '.join(words[position:]), index))
+            values = {
+                'brand': [product['brand']] if product['brand'] else [],
+                'tag': product['tags'] or [],
+                'category': [product['category_id']] if product['category_id'] in categories else [],
+            }
+            for kind, kind_values in values.items():
+                for value in kind_values:
+                    groups[kind][value] = groups[kind].get(value, 0) + weight
+
+        for kind, weights in groups.items():
+            for value, weight in weights.items():
+                if kind == 'category':
+                    suggestion = {'type': kind, 'id': value, 'text': categories[value]}
+                else:
+                    suggestion = {'type': kind, 'text': value}
+                key = normalize(suggestion['text'])
+                if key:
+                    pairs.append((key, len(suggestions)))
+                    suggestions.append((weight, suggestion))
+
+        pairs.sort()
+        keys = [key for key, _ in pairs]
+        refs = [index for _, index in pairs]
+
+        top = {}
+        SuggestIndex._precompute(suggestions, keys, refs, top, 0, len(keys), 0)
+        return suggestions, keys, refs, top
+
+    @staticmethod
+    def _precompute(suggestions, keys, refs, top, low, high, depth):
+        """Store top lists for the prefixes of keys[low:high], which share `depth` characters."""
+        if depth:
+            top[keys[low][:depth]] = SuggestIndex._best(suggestions, refs[low:high], MAX_SUGGESTIONS)
+        if high - low <= SCAN_LIMIT:
+            return
+        position = low
+        while position < high:
+            key = keys[position]
+            if len(key) <= depth:
+                position += 1
+                continue
+            end = bisect_left(keys, key[:depth + 1] + '\uffff', position, high)
+            SuggestIndex._precompute(suggestions, keys, refs, top, position, end, depth + 1)
+            position = end
+
+    @staticmethod
+    def _best(suggestions, indexes, limit):
+        return heapq.nlargest(limit, set(indexes), key=lambda index: suggestions[index][0])
+
+    # --- Queries ---
+    def suggest(self, term, limit=MAX_SUGGESTIONS):
+        prefix = normalize(term)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        with self.lock:
+            suggestions, keys, refs, top = self.suggestions, self.keys, self.refs, self.top
+        if prefix in top:
+            indexes = top[prefix][:limit]
+        else:
+            low = bisect_left(keys, prefix)
+            high = bisect_left(keys, prefix + '\uffff', low)
+            indexes = self._best(suggestions, refs[low:high], limit)
+        return [suggestions[index][1] for index in indexes]
+
+suggest_index = SuggestIndex()
+catalog_events.subscribe(suggest_index.apply_changes)
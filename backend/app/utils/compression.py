@@ -0,0 +1,121 @@
+import gzip
+import re
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'application/manifest+json'
+)
+DEFAULT_MIN_SIZE = 500
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+MAX_FILE_SIZE = 5 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Encoded variants carry their own strong validator ("<etag>-gzip"), which
+# the views know nothing about; conditional requests are compared against
+# the base ETag.
+ENCODED_ETAG = re.compile(r'-(?:gzip|br)"')
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+class CompressedCache:
+    """LRU of encoded bodies keyed by (ETag, encoding), bounded by total size."""
+
+    def __init__(self, max_bytes):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is not None:
+                self.entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+def negotiate_encoding():
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+def init_compression(app):
+    """
+    Compress responses when no proxy in front of gunicorn does it (Render).
+
+    gzip or brotli is negotiated from Accept-Encoding. Small bodies,
+    non-text types, streamed responses and bodies that already have a
+    Content-Encoding are left alone. Responses with an ETag (cached API
+    responses, static files) have their encoded variant kept in an LRU, so
+    each version is compressed once per worker.
+    """
+    cache = CompressedCache(app.config.get('COMPRESS_CACHE_BYTES', DEFAULT_CACHE_BYTES))
+    min_size = app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+
+    @app.before_request
+    def strip_encoded_etags():
+        if_none_match = request.environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and ENCODED_ETAG.search(if_none_match):
+            request.environ['HTTP_IF_NONE_MATCH'] = ENCODED_ETAG.sub('"', if_none_match)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if response.direct_passthrough:
+            # File responses: only read files small enough to hold in memory
+            if not response.content_length or response.content_length > MAX_FILE_SIZE:
+                return response
+            response.direct_passthrough = False
+        elif response.is_streamed:
+            return response
+
+        length = response.content_length
+        if length is not None and length < min_size:
+            return response
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (etag, encoding) if etag and not weak else None
+        body = cache.get(key) if key else None
+        if body is None:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            body = compress(data, encoding)
+            if key:
+                cache.put(key, body)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        return response
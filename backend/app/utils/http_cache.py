@@ -0,0 +1,41 @@
+import hashlib
+import json
+from flask import request, current_app
+
+DEFAULT_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=300'
+
+def make_etag(*parts):
+    """Strong validator for a representation built from `parts`."""
+    raw = json.dumps(parts, default=str, separators=(',', ':'))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def latest(*timestamps):
+    timestamps = [ts for ts in timestamps if ts is not None]
+    return max(timestamps) if timestamps else None
+
+def is_not_modified(etag, last_modified=None):
+    """Evaluate If-None-Match (which takes precedence) or If-Modified-Since."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        since = request.if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def add_cache_headers(response, etag, last_modified=None, surrogate_keys=(), cache_control=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control or current_app.config.get(
+        'CATALOG_CACHE_CONTROL', DEFAULT_CACHE_CONTROL
+    )
+    if surrogate_keys:
+        response.headers['Surrogate-Key'] = ' '.join(surrogate_keys)
+    return response
+
+def not_modified_response(etag, last_modified=None, surrogate_keys=(), cache_control=None):
+    """A 304 carrying the cache headers if the client's copy is current, else None."""
+    if not is_not_modified(etag, last_modified):
+        return None
+    response = current_app.response_class(status=304)
+    return add_cache_headers(response, etag, last_modified, surrogate_keys, cache_control)
@@ -0,0 +1,155 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, make_response, current_app
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+DEFAULT_IDEMPOTENCY_TTL = 24 * 3600
+DEFAULT_IDEMPOTENCY_WAIT = 30
+DEFAULT_IDEMPOTENCY_LOCK_TIMEOUT = 300  # gunicorn timeout: no request runs longer
+MAX_POLL_INTERVAL = 0.5
+
+def request_fingerprint():
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _claim(user_id, key, fingerprint):
+    """
+    One attempt at taking the key for this request. Returns ('owner', id),
+    ('replay', record), ('mismatch', None), ('busy', None) or ('retry', None)
+    after losing a race.
+    """
+    now = datetime.utcnow()
+    ttl = timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL', DEFAULT_IDEMPOTENCY_TTL))
+    lock_timeout = current_app.config.get('IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_IDEMPOTENCY_LOCK_TIMEOUT)
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+
+    if record is None:
+        record = IdempotencyKey(
+            user_id=user_id, key=key, fingerprint=fingerprint, status='in_progress',
+            locked_at=now, expires_at=now + ttl
+        )
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return 'owner', record.id
+        except IntegrityError:
+            db.session.rollback()
+            return 'retry', None
+
+    expired = record.expires_at <= now
+    abandoned = record.status == 'in_progress' and record.locked_at <= now - timedelta(seconds=lock_timeout)
+    if expired or abandoned:
+        # Take the key over, unless another request just did
+        taken = db.session.execute(
+            update(IdempotencyKey).where(
+                IdempotencyKey.id == record.id, IdempotencyKey.locked_at == record.locked_at
+            ).values(
+                fingerprint=fingerprint, status='in_progress', locked_at=now, expires_at=now + ttl,
+                response_status=None, response_body=None, response_type=None
+            ),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        db.session.commit()
+        return ('owner', record.id) if taken else ('retry', None)
+
+    if record.fingerprint != fingerprint:
+        return 'mismatch', None
+    if record.status == 'completed':
+        return 'replay', record
+    return 'busy', None
+
+def _finish(record_id, response):
+    """Store the response for replay; 5xx responses free the key so a retry runs again."""
+    if response is None or response.status_code >= 500:
+        IdempotencyKey.query.filter_by(id=record_id).delete(synchronize_session=False)
+    else:
+        ttl = current_app.config.get('IDEMPOTENCY_TTL', DEFAULT_IDEMPOTENCY_TTL)
+        IdempotencyKey.query.filter_by(id=record_id).update({
+            'status': 'completed',
+            'response_status': response.status_code,
+            'response_body': response.get_data(as_text=True),
+            'response_type': response.mimetype,
+            'expires_at': datetime.utcnow() + timedelta(seconds=ttl)
+        }, synchronize_session=False)
+    db.session.commit()
+
+def idempotent(f):
+    """
+    Honour an Idempotency-Key header (requires jwt_required above it).
+
+    The first request with a key runs and its response is stored for
+    IDEMPOTENCY_TTL; retries with the same key and body get that response
+    replayed (with Idempotent-Replayed: true) instead of running again. A
+    duplicate arriving while the first is still running waits up to
+    IDEMPOTENCY_WAIT seconds for its outcome, then gets 409. Reusing a key
+    for a different request is rejected with 422. Requests without the
+    header are not affected.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = get_jwt_identity()
+        fingerprint = request_fingerprint()
+        deadline = time.monotonic() + current_app.config.get('IDEMPOTENCY_WAIT', DEFAULT_IDEMPOTENCY_WAIT)
+        interval = 0.05
+        while True:
+            outcome, value = _claim(user_id, key, fingerprint)
+            if outcome == 'owner':
+                break
+            if outcome == 'replay':
+                response = current_app.response_class(
+                    value.response_body, status=value.response_status, mimetype=value.response_type
+                )
+                response.headers['Idempotent-Replayed'] = 'true'
+                db.session.rollback()
+                return response
+            if outcome == 'mismatch':
+                db.session.rollback()
+                return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+            if outcome in ('busy', 'retry'):
+                # End the read transaction so the next look sees the other request's commit
+                db.session.rollback()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 409
+                time.sleep(min(interval, remaining))
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+        response = None
+        try:
+            response = make_response(f(*args, **kwargs))
+        finally:
+            try:
+                db.session.rollback()
+                _finish(value, response)
+            except Exception as e:
+                # The request itself went through; losing the stored copy only loses the replay
+                db.session.rollback()
+                current_app.logger.error(f"Idempotency-Key store error: {str(e)}")
+        return response
+    return decorated_function
+
+def purge_expired_keys():
+    """Delete stored responses past their expiry; returns the count."""
+    deleted = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
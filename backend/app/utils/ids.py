@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import uuid
+from flask import current_app, has_app_context
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator, CHAR, BINARY, LargeBinary
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = [0, 0]  # [unix ms, 12-bit sequence]
+
+def uuid7():
+    """
+    Time-ordered UUID (RFC 9562 version 7): 48-bit Unix milliseconds, then
+    a 12-bit sequence that keeps ids from one process increasing within
+    the same millisecond, then 62 random bits.
+    """
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, seq = _uuid7_last
+        if ms > last_ms:
+            seq = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            # Same millisecond (or the clock went back): count on from the last id
+            ms, seq = last_ms, seq + 1
+            if seq > 0xFFF:
+                ms, seq = ms + 1, 0
+        _uuid7_last[:] = [ms, seq]
+    rand = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (seq << 64) | (0x2 << 62) | rand)
+
+ID_STRATEGIES = {
+    'uuid7': uuid7,
+    'uuid4': uuid.uuid4,
+}
+
+def generate_id():
+    """New primary key in the ID_STRATEGY configured ('uuid7' by default)."""
+    strategy = current_app.config.get('ID_STRATEGY', 'uuid7') if has_app_context() else 'uuid7'
+    if strategy not in ID_STRATEGIES:
+        raise ValueError(f'Unknown ID strategy: {strategy}')
+    return str(ID_STRATEGIES[strategy]())
+
+class GUID(TypeDecorator):
+    """
+    UUID column holding the canonical string form in Python.
+
+    Stored as the native uuid type on Postgres and as 16 raw bytes
+    elsewhere, instead of a 36-character string. Malformed ids bind as
+    NULL, so lookups by them find nothing rather than raising.
+    """
+    impl = CHAR(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(LargeBinary(16))
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(str(value))
+            except ValueError:
+                return None
+        return str(value) if dialect.name == 'postgresql' else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        return str(uuid.UUID(bytes=bytes(value)))
+
+def guid_columns(metadata):
+    """{table name: [GUID column names]} for every mapped table."""
+    columns = {}
+    for table in metadata.sorted_tables:
+        names = [column.name for column in table.columns if isinstance(column.type, GUID)]
+        if names:
+            columns[table.name] = names
+    return columns
+
+def migrate_id_columns(engine, metadata):
+    """
+    Convert id columns created as 36-character strings to GUID storage.
+    Existing ids keep their value; only new rows get time-ordered ids.
+    Safe to run again. Returns {table name: columns altered} on Postgres,
+    {table name: values rewritten} on SQLite.
+    """
+    columns = guid_columns(metadata)
+    if engine.dialect.name == 'postgresql':
+        return _migrate_postgresql(engine, columns)
+    if engine.dialect.name == 'sqlite':
+        return _migrate_sqlite(engine, columns)
+    raise ValueError(f'No id migration for {engine.dialect.name}')
+
+def _migrate_postgresql(engine, columns):
+    """ALTER the varchar columns to uuid, with the foreign keys dropped meanwhile."""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    pending = {
+        table: [
+            column['name'] for column in inspector.get_columns(table)
+            if column['name'] in names and not isinstance(column['type'], postgresql.UUID)
+        ]
+        for table, names in columns.items() if table in tables
+    }
+    pending = {table: names for table, names in pending.items() if names}
+    if not pending:
+        return {}
+
+    foreign_keys = [
+        (table, fk) for table in columns if table in tables
+        for fk in inspector.get_foreign_keys(table)
+        if set(fk['constrained_columns']) & set(columns[table])
+    ]
+    with engine.begin() as conn:
+        for table, fk in foreign_keys:
+            conn.execute(text(f'ALTER TABLE "{table}" DROP CONSTRAINT "{fk["name"]}"'))
+        for table, names in pending.items():
+            conn.execute(text(f'ALTER TABLE "{table}" ' + ', '.join(
+                f'ALTER COLUMN "{name}" TYPE uuid USING "{name}"::uuid' for name in names
+            )))
+        for table, fk in foreign_keys:
+            ondelete = fk.get('options', {}).get('ondelete')
+            conn.execute(text(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{fk["name"]}" '
+                f'FOREIGN KEY ({", ".join(fk["constrained_columns"])}) '
+                f'REFERENCES "{fk["referred_table"]}" ({", ".join(fk["referred_columns"])})'
+                + (f' ON DELETE {ondelete}' if ondelete else '')
+            ))
+    return {table: len(names) for table, names in pending.items()}
+
+def _guid_bytes(value):
+    return uuid.UUID(value).bytes
+
+def _migrate_sqlite(engine, columns):
+    """
+    Rewrite string ids as 16 bytes in place, one UPDATE per column. SQLite
+    keeps a blob in a column declared VARCHAR as is, so no table rebuild
+    is needed.
+    """
+    tables = set(inspect(engine).get_table_names())
+    converted = {}
+    with engine.begin() as conn:
+        conn.connection.driver_connection.create_function('guid_bytes', 1, _guid_bytes, deterministic=True)
+        for table, names in columns.items():
+            if table not in tables:
+                continue
+            for name in names:
+                rows = conn.execute(text(
+                    f'UPDATE "{table}" SET "{name}" = guid_bytes("{name}") WHERE typeof("{name}") = \'text\''
+                )).rowcount
+                if rows:
+                    converted[table] = converted.get(table, 0) + rows
+    return converted
@@ -0,0 +1,117 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from sqlalchemy import or_, and_
+from app import db
+
+MAX_PER_PAGE = 100
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError
+        return data
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def count_query(query, mode):
+    """Exact COUNT(*) for `exact`, a planner estimate on Postgres for `approx`."""
+    query = query.order_by(None)
+    if mode == 'approx' and db.engine.dialect.name == 'postgresql':
+        compiled = query.statement.compile(dialect=db.engine.dialect)
+        plan = db.session.connection().exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+        ).scalar()
+        return int(plan[0]['Plan']['Plan Rows'])
+    return query.count()
+
+def paginate(query, model, default_per_page=20, ranked=False):
+    """
+    Paginate `query` using the request's query string.
+
+    Without a `cursor` argument this is the classic page/per_page OFFSET
+    mode. Passing `cursor` (empty for the first page) switches to keyset
+    pagination on (created_at, id) and returns `next_cursor`; `ranked`
+    queries keep their own order with id as the tiebreaker, and their
+    cursor carries an offset plus the last id, so rows pushed down by
+    inserts are not repeated (up to a page of them). Totals are opt-in in
+    cursor mode (`total=exact` or `total=approx`) and can be skipped in
+    offset mode with `total=none`.
+
+    Returns (items, meta) where meta is merged into the JSON response.
+    Raises ValueError for a malformed cursor.
+    """
+    per_page = min(max(request.args.get('per_page', default_per_page, type=int), 1), MAX_PER_PAGE)
+    cursor = request.args.get('cursor')
+
+    if ranked:
+        # Ties in rank (or no rank at all) would otherwise come back in any order
+        query = query.order_by(model.id.desc())
+    else:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+
+    if cursor is None:
+        page = max(request.args.get('page', 1, type=int), 1)
+        total_mode = request.args.get('total', 'exact')
+        if total_mode == 'exact':
+            result = query.paginate(page=page, per_page=per_page, error_out=False)
+            return result.items, {'total': result.total, 'pages': result.pages, 'current_page': page}
+
+        total = count_query(query, total_mode) if total_mode == 'approx' else None
+        items = query.limit(per_page).offset((page - 1) * per_page).all()
+        return items, {
+            'total': total,
+            'pages': -(-total // per_page) if total is not None else None,
+            'current_page': page
+        }
+
+    total_mode = request.args.get('total')
+    total = count_query(query, total_mode) if total_mode in ('exact', 'approx') else None
+    position = decode_cursor(cursor) if cursor else {}
+
+    try:
+        if ranked:
+            offset = max(int(position.get('o', 0)), 0)
+            last_id = str(position['i']) if 'i' in position else None
+        elif position:
+            created_at = datetime.fromisoformat(position['c'])
+            last_id = str(position['i'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+    if ranked:
+        rows = query.limit(2 * per_page + 1).offset(offset).all()
+        seen = next((index for index, row in enumerate(rows[:per_page]) if row.id == last_id), -1) if last_id else -1
+        offset += seen + 1
+        rows = rows[seen + 1:seen + 2 + per_page]
+        next_position = None
+        if rows[per_page - 1:per_page]:
+            next_position = {'o': offset + per_page, 'i': rows[per_page - 1].id}
+    else:
+        if position:
+            query = query.filter(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < last_id)
+            ))
+        rows = query.limit(per_page + 1).all()
+        next_position = None
+        if rows[per_page - 1:per_page]:
+            last = rows[per_page - 1]
+            next_position = {'c': last.created_at.isoformat(), 'i': last.id}
+
+    has_more = len(rows) > per_page
+    meta = {
+        'next_cursor': encode_cursor(next_position) if has_more else None,
+        'has_more': has_more,
+        'per_page': per_page
+    }
+    if total is not None:
+        meta['total'] = total
+    return rows[:per_page], meta
@@ -1,8 +1,18 @@
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt_identity, get_jwt
 from functools import wraps
-from flask import jsonify
+from flask import jsonify, current_app, has_request_context
+from app import db, redis_client
 import re
+import time
+
+TOKEN_VERSION_REDIS_TTL = 24 * 3600
+DEFAULT_TOKEN_VERSION_CACHE_TTL = 30
+DEFAULT_STREAM_TOKEN_TTL = 3600
+
+# Per-worker token_version cache, used when Redis is not configured
+_token_versions = {}
 
 def hash_password(password):
     return generate_password_hash(password)
@@ -36,11 +46,110 @@ def validate_password_strength(password):
     
     return True, "Password is strong"
 
+def token_claims(user, cart_id):
+    """Access token claims trusted by the cart and admin routes instead of a lookup."""
+    return {'cart_id': cart_id, 'is_admin': bool(user.is_admin), 'tv': user.token_version or 0}
+
 def generate_tokens(identity, additional_claims=None):
     access_token = create_access_token(identity=identity, additional_claims=additional_claims)
-    refresh_token = create_refresh_token(identity=identity)
+    refresh_claims = {'tv': additional_claims['tv']} if additional_claims and 'tv' in additional_claims else None
+    refresh_token = create_refresh_token(identity=identity, additional_claims=refresh_claims)
     return access_token, refresh_token
 
+def claimed_cart_id(user_id):
+    """cart_id claim of the current request's token, if the token is user_id's."""
+    if not has_request_context():
+        return None
+    try:
+        claims = get_jwt()
+    except RuntimeError:
+        return None
+    return claims.get('cart_id') if claims.get('sub') == user_id else None
+
+# --- Token versions ---
+def token_version_key(user_id):
+    return f"token_version:{user_id}"
+
+def current_token_version(user_id):
+    """
+    The user's token_version (None if the user no longer exists). Read from
+    Redis when configured, else from a per-worker cache that is refreshed
+    every TOKEN_VERSION_CACHE_TTL seconds, so checking a token does not
+    query the database on every request.
+    """
+    if redis_client is not None:
+        try:
+            value = redis_client.get(token_version_key(user_id))
+            if value is not None:
+                return int(value)
+        except Exception as e:
+            current_app.logger.warning(f"Token version read error: {str(e)}")
+    else:
+        cached = _token_versions.get(user_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+    from app.models import User
+    version = db.session.query(User.token_version).filter_by(id=user_id).scalar()
+    if version is not None:
+        cache_token_version(user_id, version, overwrite=False)
+    return version
+
+def cache_token_version(user_id, version, overwrite=True):
+    if redis_client is not None:
+        try:
+            # A reader caching what it read from the database must not
+            # overwrite a newer version written by revoke_tokens
+            redis_client.set(token_version_key(user_id), version, ex=TOKEN_VERSION_REDIS_TTL, nx=not overwrite)
+        except Exception as e:
+            current_app.logger.warning(f"Token version write error: {str(e)}")
+    else:
+        ttl = current_app.config.get('TOKEN_VERSION_CACHE_TTL', DEFAULT_TOKEN_VERSION_CACHE_TTL)
+        _token_versions[user_id] = (version, time.monotonic() + ttl)
+
+def revoke_tokens(user):
+    """
+    Invalidate every token issued to `user` so far (admin demotion,
+    deactivation). Without Redis other workers notice within
+    TOKEN_VERSION_CACHE_TTL seconds.
+    """
+    from app.models import User
+    user.token_version = User.token_version + 1
+    db.session.commit()
+    cache_token_version(user.id, user.token_version)
+
+# --- Stream tokens ---
+def _stream_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='order-events')
+
+def stream_token(user_id, order_id, token_version):
+    """
+    Token for one order's event stream, for clients that can only put it in
+    the URL (EventSource). It grants nothing else, so an access log that
+    records it does not leak an access token.
+    """
+    return _stream_serializer().dumps({'sub': user_id, 'order_id': order_id, 'tv': token_version})
+
+def load_stream_token(token, order_id):
+    """The user id of a valid stream token for `order_id`, else None."""
+    ttl = current_app.config.get('SSE_TOKEN_TTL', DEFAULT_STREAM_TOKEN_TTL)
+    try:
+        claims = _stream_serializer().loads(token, max_age=ttl)
+    except BadSignature:
+        return None
+    if not isinstance(claims, dict) or claims.get('order_id') != order_id:
+        return None
+    version = current_token_version(claims.get('sub'))
+    if version is None or claims.get('tv', 0) < version:
+        return None
+    return claims['sub']
+
+def register_token_checks(jwt):
+    @jwt.token_in_blocklist_loader
+    def token_revoked(jwt_header, jwt_payload):
+        version = current_token_version(jwt_payload['sub'])
+        return version is None or jwt_payload.get('tv', 0) < version
+
 def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
@@ -54,11 +163,17 @@ def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
-            user_id = get_jwt_identity()
-            from app.models import User
-            user = User.query.get(user_id)
+            # The is_admin claim is trusted: demotion revokes the token
+            claims = get_jwt()
+            if 'is_admin' in claims:
+                is_admin = claims['is_admin']
+            else:
+                # Tokens issued before the claim existed
+                from app.models import User
+                user = User.query.get(get_jwt_identity())
+                is_admin = bool(user and user.is_admin)
             
-            if not user or not user.is_admin:
+            if not is_admin:
                 return jsonify({'error': 'Admin access required'}), 403
                 
             return f(*args, **kwargs)
@@ -0,0 +1,193 @@
+from operator import attrgetter
+from flask import request
+from sqlalchemy.orm import selectinload
+
+MAX_FIELD_PLANS = 64
+
+def requested_fields():
+    """Top-level fields asked for with ?fields=a,b (None for all)."""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+class Serializer:
+    """
+    Precompiled field plan for one model: an ordered list of (key, getter)
+    pairs evaluated in a single dict comprehension per object. Plain
+    attributes use operator.attrgetter, so no per-field Python function
+    call is made for them.
+
+    Datetimes are left as datetime objects; the app's JSON provider writes
+    them as ISO 8601. Sparse fieldsets (`fields`) keep `id` plus the named
+    top-level keys; trimmed plans are cached per field set.
+
+    Relationships walked by `nested`/`nested_many` fields are known to the
+    plan, so `load_options` gives the eager loads a query needs to
+    serialize its rows without lazy loads.
+    """
+
+    def __init__(self, *fields, **computed):
+        self.plan = [(field, attrgetter(field)) for field in fields] + list(computed.items())
+        self.names = {name for name, _ in self.plan}
+        self._subsets = {}
+
+    def extend(self, *fields, **computed):
+        serializer = Serializer()
+        serializer.plan = self.plan + Serializer(*fields, **computed).plan
+        serializer.names = {name for name, _ in serializer.plan}
+        return serializer
+
+    def only(self, fields=None):
+        if not fields:
+            return self.plan
+        key = frozenset(fields) & self.names
+        plan = self._subsets.get(key)
+        if plan is None:
+            if len(self._subsets) >= MAX_FIELD_PLANS:
+                self._subsets.clear()
+            plan = self._subsets[key] = [
+                (name, getter) for name, getter in self.plan if name in key or name == 'id'
+            ]
+        return plan
+
+    def load_options(self, model, fields=None):
+        """selectinload() for every relationship the (trimmed) plan serializes."""
+        return [
+            selectinload(getattr(model, getter.relationship))
+            for _, getter in self.only(fields) if hasattr(getter, 'relationship')
+        ]
+
+    def __call__(self, obj, fields=None):
+        return {name: getter(obj) for name, getter in self.only(fields)}
+
+    def many(self, objs, fields=None):
+        plan = self.only(fields)
+        return [{name: getter(obj) for name, getter in plan} for obj in objs]
+
+# --- Field getters ---
+def number(attr):
+    """Decimal column as a float (None stays None)."""
+    get = attrgetter(attr)
+    def getter(obj):
+        value = get(obj)
+        return float(value) if value is not None else None
+    return getter
+
+def or_empty(attr, empty):
+    """JSON column, with `empty` ([] or {}) in place of NULL."""
+    get = attrgetter(attr)
+    return lambda obj: get(obj) or empty
+
+def nested(attr, serializer):
+    get = attrgetter(attr)
+    def getter(obj):
+        value = get(obj)
+        return serializer(value) if value is not None else None
+    getter.relationship = attr
+    return getter
+
+def nested_many(attr, serializer):
+    get = attrgetter(attr)
+    def getter(obj):
+        return serializer.many(get(obj))
+    getter.relationship = attr
+    return getter
+
+# --- Catalog ---
+category_to_dict = Serializer(
+    'id', 'name', 'description', 'image_url', 'product_count', 'active_product_count'
+)
+
+admin_category_to_dict = Serializer(
+    'id', 'name', 'description', 'image_url', 'is_active', 'sort_order',
+    'product_count', 'active_product_count', 'created_at'
+)
+
+product_to_dict = Serializer(
+    'id', 'name', 'description', 'quantity', 'sku', 'is_featured', 'created_at',
+    price=number('price'),
+    compare_price=number('compare_price'),
+    images=or_empty('images', []),
+    tags=or_empty('tags', []),
+    specifications=or_empty('specifications', {}),
+    category=nested('category', category_to_dict),
+    rating=attrgetter('rating_summary')
+)
+
+admin_product_to_dict = Serializer(
+    'id', 'name', 'description', 'quantity', 'low_stock_threshold', 'category_id',
+    'brand', 'is_featured', 'is_active', 'flash_sale', 'sku', 'barcode', 'created_at', 'updated_at',
+    price=number('price'),
+    compare_price=number('compare_price'),
+    cost_price=number('cost_price'),
+    tags=or_empty('tags', []),
+    images=or_empty('images', []),
+    specifications=or_empty('specifications', {})
+)
+
+# --- Users and reviews ---
+user_to_dict = Serializer(
+    'id', 'email', 'first_name', 'last_name', 'phone', 'is_active', 'is_admin',
+    'email_verified', 'last_login', 'created_at'
+)
+
+review_to_dict = Serializer(
+    'id', 'product_id', 'rating', 'title', 'comment', 'is_verified', 'created_at'
+)
+
+review_with_user_to_dict = review_to_dict.extend(
+    user=nested('user', Serializer('id', 'first_name', 'last_name'))
+)
+
+# --- Cart ---
+def _cart_item_image(cart_item):
+    images = cart_item.product.images
+    return images[0] if images else None
+
+cart_item_to_dict = Serializer(
+    'id', 'product_id', 'quantity',
+    product_name=attrgetter('product.name'),
+    product_image=_cart_item_image,
+    price=number('price'),
+    total=lambda cart_item: float(cart_item.price) * cart_item.quantity
+)
+
+# --- Orders ---
+order_item_to_dict = Serializer(
+    'id', 'product_id', 'product_name', 'quantity',
+    product_price=number('product_price'),
+    total_price=number('total_price')
+)
+
+payment_to_dict = Serializer(
+    'id', 'payment_method', 'status', 'gateway_transaction_id', 'created_at',
+    amount=number('amount')
+)
+
+order_to_dict = Serializer(
+    'id', 'order_number', 'status', 'currency', 'payment_method', 'payment_status',
+    'shipping_address', 'created_at', 'updated_at',
+    subtotal=number('subtotal'),
+    tax_amount=number('tax_amount'),
+    shipping_amount=number('shipping_amount'),
+    total_amount=number('total_amount')
+)
+
+order_detail_to_dict = order_to_dict.extend(
+    items=nested_many('items', order_item_to_dict),
+    payments=nested_many('payments', payment_to_dict)
+)
+
+admin_order_to_dict = Serializer(
+    'id', 'order_number', 'status', 'payment_method', 'payment_status', 'shipping_address',
+    'tracking_number', 'shipping_method', 'estimated_delivery', 'created_at',
+    subtotal=number('subtotal'),
+    tax_amount=number('tax_amount'),
+    shipping_amount=number('shipping_amount'),
+    total_amount=number('total_amount')
+)
+
+admin_order_with_user_to_dict = admin_order_to_dict.extend(
+    user=nested('user', Serializer('id', 'email', 'first_name', 'last_name', 'phone'))
+)
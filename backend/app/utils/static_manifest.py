@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from datetime import datetime
+from flask import current_app
+from app.utils.compression import COMPRESSIBLE_TYPES, negotiate_encoding, brotli
+from app.utils.http_cache import is_not_modified
+
+# Files named like app.3f9a1c2e.js change name whenever their content does
+FINGERPRINTED = re.compile(r'[.-][0-9a-f]{8,}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+MIN_COMPRESS_SIZE = 500
+
+class StaticAsset:
+    __slots__ = ('body', 'mimetype', 'etag', 'last_modified', 'cache_control', 'variants')
+
+    def __init__(self, body, mimetype, etag, last_modified, cache_control, variants):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+        self.variants = variants
+
+class StaticManifest:
+    """
+    The frontend folder loaded into memory at startup: each file with its
+    content hash (the ETag), mimetype and gzip/brotli variants computed
+    once at maximum compression. Fingerprinted files are served as
+    immutable; everything else revalidates. Serving never touches the
+    filesystem, so restart the app to pick up frontend changes.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.assets = {}
+        if os.path.isdir(folder):
+            self.build()
+
+    def build(self):
+        assets = {}
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, self.folder).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    body = f.read()
+                assets[path] = self.load_asset(path, body, os.path.getmtime(full_path))
+        self.assets = assets
+
+    @staticmethod
+    def load_asset(path, body, mtime):
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        variants = {}
+        if mimetype.startswith(COMPRESSIBLE_TYPES) and len(body) >= MIN_COMPRESS_SIZE:
+            variants['gzip'] = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                variants['br'] = brotli.compress(body, quality=11)
+            variants = {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+        return StaticAsset(
+            body=body,
+            mimetype=mimetype,
+            etag=hashlib.sha1(body).hexdigest(),
+            last_modified=datetime.utcfromtimestamp(int(mtime)),
+            cache_control=IMMUTABLE_CACHE_CONTROL if FINGERPRINTED.search(path) else REVALIDATE_CACHE_CONTROL,
+            variants=variants
+        )
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def response(self, asset):
+        encoding = negotiate_encoding() if asset.variants else None
+        if encoding not in asset.variants:
+            encoding = None
+
+        if is_not_modified(asset.etag, asset.last_modified):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(
+                asset.variants[encoding] if encoding else asset.body, mimetype=asset.mimetype
+            )
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(f"{asset.etag}-{encoding}" if encoding else asset.etag)
+        response.last_modified = asset.last_modified
+        response.headers['Cache-Control'] = asset.cache_control
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        return response
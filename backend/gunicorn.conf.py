@@ -5,9 +5,10 @@ import os
 bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
 backlog = 2048
 
-# Worker processes
+# Worker processes: gevent so idle connections (order event streams) cost
+# a greenlet, not a worker; GUNICORN_WORKER_CLASS=sync to opt out
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
 worker_connections = 1000
 timeout = 300
 keepalive = 2
@@ -28,6 +29,33 @@ user = None
 group = None
 tmp_upload_dir = None
 
+# Server hooks
+def post_fork(server, worker):
+    """Make psycopg2 yield to other greenlets while it waits on Postgres."""
+    if server.cfg.worker_class_str == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+def post_worker_init(worker):
+    """Build the in-memory catalog indexes before the worker takes traffic."""
+    from app.services.facet_service import facet_index
+    from app.services.suggest_service import suggest_index
+    try:
+        with worker.wsgi.app_context():
+            facet_index.ensure_fresh()
+            suggest_index.ensure_fresh()
+    except Exception as e:
+        worker.log.error(f"Catalog index warm-up failed: {str(e)}")
+
+def worker_exit(server, worker):
+    """Write back carts still waiting for the write-behind flusher."""
+    from app.services.cart_store import get_cart_store
+    try:
+        with worker.wsgi.app_context():
+            get_cart_store().flush_all()
+    except Exception as e:
+        worker.log.error(f"Cart flush on exit failed: {str(e)}")
+
 # SSL (uncomment if using SSL)
 # keyfile = '/path/to/your/ssl/keyfile'
 # certfile = '/path/to/your/ssl/certfile'
\ No newline at end of file
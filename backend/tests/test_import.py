@@ -0,0 +1,120 @@
+import io
+import json
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app, db
+from app.models import Category, Product, User
+from app.routes.admin import admin_bp
+from app.services.import_service import ProductImportService
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app()
+    app.config['TESTING'] = True
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    with app.app_context():
+        db.create_all()
+        category = Category(name='Phones')
+        db.session.add(category)
+        db.session.flush()
+        db.session.add(Product(name='Existing', sku='OLD', price=10, quantity=5, category_id=category.id))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def admin_headers(app):
+    with app.app_context():
+        user = User(email='admin@example.com', password_hash='x', first_name='First', last_name='Last', is_admin=True)
+        db.session.add(user)
+        db.session.commit()
+        return {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+
+
+def import_csv(app, text, chunk_size=500):
+    with app.app_context():
+        return ProductImportService.import_rows(
+            ProductImportService.read_rows(io.BytesIO(text.encode()), 'csv'), chunk_size=chunk_size
+        )
+
+
+def test_import_creates_and_updates_by_sku(app):
+    report = import_csv(app, (
+        'sku,name,price,quantity,category\n'
+        'NEW1,Phone A,100,3,Phones\n'
+        'OLD,,,7,\n'
+        'NEW2,Phone B,200,0,Phones\n'
+    ), chunk_size=2)
+
+    assert report['processed'] == 3
+    assert (report['created'], report['updated'], report['failed']) == (2, 1, 0)
+    with app.app_context():
+        existing = Product.query.filter_by(sku='OLD').one()
+        assert (existing.name, existing.quantity) == ('Existing', 7)
+        assert Product.query.filter_by(sku='NEW2').one().price == 200
+
+
+@pytest.mark.parametrize('values, error', [
+    ('Phone,10,-1,Phones', 'quantity cannot be negative'),
+    ('Phone,10,2.5,Phones', 'quantity must be an integer'),
+    ('Phone,10,two,Phones', 'quantity must be an integer'),
+    ('Phone,-10,1,Phones', 'price cannot be negative'),
+    ('Phone,NaN,1,Phones', 'price must be a number'),
+    ('Phone,10,1,Tablets', 'Unknown category: Tablets'),
+    ('Phone,,1,Phones', 'price required for new products'),
+])
+def test_import_reports_row_errors(app, values, error):
+    report = import_csv(app, f'sku,name,price,quantity,category\nBAD,{values}\nGOOD,Phone,10,1,Phones\n')
+
+    assert (report['created'], report['failed']) == (1, 1)
+    assert report['errors'] == [{'line': 2, 'sku': 'BAD', 'error': error}]
+    with app.app_context():
+        assert Product.query.filter_by(sku='BAD').first() is None
+
+
+def test_import_accepts_integral_json_numbers(app):
+    lines = [
+        {'sku': 'A', 'name': 'A', 'price': 1, 'quantity': 4.0, 'category': 'Phones'},
+        {'sku': 'B', 'name': 'B', 'price': 1, 'quantity': 4.5, 'category': 'Phones'},
+        {'sku': 'C', 'name': 'C', 'price': 1, 'quantity': True, 'category': 'Phones'},
+    ]
+    with app.app_context():
+        report = ProductImportService.import_rows(ProductImportService.read_rows(
+            io.BytesIO('\n'.join(json.dumps(line) for line in lines).encode()), 'jsonl'
+        ))
+        assert Product.query.filter_by(sku='A').one().quantity == 4
+
+    assert report['created'] == 1
+    assert [error['sku'] for error in report['errors']] == ['B', 'C']
+
+
+def test_import_truncates_error_list(app):
+    rows = ''.join(f'BAD{i},Phone,10,-1,Phones\n' for i in range(5))
+    with app.app_context():
+        report = ProductImportService.import_rows(ProductImportService.read_rows(
+            io.BytesIO(('sku,name,price,quantity,category\n' + rows).encode()), 'csv'
+        ), max_errors=2)
+
+    assert report['failed'] == 5
+    assert len(report['errors']) == 2
+    assert report['errors_truncated'] is True
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1])
+def test_import_rejects_chunk_size_below_one(app, admin_headers, chunk_size):
+    with pytest.raises(ValueError):
+        import_csv(app, 'sku,name,price,quantity,category\n', chunk_size=chunk_size)
+
+    response = app.test_client().post(
+        f'/api/admin/products/import?chunk_size={chunk_size}',
+        data=b'sku,name,price,quantity,category\nNEW,Phone,10,1,Phones\n',
+        headers={**admin_headers, 'Content-Type': 'text/csv'}
+    )
+    assert response.status_code == 400
+    with app.app_context():
+        assert Product.query.filter_by(sku='NEW').first() is None
@@ -0,0 +1,167 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Category, Order, OrderItem, Payment, Product, User
+from app.routes.admin import admin_bp
+from app.routes.cart import cart_bp
+from app.routes.orders import orders_bp
+from app.routes.products import products_bp
+
+PRODUCTS = 40
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    app = create_app()
+    app.config['TESTING'] = True
+    app.config['CART_STORE'] = 'database'
+    for blueprint, prefix in [(products_bp, 'products'), (cart_bp, 'cart'), (orders_bp, 'orders'), (admin_bp, 'admin')]:
+        app.register_blueprint(blueprint, url_prefix=f'/api/{prefix}')
+    with app.app_context():
+        db.create_all()
+        # One category per product, so lazy loads cannot be served from the identity map
+        categories = [Category(name=f'Category {i}') for i in range(PRODUCTS)]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.add_all([
+            Product(
+                name=f'Product {i}', sku=f'SKU{i}', price=10, quantity=100,
+                category_id=categories[i].id, tags=['tag'], images=['a.jpg']
+            )
+            for i in range(PRODUCTS)
+        ])
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+def make_user(email, is_admin=False):
+    user = User(email=email, password_hash='x', first_name='First', last_name='Last', is_admin=is_admin)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def auth_headers(app, user_id):
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+
+def make_order(user, products, number):
+    """A paid order with one line and one payment per product."""
+    order = Order(
+        order_number=f'ORDER{number}', user_id=user.id, status='confirmed', payment_status='paid',
+        subtotal=10 * len(products), total_amount=10 * len(products)
+    )
+    db.session.add(order)
+    db.session.flush()
+    for product in products:
+        db.session.add(OrderItem(
+            order_id=order.id, product_id=product.id, product_name=product.name,
+            product_price=10, quantity=1, total_price=10
+        ))
+        db.session.add(Payment(order_id=order.id, payment_method='mpesa', amount=10, status='paid'))
+    return order
+
+
+def count_queries(app, url, headers=None):
+    """(response, number of SQL statements run while serving `url`)."""
+    client = app.test_client()
+    # Warm the per-process caches (token versions, search and facet indexes) first
+    client.get(url, headers=headers)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return response, len(statements)
+
+
+def test_product_listing_has_no_n_plus_one(app):
+    small, small_count = count_queries(app, '/api/products/?per_page=5')
+    large, large_count = count_queries(app, f'/api/products/?per_page={PRODUCTS}')
+
+    assert small.status_code == 200 and len(small.json['products']) == 5
+    assert large.status_code == 200 and len(large.json['products']) == PRODUCTS
+    assert large_count == small_count
+
+
+def test_product_listing_cursor_mode_has_no_n_plus_one(app):
+    small, small_count = count_queries(app, '/api/products/?per_page=5&cursor=')
+    large, large_count = count_queries(app, f'/api/products/?per_page={PRODUCTS}&cursor=')
+
+    assert small.status_code == 200 and len(small.json['products']) == 5
+    assert large.status_code == 200 and len(large.json['products']) == PRODUCTS
+    assert large_count == small_count
+
+
+def test_cart_has_no_n_plus_one(app):
+    with app.app_context():
+        product_ids = [product.id for product in Product.query.all()]
+        small_user, large_user = make_user('small@example.com').id, make_user('large@example.com').id
+    client = app.test_client()
+    for user_id, count in [(small_user, 2), (large_user, 20)]:
+        headers = auth_headers(app, user_id)
+        for product_id in product_ids[:count]:
+            response = client.post('/api/cart/', json={'product_id': product_id, 'quantity': 1}, headers=headers)
+            assert response.status_code in (200, 201)
+
+    small, small_count = count_queries(app, '/api/cart/', auth_headers(app, small_user))
+    large, large_count = count_queries(app, '/api/cart/', auth_headers(app, large_user))
+
+    assert small.status_code == 200 and len(small.json['items']) == 2
+    assert large.status_code == 200 and len(large.json['items']) == 20
+    assert large_count == small_count
+
+
+def test_orders_have_no_n_plus_one(app):
+    with app.app_context():
+        products = Product.query.all()
+        user = make_user('customer@example.com')
+        small_order = make_order(user, products[:1], 0).id
+        large_order = make_order(user, products[:20], 1).id
+        for number in range(2, 12):
+            make_order(user, products[:3], number)
+        db.session.commit()
+        headers = auth_headers(app, user.id)
+
+    small, small_count = count_queries(app, '/api/orders/?per_page=2', headers)
+    large, large_count = count_queries(app, '/api/orders/?per_page=12', headers)
+    assert small.status_code == 200 and len(small.json['orders']) == 2
+    assert large.status_code == 200 and len(large.json['orders']) == 12
+    assert large_count == small_count
+
+    small, small_count = count_queries(app, f'/api/orders/{small_order}', headers)
+    large, large_count = count_queries(app, f'/api/orders/{large_order}', headers)
+    assert small.status_code == 200 and len(small.json['items']) == 1
+    assert large.status_code == 200 and len(large.json['items']) == 20
+    assert large_count == small_count
+
+
+def test_admin_order_list_has_no_n_plus_one(app):
+    with app.app_context():
+        products = Product.query.all()
+        # One customer per order, so each order's user is a separate load
+        for number in range(12):
+            make_order(make_user(f'customer{number}@example.com'), products[:2], number)
+        db.session.commit()
+        headers = auth_headers(app, make_user('admin@example.com', is_admin=True).id)
+
+    small, small_count = count_queries(app, '/api/admin/orders?per_page=2', headers)
+    large, large_count = count_queries(app, '/api/admin/orders?per_page=12', headers)
+
+    assert small.status_code == 200 and len(small.json['orders']) == 2
+    assert large.status_code == 200 and len(large.json['orders']) == 12
+    assert all(order['user']['email'] for order in large.json['orders'])
+    assert large_count == small_count
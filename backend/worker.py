@@ -0,0 +1,18 @@
+import os
+import signal
+import socket
+import threading
+from app import create_app
+from app.services.job_queue import JobQueue
+
+# Initialize Flask app
+app = create_app()
+
+if __name__ == "__main__":
+    # Finish the job in hand, then exit on SIGTERM (Render deploys) or Ctrl-C
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    with app.app_context():
+        JobQueue.work(f"{socket.gethostname()}:{os.getpid()}", stop)